@@ -0,0 +1,121 @@
+"""
+Configuração de logging da aplicação.
+
+Os logs saem em JSON, uma linha por evento, com o request_id da requisição
+HTTP e o job_id do contrato em processamento (quando houver), lidos de
+contextvars. A escrita em stdout não acontece no event loop: os handlers
+dos loggers apenas enfileiram o registro (QueueHandler) e uma thread
+(QueueListener) formata e escreve.
+
+Variáveis de ambiente:
+    LOG_LEVEL   nível mínimo (DEBUG, INFO, WARNING, ERROR), padrão INFO
+    LOG_FORMAT  json (padrão) ou text, para leitura no terminal em desenvolvimento
+
+Uso:
+    logger = logging.getLogger(__name__)
+    logger.info("PDF gerado", extra={"bytes": size})
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+job_id_var: ContextVar[Optional[str]] = ContextVar("job_id", default=None)
+
+# Atributos padrão do LogRecord; o restante veio de extra={...}
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formata cada registro como um objeto JSON em uma linha"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_") and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legível para desenvolvimento, com os ids no início da linha"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s%(ids)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        ids = [getattr(record, key, None) for key in ("request_id", "job_id")]
+        record.ids = "".join(f" [{value}]" for value in ids if value)
+        return super().format(record)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enfileira o registro com os ids do contexto atual. A mensagem é resolvida
+    aqui (os args podem mudar depois), mas a formatação fica para o listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        if getattr(record, "job_id", None) is None:
+            record.job_id = job_id_var.get()
+        return record
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None) -> None:
+    """Configura o logger raiz (idempotente)"""
+    global _listener
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        _listener.handlers[0].setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(ContextQueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def queue_depth() -> int:
+    """Registros aguardando escrita pelo listener"""
+    return _listener.queue.qsize() if _listener is not None else 0
+
+
+def shutdown_logging() -> None:
+    """Escreve os registros pendentes e para a thread do listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -3,10 +3,22 @@ Aplicação FastAPI para análise e preenchimento de contratos DOCX
 """
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+import logging
 import time
-import traceback
-from app.routers import upload, analyze, fill, download
+import uuid
+from app.config.logging_config import queue_depth, request_id_var, setup_logging
+from app.routers import upload, analyze, fill, download, admin, debug
+from app.services import metrics
+from app.services.loop_monitor import loop_monitor
+from app.services.memory_tracking import memory_tracker
+from app.services.request_profiler import request_profiler
+from app.services.schema_cache import schema_cache
+from app.services.tracing import start_span, tracer
+
+setup_logging()
+logger = logging.getLogger("app.requests")
+metrics.QUEUE_DEPTH.set_function(queue_depth, queue="logging")
 
 app = FastAPI(
     title="Gerador de Contratos LALU",
@@ -34,6 +46,41 @@ app.include_router(upload.router, prefix="/api", tags=["upload"])
 app.include_router(analyze.router, prefix="/api", tags=["Schema"])
 app.include_router(fill.router, prefix="/api", tags=["Contratos"])
 app.include_router(download.router, prefix="/api", tags=["Download"])
+app.include_router(admin.router, prefix="/api", tags=["Admin"])
+app.include_router(debug.router, tags=["Debug"], include_in_schema=False)
+
+
+@app.on_event("startup")
+async def precompute_responses():
+    """Pré-computa as respostas estáticas de /api/schema e /api/templates"""
+    try:
+        schema_cache.warm()
+    except Exception as e:
+        # Não impedir o startup: o schema é recalculado no primeiro acesso
+        logging.getLogger(__name__).warning("Não foi possível pré-computar o schema: %s", e)
+
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    """Monitor de lag do event loop (LOOP_MONITOR=1)"""
+    loop_monitor.start()
+
+
+@app.on_event("startup")
+async def start_memory_tracking():
+    """RSS do processo em /metrics e tracemalloc por fill (MEMORY_TRACKING=1)"""
+    memory_tracker.start()
+
+
+@app.on_event("shutdown")
+async def flush_traces():
+    """Grava os spans pendentes do exportador de tracing"""
+    tracer.shutdown()
+
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    await loop_monitor.stop()
 
 
 @app.get("/")
@@ -50,23 +97,80 @@ async def health_check():
     return {"status": "healthy"}
 
 
-# Middleware para log de requisições
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Métricas no formato texto do Prometheus"""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# Middleware para log de requisições (com X-Request-ID propagado nos logs)
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] {request.method} {request.url.path}")
-    
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    start_time = time.perf_counter()
+    log_extra = {"method": request.method, "path": request.url.path}
+
     try:
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {request.method} {request.url.path} - {response.status_code} - {process_time:.2f}s")
-        return response
-    except Exception as e:
-        process_time = time.time() - start_time
-        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] ERRO em {request.method} {request.url.path} - {process_time:.2f}s")
-        print(f"Erro: {str(e)}")
-        print(traceback.format_exc())
-        return JSONResponse(
-            status_code=500,
-            content={"detail": f"Erro interno: {str(e)}"}
-        )
+        with start_span(
+            f"{request.method} {request.url.path}",
+            traceparent=request.headers.get("traceparent"),
+            request_id=request_id,
+        ) as span:
+            try:
+                response = await call_next(request)
+            except Exception as e:
+                span.record_error(e)
+                duration_ms = round((time.perf_counter() - start_time) * 1000, 1)
+                logger.exception(
+                    "Erro em %s %s",
+                    request.method,
+                    request.url.path,
+                    extra={**log_extra, "status": 500, "duration_ms": duration_ms},
+                )
+                return JSONResponse(
+                    status_code=500,
+                    content={"detail": f"Erro interno: {str(e)}"},
+                    headers={"X-Request-ID": request_id},
+                )
+
+            duration = time.perf_counter() - start_time
+            duration_ms = round(duration * 1000, 1)
+            # Rota com parâmetros ({document_id}) para não explodir a cardinalidade
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            metrics.HTTP_REQUEST_SECONDS.observe(
+                duration,
+                method=request.method,
+                route=route,
+                status=str(response.status_code),
+            )
+            logger.info(
+                "%s %s - %s",
+                request.method,
+                request.url.path,
+                response.status_code,
+                extra={**log_extra, "status": response.status_code, "duration_ms": duration_ms},
+            )
+            span.set_attributes(route=route, status=response.status_code)
+            response.headers["X-Request-ID"] = request_id
+            if span.traceparent:
+                response.headers["traceparent"] = span.traceparent
+            return response
+    finally:
+        request_id_var.reset(token)
+
+
+# Profiling sob demanda (X-Profile); registrado só com PROFILING_ENABLED=1.
+# Adicionado depois de log_requests, fica por fora dele e mede a requisição inteira.
+async def profile_requests(request: Request, call_next):
+    mode = request_profiler.requested_mode(request)
+    if mode is None:
+        return await call_next(request)
+    response, path = await request_profiler.run(request, call_next, mode)
+    if path is not None:
+        response.headers["X-Profile-Id"] = path.name
+    return response
+
+
+if request_profiler.enabled:
+    app.middleware("http")(profile_requests)
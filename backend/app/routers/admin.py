@@ -0,0 +1,40 @@
+"""
+Rotas administrativas (manutenção de caches)
+
+Protegidas pelo cabeçalho X-Admin-Token, comparado com ADMIN_TOKEN.
+Sem ADMIN_TOKEN configurado, as rotas ficam desabilitadas.
+"""
+import hmac
+import logging
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from app.services.analysis_cache import analysis_cache
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Token de administração inválido")
+
+
+@router.get("/admin/analysis-cache", dependencies=[Depends(require_admin)])
+async def analysis_cache_stats():
+    """Quantidade e tamanho das análises de IA em cache"""
+    return analysis_cache.stats()
+
+
+@router.delete("/admin/analysis-cache", dependencies=[Depends(require_admin)])
+async def purge_analysis_cache():
+    """Remove todas as análises de IA em cache"""
+    removed = analysis_cache.purge()
+    logger.info("Cache de análises limpo: %d entrada(s) removida(s)", removed)
+    return {"removed": removed}
@@ -1,64 +1,34 @@
 """
 Rota para análise de documentos e extração de campos
 """
+import logging
 import os
-import traceback
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional
 from app.services.document_parser import DocumentParser
 from app.services.document_storage import DocumentStorage
-from app.services.template_service import TemplateService
+from app.services.schema_cache import schema_cache
 from app.services.contract_schema import ROTA_DO_SOL_SCHEMA, SECTION_ORDER, get_all_field_ids
 from app.models.schemas import AnalysisResponse, FieldInfo, FieldType, SectionInfo
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 parser = DocumentParser()
 storage = DocumentStorage()
 
 
 @router.get("/schema")
-async def get_contract_schema(template_id: Optional[str] = "rota_do_sol"):
+async def get_contract_schema(request: Request, template_id: Optional[str] = "rota_do_sol"):
     """
     Retorna o schema do formulário para o template especificado.
     Não precisa mais de upload - usa template hospedado.
+
+    A resposta é pré-computada por template (ETag, 304 e corpo gzip/br).
     """
     try:
-        # Verificar se o template existe
-        template_path = TemplateService.get_template_path(template_id)
-        
-        # Montar resposta com schema do formulário
-        fields = []
-        for section_id, section_name in SECTION_ORDER:
-            section_fields = [
-                FieldInfo(
-                    field_id=f.field_id,
-                    label=f.label,
-                    type=FieldType(f.type.value),
-                    required=f.required,
-                    original_text=f'{{{{{f.field_id}}}}}',  # Placeholder formatado
-                    context="",  # Não precisa mais de contexto
-                    placeholder=f.placeholder if f.placeholder else None,  # Garantir que None seja None, não string vazia
-                    section=section_name,
-                    section_id=section_id,
-                    options=f.options,
-                    mask=f.mask
-                )
-                for f in ROTA_DO_SOL_SCHEMA.values()
-                if f.section == section_id
-            ]
-            fields.extend(section_fields)
-        
-        sections_list = [SectionInfo(id=section_id, name=section_name) for section_id, section_name in SECTION_ORDER]
-        
-        return {
-            "template_id": template_id,
-            "template_name": TemplateService.AVAILABLE_TEMPLATES[template_id]["name"],
-            "fields": fields,
-            "sections": sections_list,
-            "total_fields": len(fields)
-        }
-    
+        return schema_cache.get_schema(template_id).to_response(request)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except FileNotFoundError as e:
@@ -66,12 +36,9 @@ async def get_contract_schema(template_id: Optional[str] = "rota_do_sol"):
 
 
 @router.get("/templates")
-async def list_templates():
+async def list_templates(request: Request):
     """Lista todos os templates disponíveis"""
-    return {
-        "templates": TemplateService.list_templates(),
-        "default": TemplateService.get_default_template_id()
-    }
+    return schema_cache.get_templates().to_response(request)
 
 
 class AnalyzeRequest(BaseModel):
@@ -95,20 +62,19 @@ async def analyze_document(request: AnalyzeRequest):
                 detail="Documento não encontrado"
             )
         
-        print(f"Iniciando análise do documento: {request.document_id}")
+        logger.info("Iniciando análise do documento: %s", request.document_id)
         
-        # Extrair texto e placeholders
-        text = parser.extract_text(file_path)
-        placeholders = parser.find_placeholders(text)
+        # Varrer placeholders direto no XML (inclui cabeçalhos, rodapés e caixas de texto)
+        placeholders = parser.scan_placeholders(file_path)
         
-        print(f"Placeholders encontrados: {len(placeholders)}")
+        logger.debug("Placeholders encontrados: %d", len(placeholders))
         
         # Validar placeholders
         validation = parser.validate_placeholders(placeholders, get_all_field_ids())
         
         if not validation["valid"]:
-            print(f"AVISO: Placeholders faltando: {validation['missing']}")
-            print(f"AVISO: Placeholders extras: {validation['extra']}")
+            logger.warning("Placeholders faltando: %s", validation["missing"])
+            logger.warning("Placeholders extras: %s", validation["extra"])
         
         # Montar resposta com schema do formulário
         fields = []
@@ -132,7 +98,7 @@ async def analyze_document(request: AnalyzeRequest):
         
         sections_list = [SectionInfo(id=section_id, name=section_name) for section_id, section_name in SECTION_ORDER]
         
-        print(f"Análise completa: {len(fields)} campos identificados")
+        logger.info("Análise completa: %d campos identificados", len(fields))
         
         return AnalysisResponse(
             document_id=request.document_id,
@@ -143,10 +109,8 @@ async def analyze_document(request: AnalyzeRequest):
     except HTTPException:
         raise
     except Exception as e:
-        # Log detalhado do erro
-        error_trace = traceback.format_exc()
-        print(f"Erro ao analisar documento: {str(e)}")
-        print(f"Traceback: {error_trace}")
+        # Log detalhado do erro (com traceback)
+        logger.exception("Erro ao analisar documento: %s", e)
         
         raise HTTPException(
             status_code=500,
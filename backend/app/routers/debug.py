@@ -0,0 +1,63 @@
+"""
+Rotas de diagnóstico (perfis de requisições, bloqueios do event loop, memória)
+
+Protegidas como as rotas administrativas (X-Admin-Token) e disponíveis só
+com o recurso correspondente ligado (PROFILING_ENABLED=1, LOOP_MONITOR=1,
+MEMORY_TRACKING=1); caso contrário respondem 404.
+"""
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+
+from app.routers.admin import require_admin
+from app.services.loop_monitor import loop_monitor
+from app.services.memory_tracking import memory_tracker
+from app.services.request_profiler import request_profiler
+
+router = APIRouter()
+
+
+def require_profiling():
+    if not request_profiler.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get("/debug/profiles", dependencies=[Depends(require_profiling), Depends(require_admin)])
+async def list_profiles(limit: int = Query(20, ge=1, le=200)):
+    """Perfis capturados mais recentes (X-Profile: 1 ou ?profile=1 em qualquer rota)"""
+    return {"profiles": request_profiler.list_profiles(limit)}
+
+
+@router.get("/debug/profiles/{name}", dependencies=[Depends(require_profiling), Depends(require_admin)])
+async def download_profile(name: str):
+    """Download de um perfil (.pstats ou .speedscope.json)"""
+    path = request_profiler.get_profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return FileResponse(path, filename=path.name, media_type="application/octet-stream")
+
+
+def require_loop_monitor():
+    if not loop_monitor.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get("/debug/loop-blocks", dependencies=[Depends(require_loop_monitor), Depends(require_admin)])
+async def loop_blocks(limit: int = Query(20, ge=1, le=200)):
+    """Lag recente do event loop e pilhas dos últimos bloqueios (mais recentes primeiro)"""
+    return loop_monitor.snapshot(limit)
+
+
+def require_memory_tracking():
+    if not memory_tracker.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get("/debug/memory", dependencies=[Depends(require_memory_tracking), Depends(require_admin)])
+async def memory_snapshot(limit: int = Query(25, ge=1, le=200)):
+    """Snapshot do tracemalloc: linhas que mais retêm memória Python agora"""
+    snapshot = await asyncio.to_thread(memory_tracker.snapshot, limit)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="tracemalloc desligado")
+    return snapshot
@@ -1,25 +1,45 @@
 """
 Rota para download de documentos preenchidos
 """
-import os
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, Query, Request
 from pathlib import Path
+from app.services.contract_records import ContractRecordStore
+from app.services.contract_renderer import ContractRenderer
 from app.services.document_storage import DocumentStorage
+from app.services.http_cache import cached_stream_response
+from app.services.tracing import start_span
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 storage = DocumentStorage()
+renderer = ContractRenderer(storage=storage, record_store=ContractRecordStore())
 
 
 @router.get("/download/{document_id}")
 async def download_document(
+    request: Request,
     document_id: str,
     fmt: str = Query("pdf", alias="format", description="pdf ou docx"),
 ):
     """
     Download do contrato preenchido em PDF (padrão) ou Word (.docx).
     Ex.: /api/download/UUID_quadro_resumo?format=docx
+
+    Suporta If-None-Match (304) e Range (206) para downloads retomados.
     """
+    with start_span("download_document", document_id=document_id, format=fmt) as span:
+        response = await _download_document(request, document_id, fmt)
+        span.set_attributes(
+            status=response.status_code,
+            bytes=int(response.headers.get("content-length", 0)),
+        )
+        return response
+
+
+async def _download_document(request: Request, document_id: str, fmt: str):
     try:
         fmt = (fmt or "pdf").lower().strip()
         if fmt not in ("pdf", "docx"):
@@ -33,33 +53,47 @@ async def download_document(
             "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
         )
 
-        file_path = storage.get_filled_file_path(document_id, file_format=fmt)
+        base_id = document_id
+        for suffix in (".pdf", ".docx"):
+            if base_id.endswith(suffix):
+                base_id = base_id[: -len(suffix)]
+        filename_key = f"{base_id}{ext}"
+        # A interface de armazenamento é síncrona (no S3, cada chamada é uma
+        # requisição boto3): rodar fora do event loop
+        obj = await asyncio.to_thread(storage.stat_output, filename_key)
         
-        print(f"[DOWNLOAD] document_id recebido: {document_id}", flush=True)
-        print(f"[DOWNLOAD] format: {fmt}, caminho: {file_path}", flush=True)
-        print(f"[DOWNLOAD] Arquivo existe: {os.path.exists(file_path)}", flush=True)
+        logger.debug(
+            "Download de %s (%s): existe=%s",
+            storage.output_key(filename_key),
+            fmt,
+            obj is not None,
+        )
         
-        if not Path(file_path).exists():
-            output_dir = storage.output_dir
-            if output_dir.exists():
-                matching_files = list(output_dir.glob(f"{document_id}*{ext}"))
-                if matching_files:
-                    file_path = str(matching_files[0])
-                    print(f"[DOWNLOAD] Arquivo encontrado por padrão: {file_path}", flush=True)
-                else:
-                    available = list(output_dir.glob(f"*{ext}"))
-                    print(f"[DOWNLOAD] Arquivos {ext} no output: {[f.name for f in available]}", flush=True)
-                    raise HTTPException(
-                        status_code=404,
-                        detail=(
-                            f"Documento não encontrado. Procurado: {file_path}. "
-                            f"Arquivos disponíveis: {[f.name for f in available]}"
-                        ),
-                    )
+        if obj is None:
+            # Artefato removido do output: re-renderizar a partir do registro do contrato
+            try:
+                if await renderer.rerender_from_record(base_id):
+                    logger.info("Documento re-renderizado a partir do registro: %s", document_id)
+                    obj = await asyncio.to_thread(storage.stat_output, filename_key)
+            except Exception as e:
+                logger.warning("Falha ao re-renderizar %s: %s", document_id, e)
+
+        if obj is None:
+            matching = await asyncio.to_thread(storage.list_outputs, base_id, ext)
+            if matching:
+                obj = matching[0]
+                filename_key = Path(obj.key).name
+                logger.debug("Arquivo encontrado por padrão: %s", obj.key)
             else:
+                others = await asyncio.to_thread(storage.list_outputs, ext=ext)
+                available = [Path(o.key).name for o in others]
+                logger.info("Documento não encontrado: %s (%d arquivo(s) %s no output)", filename_key, len(available), ext)
                 raise HTTPException(
                     status_code=404,
-                    detail=f"Diretório de output não existe: {output_dir}"
+                    detail=(
+                        f"Documento não encontrado. Procurado: {filename_key}. "
+                        f"Arquivos disponíveis: {available}"
+                    ),
                 )
         
         label = "contrato"
@@ -67,17 +101,24 @@ async def download_document(
             label = "condicoes_gerais"
         filename = f"{label}_{document_id[:8]}{ext}"
         
-        return FileResponse(
-            path=file_path,
+        # Transmitir direto do backend de armazenamento, em blocos, com ETag
+        # do conteúdo, revalidação (304) e Range para downloads retomados.
+        # iter_output é um gerador síncrono: o StreamingResponse o consome no
+        # threadpool, então a leitura do backend não bloqueia o event loop
+        return cached_stream_response(
+            request,
+            size=obj.size,
+            content_hash=obj.etag,
+            iter_bytes=lambda start, end: storage.iter_output(filename_key, start, end),
             media_type=media_type,
-            filename=filename,
             headers={
-                "Content-Disposition": f'attachment; filename="{filename}"'
-            }
+                "Content-Disposition": f'attachment; filename="{filename}"',
+            },
         )
     except HTTPException:
         raise
     except Exception as e:
+        logger.exception("Erro ao gerar download de %s", document_id)
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao gerar download: {str(e)}"
@@ -4,30 +4,151 @@ Rota para preencher documentos de contrato e gerar PDF final.
 Agora suporta múltiplos documentos (ex: Quadro Resumo + Condições Gerais),
 mesclando tudo em um único PDF para download.
 """
+import asyncio
+import logging
 import os
-import shutil
 import uuid
 from typing import Dict, Any, Optional, List
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
-from app.config.parties import STATIC_PARTIES
+from app.config.logging_config import job_id_var
+from app.services.contract_records import ContractRecord, ContractRecordStore
+from app.services.contract_renderer import ContractRenderer, build_fields_to_fill, sanitize_user_fields
 from app.services.document_filler import DocumentFiller
 from app.services.document_storage import DocumentStorage
+from app.services.memory_tracking import memory_tracker
+from app.services.field_validator import FieldValidationError
+from app.services.metrics import FILL_STAGE_SECONDS, IN_PROGRESS, UNRESOLVED_PLACEHOLDERS
+from app.services.tracing import start_span
 from app.services.template_service import TemplateService
 from app.services.pdf_generator import PDFGenerator
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 filler = DocumentFiller()
 storage = DocumentStorage()
 pdf_generator = PDFGenerator()
+record_store = ContractRecordStore()
+renderer = ContractRenderer(filler, storage, pdf_generator, record_store)
+
+# Limite de disco para PDFs/DOCX no output (0 = sem limite). Acima dele, os
+# artefatos mais antigos que ainda podem ser re-renderizados (registro salvo
+# com a versão atual do template) são removidos e re-renderizados sob
+# demanda no download.
+OUTPUT_MAX_BYTES = int(float(os.getenv("OUTPUT_MAX_MB", "0")) * 1024 * 1024)
+
+# Rejeitar (422) preenchimentos que deixariam placeholders {{CAMPO}} sem valor,
+# quando a requisição não informar reject_unresolved
+FILL_REJECT_UNRESOLVED = os.getenv("FILL_REJECT_UNRESOLVED", "").lower() in ("1", "true", "yes")
+
+
+def can_rerender(download_id: str, records: Dict[str, Optional[ContractRecord]]) -> bool:
+    """
+    Indica se o artefato pode ser recriado por rerender_from_record: precisa
+    do registro e da mesma versão do template (o registro só guarda a versão
+    atual; removido depois de uma mudança no template, o arquivo se perderia).
+
+    records guarda os registros já lidos (document_id -> registro), para ler
+    cada registro uma vez por limpeza, e não uma por PDF/DOCX de cada documento.
+    """
+    parts = record_store.split_download_id(download_id)
+    if parts is None:
+        return False
+    document_id, doc_id = parts
+    if document_id not in records:
+        records[document_id] = record_store.get(document_id)
+    record = records[document_id]
+    if record is None or (record.documents and doc_id not in record.documents):
+        return False
+    try:
+        return record.template_version == TemplateService.get_template(record.template_id).version
+    except ValueError:
+        return False
+
+
+def evict_outputs() -> None:
+    """Aplica o limite OUTPUT_MAX_MB removendo artefatos re-renderizáveis (síncrono)"""
+    if OUTPUT_MAX_BYTES <= 0:
+        return
+    records: Dict[str, Optional[ContractRecord]] = {}
+    removed = storage.evict_output_files(
+        OUTPUT_MAX_BYTES,
+        can_evict=lambda download_id: can_rerender(download_id, records),
+    )
+    if removed:
+        logger.info("%d artefato(s) removidos do output por limite de disco", len(removed))
+
+
+# Limpeza do output em andamento e se outra foi pedida enquanto ela rodava
+_eviction_task: Optional[asyncio.Task] = None
+_eviction_pending = False
+
+
+def schedule_eviction() -> None:
+    """
+    Dispara evict_outputs em uma thread, fora do caminho da requisição (a
+    listagem do output e a leitura dos registros são I/O bloqueante, com
+    várias requisições no S3). Só uma limpeza roda por vez; pedidos durante
+    ela geram uma única nova rodada ao final.
+    """
+    global _eviction_task, _eviction_pending
+    if OUTPUT_MAX_BYTES <= 0:
+        return
+    if _eviction_task is not None and not _eviction_task.done():
+        _eviction_pending = True
+        return
+    _eviction_pending = False
+    _eviction_task = asyncio.get_running_loop().create_task(asyncio.to_thread(evict_outputs))
+    _eviction_task.add_done_callback(_eviction_done)
+
+
+def _eviction_done(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Falha ao limpar o output: %s", task.exception())
+    if _eviction_pending:
+        schedule_eviction()
+
+
+def validation_error_response(error: FieldValidationError) -> JSONResponse:
+    """422 com todos os campos inválidos de uma vez"""
+    return JSONResponse(
+        status_code=422,
+        content={
+            "detail": f"Dados inválidos: {error}",
+            "errors": [
+                {"field_id": field_id, "message": message}
+                for field_id, message in error.errors.items()
+            ],
+        },
+    )
+
+
+def unresolved_error_response(unresolved: Dict[str, List[str]]) -> JSONResponse:
+    """422 com os placeholders que ficariam sem valor em cada documento"""
+    return JSONResponse(
+        status_code=422,
+        content={
+            "detail": "Campos sem valor no contrato: " + ", ".join(
+                sorted({field_id for fields in unresolved.values() for field_id in fields})
+            ),
+            "errors": [
+                {"field_id": field_id, "document": doc_id, "message": "Placeholder sem valor"}
+                for doc_id, fields in unresolved.items()
+                for field_id in fields
+            ],
+        },
+    )
 
 
 class FillTemplateRequest(BaseModel):
     template_id: Optional[str] = "rota_do_sol"
     fields: Dict[str, Any]  # field_id -> value (sem VENDEDOR_*; injetados via STATIC_PARTIES)
     buyer_type: Optional[str] = None  # legado; o template atual é apenas PF
+    reject_unresolved: Optional[bool] = None  # None: usa FILL_REJECT_UNRESOLVED
 
 
 @router.post("/fill")
@@ -36,158 +157,132 @@ async def fill_template(request: FillTemplateRequest):
     Preenche todos os documentos do template com os dados fornecidos
     e converte cada um para um PDF separado.
     """
-    import traceback
+    # ID único base para todos os documentos relacionados (job_id nos logs)
+    document_id = str(uuid.uuid4())
+    token = job_id_var.set(document_id)
+    try:
+        with IN_PROGRESS.track_inprogress(operation="fill"), FILL_STAGE_SECONDS.time(stage="total"), \
+                start_span("fill_template", template_id=request.template_id, document_id=document_id,
+                           fields=len(request.fields)), memory_tracker.track():
+            return await _fill_template(request, document_id)
+    finally:
+        job_id_var.reset(token)
+
 
+async def _fill_template(request: FillTemplateRequest, document_id: str):
     try:
-        import sys
-        print(f"[FILL] ========== INÍCIO DA REQUISIÇÃO ==========", flush=True)
-        print(f"[FILL] Recebendo requisição para preencher template: {request.template_id}", flush=True)
-        print(f"[FILL] Campos recebidos: {len(request.fields)} campos", flush=True)
-
-        user_fields_sanitized = {
-            k: v
-            for k, v in request.fields.items()
-            if not k.startswith("VENDEDOR_")
-        }
-        fields_to_fill: Dict[str, Any] = {**STATIC_PARTIES, **user_fields_sanitized}
+        logger.info(
+            "Preenchendo template '%s' com %d campos",
+            request.template_id,
+            len(request.fields),
+            extra={"template_id": request.template_id},
+        )
+
+        fields_to_fill: Dict[str, Any] = build_fields_to_fill(request.fields)
 
-        buyer_type = request.buyer_type or filler._detect_buyer_type(fields_to_fill) or "PF"
-        print(f"[FILL] Tipo de comprador (log): {buyer_type}", flush=True)
+        # Um único snapshot do template: schema, documentos renderizados e a
+        # versão salva no registro precisam ser da mesma carga do registro
+        template = TemplateService.get_template(request.template_id)
 
-        # Gerar ID único base para todos os documentos relacionados
-        document_id = str(uuid.uuid4())
-        print(f"[FILL] ID base do documento: {document_id}", flush=True)
+        # Validar e formatar uma única vez, antes de qualquer I/O de template.
+        # O resultado é compartilhado por todos os documentos do template.
+        schema = template.schema
+        try:
+            with FILL_STAGE_SECONDS.time(stage="prepare"):
+                prepared = filler.prepare_fields(fields_to_fill, schema)
+        except FieldValidationError as e:
+            logger.info("Requisição rejeitada: %d campo(s) inválido(s)", len(e.errors))
+            return validation_error_response(e)
+
+        buyer_type = request.buyer_type or prepared.buyer_type or "PF"
+        logger.debug("Tipo de comprador: %s", buyer_type)
 
         # Obter lista de documentos configurados para o template
-        template_docs = TemplateService.get_template_documents(request.template_id)
-        print(f"[FILL] {len(template_docs)} documentos encontrados para o template: {[d['id'] for d in template_docs]}", flush=True)
-        import sys
-        sys.stdout.flush()
+        template_docs = template.documents
+        logger.debug("Documentos do template: %s", [d.id for d in template_docs])
+
+        # Verificação dos placeholders que sobrariam, pelo índice do template
+        # (sem varrer o XML gerado): antes de qualquer I/O, para poder rejeitar
+        with FILL_STAGE_SECONDS.time(stage="verify"):
+            unresolved = {
+                doc.id: filler.unresolved_placeholders(doc.placeholder_parts(), prepared)
+                for doc in template_docs
+            }
+        for doc_id, fields in unresolved.items():
+            if fields:
+                UNRESOLVED_PLACEHOLDERS.inc(len(fields), document=doc_id)
+                logger.warning("Documento '%s' ficaria com %d placeholder(s) sem valor: %s",
+                               doc_id, len(fields), ", ".join(fields))
+        reject = FILL_REJECT_UNRESOLVED if request.reject_unresolved is None else request.reject_unresolved
+        if reject and any(unresolved.values()):
+            return unresolved_error_response({k: v for k, v in unresolved.items() if v})
 
-        documents_info: List[Dict[str, str]] = []
+        documents_info: List[Dict[str, Any]] = []
         errors: List[str] = []
 
-        print(f"[FILL] Iniciando loop para processar {len(template_docs)} documentos...", flush=True)
-        sys.stdout.flush()
+        for idx, doc in enumerate(template_docs, 1):
+            doc_id = doc.id
 
-        for idx, doc_info in enumerate(template_docs, 1):
-            doc_id = doc_info["id"]
-            template_path = doc_info["path"]
-            temp_docx_path = None
-            
             try:
-                print(f"[FILL] ===== Processando documento {idx}/{len(template_docs)}: '{doc_id}' =====", flush=True)
-                print(f"[FILL] Caminho do template: {template_path}", flush=True)
-                
-                # Verificar se o arquivo template existe
-                if not os.path.exists(template_path):
-                    error_msg = f"Template não encontrado: {template_path}"
-                    print(f"[FILL] ERRO: {error_msg}")
-                    errors.append(f"Documento '{doc_id}': {error_msg}")
-                    continue  # Pular este documento e continuar com o próximo
-
-                # Preencher DOCX em memória
-                print(f"[FILL] Preenchendo DOCX em memória...")
-                filled_doc = filler.fill_document_from_path(str(template_path), fields_to_fill)
-                print(f"[FILL] DOCX preenchido com sucesso")
-
-                # Salvar DOCX temporário
-                temp_docx_name = f"{document_id}_{doc_id}.docx"
-                temp_docx_path = storage.get_temp_file_path(temp_docx_name)
-                os.makedirs(os.path.dirname(temp_docx_path), exist_ok=True)
-                filled_doc.save(temp_docx_path)
-                print(f"[FILL] DOCX temporário salvo em: {temp_docx_path}")
-
-                if not os.path.exists(temp_docx_path):
-                    error_msg = f"Arquivo DOCX não foi salvo corretamente: {temp_docx_path}"
-                    print(f"[FILL] ERRO: {error_msg}")
-                    errors.append(f"Documento '{doc_id}': {error_msg}")
-                    continue
-
-                # Converter DOCX para PDF diretamente no diretório de saída
-                final_download_id = f"{document_id}_{doc_id}"
-                # Manter cópia em Word no output para download opcional
-                final_docx_path = os.path.join(storage.get_output_dir(), f"{final_download_id}.docx")
-                shutil.copy2(temp_docx_path, final_docx_path)
-                print(f"[FILL] DOCX final copiado para: {final_docx_path}", flush=True)
-                print(f"[FILL] Convertendo '{doc_id}' para PDF com ID: {final_download_id}")
-                print(f"[FILL] Diretório de saída: {storage.get_output_dir()}")
-                
-                final_pdf_path = await pdf_generator.convert_to_pdf(
-                    temp_docx_path,
-                    final_download_id,  # ID sem extensão .pdf (o método já adiciona)
-                    storage.get_output_dir(),  # Salvar direto no output, não em temp
-                )
-                print(f"[FILL] PDF final de '{doc_id}' gerado em: {final_pdf_path}")
-                print(f"[FILL] Nome do arquivo PDF: {os.path.basename(final_pdf_path)}")
-                
-                # Verificar se o PDF foi criado corretamente
-                if not os.path.exists(final_pdf_path):
-                    error_msg = f"PDF não foi gerado corretamente: {final_pdf_path}"
-                    print(f"[FILL] ERRO: {error_msg}")
-                    errors.append(f"Documento '{doc_id}': {error_msg}")
-                    continue
-                
-                # Verificar se o nome do arquivo está correto
-                expected_filename = f"{final_download_id}.pdf"
-                actual_filename = os.path.basename(final_pdf_path)
-                if actual_filename != expected_filename:
-                    print(f"[FILL] AVISO: Nome do arquivo diferente do esperado!")
-                    print(f"[FILL] Esperado: {expected_filename}")
-                    print(f"[FILL] Atual: {actual_filename}")
-                    # Tentar renomear para o nome correto
-                    correct_path = os.path.join(os.path.dirname(final_pdf_path), expected_filename)
-                    if os.path.exists(correct_path):
-                        os.remove(correct_path)
-                    os.rename(final_pdf_path, correct_path)
-                    final_pdf_path = correct_path
-                    print(f"[FILL] Arquivo renomeado para: {final_pdf_path}")
+                logger.debug("Processando documento %d/%d: '%s'", idx, len(template_docs), doc_id)
+                with FILL_STAGE_SECONDS.time(stage="render_document"), \
+                        start_span("render_document", template_id=request.template_id, doc_id=doc_id):
+                    final_download_id = await renderer.render_document(document_id, doc, prepared)
 
                 documents_info.append(
                     {
                         "id": doc_id,
-                        "name": doc_info["name"],
+                        "name": doc.name,
                         "download_id": final_download_id,
+                        "unresolved_fields": unresolved[doc_id],
                     }
                 )
-                print(f"[FILL] OK - Documento '{doc_id}' processado com sucesso! Total processados: {len(documents_info)}", flush=True)
-                print(f"[FILL] Arquivo PDF final: {final_pdf_path}", flush=True)
-                print(f"[FILL] Download ID: {final_download_id}", flush=True)
+                logger.info("Documento '%s' gerado", doc_id, extra={"download_id": final_download_id})
                 
             except Exception as doc_error:
-                error_trace = traceback.format_exc()
                 error_msg = f"Erro ao processar documento '{doc_id}': {str(doc_error)}"
-                print(f"[FILL] ERRO: {error_msg}", flush=True)
-                print(f"[FILL] Traceback completo:\n{error_trace}", flush=True)
+                logger.error(error_msg, exc_info=logger.isEnabledFor(logging.DEBUG))
                 errors.append(error_msg)
                 # Continuar processando os outros documentos mesmo se este falhar
                 continue
-            finally:
-                # Sempre tentar remover o DOCX temporário
-                if temp_docx_path and os.path.exists(temp_docx_path):
-                    try:
-                        os.remove(temp_docx_path)
-                        print(f"[FILL] DOCX temporário removido: {temp_docx_path}")
-                    except Exception as e:
-                        print(f"[FILL] AVISO: Não foi possível remover DOCX temporário: {e}")
 
         if not documents_info:
             error_summary = "\n".join(errors) if errors else "Nenhum erro específico registrado"
             raise Exception(f"Nenhum documento foi gerado para o template informado.\nErros encontrados:\n{error_summary}")
         
         if errors:
-            print(f"[FILL] AVISO: {len(errors)} erro(s) ocorreram durante o processamento, mas {len(documents_info)} documento(s) foram gerados com sucesso.")
-            for error in errors:
-                print(f"[FILL]   - {error}")
+            logger.warning(
+                "%d erro(s) durante o processamento, mas %d documento(s) foram gerados",
+                len(errors),
+                len(documents_info),
+            )
+
+        # Registrar os campos sanitizados para permitir re-renderizar o contrato
+        # caso os arquivos do output sejam removidos (ver evict_outputs)
+        try:
+            record_store.save(
+                ContractRecord(
+                    document_id=document_id,
+                    template_id=request.template_id,
+                    template_version=template.version,
+                    fields=sanitize_user_fields(request.fields),
+                    buyer_type=request.buyer_type,
+                    documents=[d["id"] for d in documents_info],
+                )
+            )
+            schedule_eviction()
+        except Exception as e:
+            logger.warning("Não foi possível registrar o contrato %s: %s", document_id, e)
 
         # Mantém compatibilidade com o frontend atual, que espera 'filled_document_id'
         # filled_document_id agora aponta para o primeiro documento (ex: quadro_resumo)
         primary_download_id = documents_info[0]["download_id"]
 
-        print(f"[FILL] ========== FIM DA REQUISIÇÃO ==========", flush=True)
-        print(f"[FILL] Total de documentos gerados: {len(documents_info)}", flush=True)
-        print(f"[FILL] Documentos: {[d['id'] for d in documents_info]}", flush=True)
-        print(f"[FILL] Download IDs: {[d['download_id'] for d in documents_info]}", flush=True)
+        logger.info(
+            "%d documento(s) gerados",
+            len(documents_info),
+            extra={"download_ids": [d["download_id"] for d in documents_info]},
+        )
 
         return {
             "success": True,
@@ -200,19 +295,13 @@ async def fill_template(request: FillTemplateRequest):
         }
 
     except ValueError as e:
-        error_trace = traceback.format_exc()
-        print(f"Erro ValueError: {str(e)}")
-        print(f"Traceback: {error_trace}")
+        logger.warning("Template inválido: %s", e)
         raise HTTPException(status_code=404, detail=str(e))
     except FileNotFoundError as e:
-        error_trace = traceback.format_exc()
-        print(f"Erro FileNotFoundError: {str(e)}")
-        print(f"Traceback: {error_trace}")
+        logger.error("Template não encontrado: %s", e)
         raise HTTPException(status_code=500, detail=f"Template não encontrado: {str(e)}")
     except HTTPException:
         raise
     except Exception as e:
-        error_trace = traceback.format_exc()
-        print(f"Erro ao gerar contrato: {str(e)}")
-        print(f"Traceback completo: {error_trace}")
+        logger.exception("Erro ao gerar contrato: %s", e)
         raise HTTPException(status_code=500, detail=f"Erro ao gerar contrato: {str(e)}")
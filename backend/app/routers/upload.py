@@ -1,12 +1,15 @@
 """
 Rota para upload de documentos DOCX
 """
+import logging
 import os
 import uuid
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.services.document_storage import DocumentStorage
+from app.services.document_storage import DocumentStorage, UploadRejected
 from app.models.schemas import UploadResponse
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 storage = DocumentStorage()
 
@@ -28,23 +31,23 @@ async def upload_document(file: UploadFile = File(...)):
         # Gerar ID único para o documento
         document_id = str(uuid.uuid4())
         
-        print(f"Recebendo upload: {file.filename} (ID: {document_id})")
+        logger.info("Recebendo upload: %s (ID: %s)", file.filename, document_id)
         
         # Salvar arquivo temporariamente
         file_path = await storage.save_uploaded_file(document_id, file)
         
-        print(f"Arquivo salvo em: {file_path}")
+        logger.debug("Arquivo salvo em: %s", file_path)
         
         return UploadResponse(
             document_id=document_id,
             filename=file.filename,
             message="Documento enviado com sucesso"
         )
+    except UploadRejected as e:
+        logger.info("Upload recusado: %s: %s", file.filename, e)
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Erro ao processar upload: {str(e)}")
-        print(f"Traceback: {error_trace}")
+        logger.exception("Erro ao processar upload: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao processar upload: {str(e)}"
@@ -1,15 +1,86 @@
 """
 Serviço para análise inteligente usando modelo de linguagem
+
+As chamadas usam o cliente assíncrono (AsyncOpenAI), então uma análise em
+andamento não bloqueia o event loop. Por processo, no máximo
+OPENAI_MAX_CONCURRENCY requisições ficam em voo ao mesmo tempo; limites de
+taxa (429), timeouts e erros 5xx são repetidos com backoff exponencial com
+jitter, até OPENAI_MAX_RETRIES vezes.
+
+OPENAI_BASE_URL aponta o cliente para um servidor compatível com a API da
+OpenAI, ex.: o stub local em scripts/openai_stub_server.py para testes e
+benchmarks (nesse caso a OPENAI_API_KEY é opcional).
 """
+import asyncio
+import logging
 import os
 import json
-from openai import OpenAI
-from typing import List, Dict
+import random
+import openai
+from openai import AsyncOpenAI
+from typing import List, Dict, Optional, Tuple
 from app.models.schemas import FieldInfo, FieldType
+from app.services.metrics import IN_PROGRESS, POOL_SIZE, QUEUE_DEPTH
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Erros transitórios que valem nova tentativa
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+# Incrementar ao mudar SYSTEM_PROMPT/_build_analysis_prompt: invalida o cache de análises
+PROMPT_VERSION = "2"
+
+# Orçamento de tokens por requisição e estimativa de caracteres por token
+# (português fica perto de 4 caracteres por token nos modelos da OpenAI)
+CHARS_PER_TOKEN = 4
+
+SYSTEM_PROMPT = """Você é um especialista em análise de contratos jurídicos e imobiliários.
+Sua tarefa é analisar campos editáveis em contratos e criar labels descritivos e semânticos.
+
+REGRAS IMPORTANTES:
+1. Crie labels claros e específicos, nunca genéricos como "Campo 1"
+2. Identifique o tipo correto de cada campo (text, number, currency, date, cpf, cnpj, phone, email)
+3. Use o contexto ao redor do campo para entender seu significado
+4. Campos semelhantes devem ter o mesmo field_id (ex: nome do comprador em vários lugares)
+5. Identifique a seção do contrato (COMPRADOR, VENDEDOR, IMÓVEL, etc.)
+6. Mantenha o texto jurídico intacto, apenas identifique campos editáveis
+
+Retorne APENAS um JSON válido com a lista de campos."""
+
+_semaphore: Optional[asyncio.Semaphore] = None
+_semaphore_loop = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """
+    Semáforo do processo que limita as requisições simultâneas à OpenAI
+    (recriado se o event loop mudar, ex.: entre TestClients)
+    """
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        limit = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+        _semaphore = asyncio.Semaphore(limit)
+        POOL_SIZE.set(limit, pool="openai")
+        _semaphore_loop = loop
+    return _semaphore
+
+
+def get_model_name() -> str:
+    """
+    Modelo pode ser configurado via variável de ambiente ou usa padrão
+    Opções: gpt-4o-mini (padrão, econômico), gpt-4o, gpt-3.5-turbo
+    """
+    return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
 
 class AIAnalyzer:
     """Usa IA para analisar contexto e gerar labels inteligentes"""
@@ -51,158 +122,272 @@ class AIAnalyzer:
                                 if api_key:
                                     break
                     except Exception as e:
-                        print(f"Erro ao ler .env de {env_path}: {e}")
+                        logger.warning("Erro ao ler .env de %s: %s", env_path, e)
                         continue
         
+        base_url = os.getenv("OPENAI_BASE_URL") or None
+        if base_url and not api_key:
+            # Servidor local compatível (stub de testes) não exige chave
+            api_key = "local"
+        
         if not api_key or api_key.strip() == "" or api_key == "your_openai_api_key_here":
             raise ValueError("OPENAI_API_KEY não configurada no .env. Por favor, edite o arquivo backend/.env e adicione sua chave da OpenAI.")
         
+        # Timeout por requisição (s) e política de retry
+        self.timeout = float(os.getenv("OPENAI_TIMEOUT", "60"))
+        self.max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+        self.backoff_base = float(os.getenv("OPENAI_BACKOFF_BASE", "1.0"))
+        self.backoff_max = float(os.getenv("OPENAI_BACKOFF_MAX", "30"))
+        
+        # Divisão de documentos longos: tokens de texto por requisição e
+        # caracteres de contexto de cada lado de um placeholder
+        self.chunk_tokens = int(os.getenv("OPENAI_CHUNK_TOKENS", "3000"))
+        self.context_chars = int(os.getenv("OPENAI_CONTEXT_CHARS", "600"))
+        
         try:
-            # Inicializar cliente OpenAI de forma explícita
-            # A versão 2.x da OpenAI tem uma API diferente da 1.x
-            import openai
-            
-            # Verificar versão e inicializar adequadamente
-            openai_version = openai.__version__
-            print(f"Versão da biblioteca OpenAI: {openai_version}")
-            
-            # Para versão 2.x, usar apenas api_key
-            # Não passar nenhum outro argumento que possa causar conflitos
-            if openai_version.startswith('2.'):
-                self.client = OpenAI(api_key=api_key)
-            else:
-                # Fallback para versões mais antigas
-                self.client = OpenAI(api_key=api_key)
+            logger.debug("Versão da biblioteca OpenAI: %s", openai.__version__)
+            # Retries ficam a cargo de _create_completion (backoff com jitter)
+            self.client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=self.timeout,
+                max_retries=0,
+            )
             
-            # Modelo pode ser configurado via variável de ambiente ou usa padrão
-            # Opções: gpt-4o-mini (padrão, econômico), gpt-4o, gpt-3.5-turbo
-            self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-            print(f"Modelo OpenAI configurado: {self.model}")
-        except TypeError as e:
-            # Erro específico de argumentos inválidos
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"Erro de tipo ao inicializar OpenAI: {error_trace}")
-            # Tentar inicialização mínima
-            try:
-                self.client = OpenAI(api_key=api_key)
-                self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-                print(f"Modelo OpenAI configurado (fallback): {self.model}")
-            except Exception as e2:
-                raise ValueError(f"Erro ao inicializar cliente OpenAI: {str(e2)}")
+            self.model = get_model_name()
+            logger.debug("Modelo OpenAI configurado: %s%s", self.model, f" ({base_url})" if base_url else "")
         except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"Erro detalhado ao inicializar OpenAI: {error_trace}")
+            logger.exception("Erro ao inicializar cliente OpenAI")
             raise ValueError(f"Erro ao inicializar cliente OpenAI: {str(e)}")
     
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """
+        Espera antes da próxima tentativa: respeita Retry-After quando o
+        servidor informa; senão backoff exponencial com jitter completo
+        """
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    async def _create_completion(self, messages: List[Dict]):
+        """
+        Chama o chat completions respeitando o limite de concorrência do
+        processo e repetindo erros transitórios com backoff
+        """
+        attempt = 0
+        while True:
+            semaphore = _get_semaphore()
+            with QUEUE_DEPTH.track_inprogress(queue="openai"):
+                await semaphore.acquire()
+            try:
+                with IN_PROGRESS.track_inprogress(operation="openai_request"):
+                    return await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.3,
+                        response_format={"type": "json_object"},
+                    )
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                error_name = type(e).__name__
+                delay = self._backoff_delay(attempt, e)
+            finally:
+                semaphore.release()
+            # Aguardar fora do semáforo para liberar a vaga a outras análises
+            attempt += 1
+            logger.warning("OpenAI: %s, nova tentativa %d/%d em %.1fs", error_name, attempt, self.max_retries, delay)
+            await asyncio.sleep(delay)
+    
     async def analyze_fields(self, document_text: str, 
                             placeholders: List[Dict]) -> List[FieldInfo]:
         """
         Analisa placeholders e gera informações estruturadas sobre cada campo
-        """
-        # Preparar contexto para a IA
-        context_prompt = self._build_analysis_prompt(document_text, placeholders)
         
+        Documentos que cabem no orçamento de tokens vão em uma requisição só.
+        Documentos maiores são divididos em janelas centradas nos placeholders,
+        analisadas em paralelo (limitadas pelo semáforo do processo), e os
+        resultados são combinados por field_id.
+        """
         try:
-            print(f"Enviando requisição para OpenAI com modelo: {self.model}")
-            print(f"Tamanho do prompt: {len(context_prompt)} caracteres")
-            print(f"Número de placeholders: {len(placeholders)}")
-            
-            # Usar o cliente existente diretamente
-            # A versão 2.x da OpenAI gerencia timeout internamente
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """Você é um especialista em análise de contratos jurídicos e imobiliários.
-                        Sua tarefa é analisar campos editáveis em contratos e criar labels descritivos e semânticos.
-                        
-                        REGRAS IMPORTANTES:
-                        1. Crie labels claros e específicos, nunca genéricos como "Campo 1"
-                        2. Identifique o tipo correto de cada campo (text, number, currency, date, cpf, cnpj, phone, email)
-                        3. Use o contexto ao redor do campo para entender seu significado
-                        4. Campos semelhantes devem ter o mesmo field_id (ex: nome do comprador em vários lugares)
-                        5. Identifique a seção do contrato (COMPRADOR, VENDEDOR, IMÓVEL, etc.)
-                        6. Mantenha o texto jurídico intacto, apenas identifique campos editáveis
-                        
-                        Retorne APENAS um JSON válido com a lista de campos."""
-                    },
-                    {
-                        "role": "user",
-                        "content": context_prompt
-                    }
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
-            print("Resposta recebida da OpenAI com sucesso")
-            
-            # Parsear resposta JSON
-            result = json.loads(response.choices[0].message.content)
-            fields = result.get("fields", [])
+            chunks = self._build_chunks(document_text, placeholders)
+            logger.debug("Enviando requisição para OpenAI (modelo %s, %d placeholders)", self.model, len(placeholders))
+            if len(chunks) == 1:
+                chunk_text, chunk_placeholders, excerpt = chunks[0]
+                return await self._analyze_chunk(chunk_text, chunk_placeholders, excerpt)
             
-            # Converter para FieldInfo
-            field_infos = []
-            for field_data in fields:
-                field_info = FieldInfo(
-                    field_id=field_data.get("field_id"),
-                    label=field_data.get("label"),
-                    type=FieldType(field_data.get("type", "text")),
-                    required=field_data.get("required", True),
-                    original_text=field_data.get("original_text"),
-                    context=field_data.get("context", ""),
-                    placeholder=field_data.get("placeholder"),
-                    section=field_data.get("section")
-                )
-                field_infos.append(field_info)
-            
-            return field_infos
+            logger.info("Documento com %d caracteres dividido em %d trechos", len(document_text), len(chunks))
+            results = await asyncio.gather(*[
+                self._analyze_chunk(chunk_text, chunk_placeholders, excerpt)
+                for chunk_text, chunk_placeholders, excerpt in chunks
+            ])
+            return self._merge_fields(results)
             
         except Exception as e:
-            # Log detalhado do erro
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"Erro na análise de IA: {str(e)}")
-            print(f"Traceback: {error_trace}")
+            # Log detalhado do erro (com traceback)
+            logger.exception("Erro na análise de IA: %s", e)
             
             # Verificar tipo de erro
             error_str = str(e).lower()
             if "api key" in error_str or "authentication" in error_str:
                 raise ValueError("Erro de autenticação com OpenAI. Verifique se a OPENAI_API_KEY está correta.")
-            elif "rate limit" in error_str:
+            elif isinstance(e, openai.RateLimitError) or "rate limit" in error_str:
                 raise ValueError("Limite de requisições da OpenAI atingido. Aguarde alguns minutos e tente novamente.")
             elif "insufficient_quota" in error_str:
                 raise ValueError("Cota da OpenAI esgotada. Adicione créditos à sua conta OpenAI.")
             else:
                 # Em caso de outros erros, criar campos básicos como fallback
-                print("Usando fallback: criando campos básicos sem IA")
+                logger.warning("Usando fallback: criando campos básicos sem IA")
                 return self._create_fallback_fields(placeholders)
     
+    async def _analyze_chunk(self, document_text: str, placeholders: List[Dict],
+                             excerpt: bool) -> List[FieldInfo]:
+        """Uma requisição à IA para um trecho (ou o documento inteiro)"""
+        context_prompt = self._build_analysis_prompt(document_text, placeholders, excerpt=excerpt)
+        logger.debug("Tamanho do prompt: %d caracteres", len(context_prompt))
+        
+        response = await self._create_completion([
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": context_prompt
+            }
+        ])
+        logger.debug("Resposta recebida da OpenAI")
+        
+        # Parsear resposta JSON
+        result = json.loads(response.choices[0].message.content)
+        fields = result.get("fields", [])
+        
+        # Converter para FieldInfo
+        field_infos = []
+        for field_data in fields:
+            field_info = FieldInfo(
+                field_id=field_data.get("field_id"),
+                label=field_data.get("label"),
+                type=FieldType(field_data.get("type", "text")),
+                required=field_data.get("required", True),
+                original_text=field_data.get("original_text"),
+                context=field_data.get("context", ""),
+                placeholder=field_data.get("placeholder"),
+                section=field_data.get("section")
+            )
+            field_infos.append(field_info)
+        
+        return field_infos
+    
+    def _build_chunks(self, document_text: str,
+                      placeholders: List[Dict]) -> List[Tuple[str, List[Dict], bool]]:
+        """
+        Divide o documento em trechos que cabem no orçamento de tokens
+        (OPENAI_CHUNK_TOKENS, estimado em CHARS_PER_TOKEN caracteres por token).
+        
+        Cada placeholder ganha uma janela de OPENAI_CONTEXT_CHARS caracteres
+        antes e depois; janelas próximas são unidas no mesmo trecho enquanto
+        o trecho couber no orçamento. Retorna (texto, placeholders, é_trecho).
+        """
+        budget_chars = self.chunk_tokens * CHARS_PER_TOKEN
+        if len(document_text) <= budget_chars or not placeholders:
+            if len(document_text) > budget_chars:
+                logger.warning("Documento muito grande (%d chars) e sem placeholders, truncando para %d", len(document_text), budget_chars)
+                document_text = document_text[:budget_chars] + "..."
+            return [(document_text, placeholders, False)]
+        
+        # Posição de cada placeholder no texto (índice global preservado)
+        located = []
+        search_from = 0
+        for index, placeholder in enumerate(placeholders):
+            start = placeholder.get("start")
+            end = placeholder.get("end")
+            if start is None or end is None:
+                text = placeholder.get("text") or ""
+                start = document_text.find(text, search_from) if text else -1
+                if start < 0:
+                    start = document_text.find(text) if text else -1
+                if start < 0:
+                    start, end = 0, 0
+                else:
+                    end = start + len(text)
+                    search_from = end
+            located.append((start, end, index, placeholder))
+        located.sort(key=lambda item: item[0])
+        
+        window = self.context_chars
+        text_length = len(document_text)
+        spans = []  # [início, fim, [(índice, placeholder)]]
+        for start, end, index, placeholder in located:
+            win_start = max(0, start - window)
+            win_end = min(text_length, end + window)
+            if spans and max(spans[-1][1], win_end) - spans[-1][0] <= budget_chars:
+                spans[-1][1] = max(spans[-1][1], win_end)
+                spans[-1][2].append((index, placeholder))
+            else:
+                spans.append([win_start, win_end, [(index, placeholder)]])
+        
+        chunks = []
+        for win_start, win_end, members in spans:
+            text = document_text[win_start:win_end]
+            if win_start > 0:
+                text = "..." + text
+            if win_end < text_length:
+                text = text + "..."
+            chunks.append((text, [dict(p, index=i) for i, p in members], True))
+        return chunks
+    
+    @staticmethod
+    def _merge_fields(results: List[List[FieldInfo]]) -> List[FieldInfo]:
+        """
+        Combina os campos de vários trechos: um campo por field_id, na ordem
+        em que aparecem, completando atributos vazios com os de outros trechos
+        """
+        merged: Dict[str, FieldInfo] = {}
+        for fields in results:
+            for field in fields:
+                current = merged.get(field.field_id)
+                if current is None:
+                    merged[field.field_id] = field
+                    continue
+                missing = {
+                    name: value
+                    for name, value in field.model_dump(exclude_none=True).items()
+                    if getattr(current, name) in (None, "")
+                }
+                if missing:
+                    merged[field.field_id] = current.model_copy(update=missing)
+        return list(merged.values())
+    
     def _build_analysis_prompt(self, document_text: str, 
-                               placeholders: List[Dict]) -> str:
+                               placeholders: List[Dict], excerpt: bool = False) -> str:
         """
         Constrói o prompt para análise pela IA
+        (o texto já vem dentro do orçamento de tokens, ver _build_chunks)
         """
-        # Limitar tamanho do texto para não exceder tokens
-        # Aumentado para 12000 para documentos maiores, mas ainda dentro do limite
-        max_text_length = 12000
-        if len(document_text) > max_text_length:
-            print(f"Documento muito grande ({len(document_text)} chars), truncando para {max_text_length}")
-            document_text = document_text[:max_text_length] + "..."
-        
         placeholder_info = []
         for i, placeholder in enumerate(placeholders):
             placeholder_info.append({
-                "index": i,
+                "index": placeholder.get("index", i),
                 "text": placeholder.get("text"),
                 "context": placeholder.get("context", "")
             })
         
-        prompt = f"""Analise o seguinte contrato e identifique os campos editáveis:
+        if excerpt:
+            header = "Analise os seguintes trechos de um contrato e identifique os campos editáveis:"
+            text_title = "TRECHOS DO CONTRATO (apenas as partes ao redor dos campos abaixo):"
+        else:
+            header = "Analise o seguinte contrato e identifique os campos editáveis:"
+            text_title = "TEXTO DO CONTRATO:"
+        
+        prompt = f"""{header}
 
-TEXTO DO CONTRATO:
+{text_title}
 {document_text}
 
 CAMPOS IDENTIFICADOS:
@@ -253,3 +438,11 @@ Retorne um JSON no formato:
             fields.append(field)
         
         return fields
+    
+    @staticmethod
+    def is_fallback(fields: List[FieldInfo]) -> bool:
+        """Indica se os campos vieram de _create_fallback_fields (não devem ir para cache)"""
+        return bool(fields) and all(
+            f.field_id == f"field_{i+1}" and f.label == f"Campo {i+1}"
+            for i, f in enumerate(fields)
+        )
@@ -0,0 +1,123 @@
+"""
+Cache persistente das análises de campos feitas com IA.
+
+Reanalisar o mesmo contrato enviava o prompt inteiro de novo à OpenAI (custo,
+latência e resultados que variam entre chamadas). O AnalysisResponse de cada
+análise fica em disco, em ANALYSIS_CACHE_DIR, com a chave:
+
+    sha256(texto extraído, conjunto de placeholders, modelo, PROMPT_VERSION)
+
+Mudar o modelo ou o prompt (PROMPT_VERSION em ai_analyzer.py) invalida as
+entradas antigas naturalmente. O cache guarda no máximo
+ANALYSIS_CACHE_MAX_ENTRIES análises; acima disso as menos usadas recentemente
+(mtime, atualizado a cada acerto) são removidas. A limpeza total é feita pelo
+endpoint administrativo DELETE /api/admin/analysis-cache.
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+from app.models.schemas import AnalysisResponse
+from app.services.metrics import CACHE_REQUESTS
+
+
+class AnalysisCache:
+    """Cache LRU em disco de AnalysisResponse (um JSON por análise)"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: Optional[int] = None):
+        if cache_dir is None:
+            cache_dir = os.getenv("ANALYSIS_CACHE_DIR") or os.path.join(os.getenv("TEMP_DIR", "./temp"), "analysis_cache")
+        if max_entries is None:
+            max_entries = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "500"))
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(document_text: str, placeholders: Iterable[str], model: str, prompt_version: str) -> str:
+        digest = hashlib.sha256()
+        for part in (prompt_version, model, "\x1f".join(sorted(set(placeholders))), document_text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x1e")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[AnalysisResponse]:
+        """Retorna a análise em cache (ou None) e marca a entrada como usada"""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            CACHE_REQUESTS.inc(cache="analysis", result="miss")
+            return None
+        try:
+            response = AnalysisResponse.model_validate_json(data)
+        except ValueError:
+            # Entrada corrompida ou de uma versão antiga do modelo: descartar
+            path.unlink(missing_ok=True)
+            CACHE_REQUESTS.inc(cache="analysis", result="miss")
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        CACHE_REQUESTS.inc(cache="analysis", result="hit")
+        return response
+
+    def set(self, key: str, response: AnalysisResponse) -> None:
+        """Grava a análise (escrita atômica) e aplica o limite de entradas"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(response.model_dump_json(), encoding="utf-8")
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self) -> int:
+        if self.max_entries <= 0:
+            return 0
+        with self._lock:
+            entries = self._entries()
+            excess = len(entries) - self.max_entries
+            if excess <= 0:
+                return 0
+            entries.sort()
+            for _, _, path in entries[:excess]:
+                path.unlink(missing_ok=True)
+            return excess
+
+    def purge(self) -> int:
+        """Remove todas as análises em cache; retorna quantas foram removidas"""
+        if not self.cache_dir.exists():
+            return 0
+        with self._lock:
+            removed = 0
+            for _, _, path in self._entries():
+                path.unlink(missing_ok=True)
+                removed += 1
+            return removed
+
+    def stats(self) -> dict:
+        entries = self._entries() if self.cache_dir.exists() else []
+        return {
+            "entries": len(entries),
+            "max_entries": self.max_entries,
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+analysis_cache = AnalysisCache()
@@ -0,0 +1,91 @@
+"""
+Registro compacto dos contratos gerados.
+
+Cada chamada ao /api/fill grava um registro com os campos sanitizados
+(sem VENDEDOR_*), o template_id e a versão do template usada. Com isso os
+PDFs/DOCX do output podem ser removidos sob pressão de disco e
+re-renderizados de forma determinística no próximo download.
+
+Os registros ficam no mesmo backend de armazenamento dos artefatos
+(STORAGE_BACKEND), sob o prefixo "records/", para que qualquer worker
+consiga re-renderizar um contrato gerado por outro.
+"""
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.services.storage_backends import StorageBackend, get_storage_backend
+
+
+class ContractRecord(BaseModel):
+    """Dados mínimos para re-renderizar um contrato"""
+    document_id: str
+    template_id: str
+    template_version: str
+    fields: Dict[str, Any]
+    buyer_type: Optional[str] = None
+    documents: List[str] = []
+    created_at: float = 0.0
+
+
+class ContractRecordStore:
+    """Armazena registros de contratos como JSON compacto em records/<document_id>.json"""
+
+    RECORDS_PREFIX = "records"
+
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self.backend = backend or get_storage_backend()
+
+    def _record_key(self, document_id: str) -> str:
+        # document_id é um UUID gerado no fill; basename evita path traversal
+        return f"{self.RECORDS_PREFIX}/{os.path.basename(document_id)}.json"
+
+    def save(self, record: ContractRecord) -> None:
+        """Grava o registro (escrita atômica no backend)"""
+        if not record.created_at:
+            record.created_at = time.time()
+        data = json.dumps(record.model_dump(), ensure_ascii=False, separators=(",", ":"))
+        self.backend.write_bytes(self._record_key(record.document_id), data.encode("utf-8"))
+
+    def get(self, document_id: str) -> Optional[ContractRecord]:
+        """Retorna o registro do contrato ou None se não existir"""
+        key = self._record_key(document_id)
+        if not self.backend.exists(key):
+            return None
+        return ContractRecord(**json.loads(self.backend.read_bytes(key)))
+
+    def exists(self, document_id: str) -> bool:
+        return self.backend.exists(self._record_key(document_id))
+
+    @staticmethod
+    def split_download_id(download_id: str) -> Optional[Tuple[str, str]]:
+        """'<document_id>_<doc_id>[.pdf|.docx]' -> (document_id, doc_id), ou None"""
+        base = download_id
+        for ext in (".pdf", ".docx"):
+            if base.endswith(ext):
+                base = base[: -len(ext)]
+        # O document_id é um UUID (sem '_'), então o primeiro '_' separa o doc_id
+        if "_" not in base:
+            return None
+        document_id, doc_id = base.split("_", 1)
+        return document_id, doc_id
+
+    def resolve_download_id(self, download_id: str) -> Optional[Tuple[ContractRecord, str]]:
+        """
+        Resolve um download_id ('<document_id>_<doc_id>') para o registro e o
+        id do documento dentro do template. Retorna None se não houver registro.
+        """
+        parts = self.split_download_id(download_id)
+        if parts is None:
+            return None
+        document_id, doc_id = parts
+        record = self.get(document_id)
+        if record is None or (record.documents and doc_id not in record.documents):
+            return None
+        return record, doc_id
+
+    def delete(self, document_id: str) -> bool:
+        return self.backend.delete(self._record_key(document_id))
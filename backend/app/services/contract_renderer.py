@@ -0,0 +1,195 @@
+"""
+Serviço que renderiza um documento de contrato (DOCX + PDF) no diretório de saída.
+
+Usado tanto pelo /api/fill quanto pelo download, que re-renderiza
+documentos cujos arquivos foram removidos do output a partir do registro
+salvo em ContractRecordStore (rerender_from_record).
+"""
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+import weakref
+from typing import Dict, Any
+
+from app.config.parties import STATIC_PARTIES
+from app.services.contract_records import ContractRecordStore
+from app.services.document_filler import DocumentFiller, PreparedFields
+from app.services.document_storage import DocumentStorage
+from app.services.memory_tracking import memory_tracker
+from app.services.metrics import FILL_STAGE_SECONDS
+from app.services.pdf_generator import PDFGenerator
+from app.services.template_registry import TemplateDocument
+from app.services.template_service import TemplateService
+from app.services.tracing import current_span, start_span
+
+logger = logging.getLogger(__name__)
+
+# Um lock por download_id em re-renderização: downloads simultâneos (ex.: PDF
+# e DOCX do mesmo contrato) esperam a mesma re-renderização em vez de gerar os
+# mesmos arquivos em paralelo. Compartilhado por todas as instâncias; o lock
+# some do dicionário quando ninguém mais o usa.
+_rerender_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def sanitize_user_fields(user_fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos do usuário sem VENDEDOR_* (as partes estáticas vêm sempre do servidor)"""
+    return {
+        k: v
+        for k, v in user_fields.items()
+        if not k.startswith("VENDEDOR_")
+    }
+
+
+def build_fields_to_fill(user_fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Combina os campos do usuário com as partes estáticas (VENDEDOR_* sempre do servidor)"""
+    return {**STATIC_PARTIES, **sanitize_user_fields(user_fields)}
+
+
+class ContractRenderer:
+    """Gera o DOCX preenchido e o PDF final de um documento do template"""
+
+    def __init__(self, filler: DocumentFiller = None, storage: DocumentStorage = None,
+                 pdf_generator: PDFGenerator = None, record_store: ContractRecordStore = None):
+        self.filler = filler or DocumentFiller()
+        self.storage = storage or DocumentStorage()
+        self.pdf_generator = pdf_generator or PDFGenerator()
+        self.record_store = record_store or ContractRecordStore()
+
+    @staticmethod
+    def build_download_id(document_id: str, doc_id: str) -> str:
+        """ID de download de um documento: '<document_id>_<doc_id>'"""
+        return f"{document_id}_{doc_id}"
+
+    async def render_document(self, document_id: str, document: TemplateDocument,
+                              prepared: PreparedFields) -> str:
+        """
+        Preenche o template de um documento, salva o DOCX final no output e
+        converte para PDF. Retorna o download_id gerado.
+
+        prepared é o resultado de DocumentFiller.prepare_fields (campos já
+        validados e formatados uma única vez para todos os documentos).
+
+        Levanta exceção se algum passo falhar; o DOCX temporário é sempre removido.
+        """
+        doc_id = document.id
+        temp_docx_path = None
+
+        try:
+            logger.debug("Template de '%s': %s", doc_id, document.path)
+
+            # Preencher DOCX em memória
+            # Usar os bytes do snapshot do template (estáveis mesmo se o DOCX for
+            # substituído no disco durante uma recarga do registro)
+            # Preenchimento e gravação são síncronos (sem await): a medição de
+            # memória do fill cobre só este trecho
+            with memory_tracker.measure():
+                filled_doc = self.filler.fill_document_from_path(document.open(), prepared.fields, prepared=prepared)
+
+                # Salvar DOCX temporário (nome único: o PDF do soffice sai com o
+                # mesmo nome e não pode colidir com outra renderização)
+                temp_docx_name = f"{document_id}_{doc_id}_{uuid.uuid4().hex}.docx"
+                temp_docx_path = self.storage.get_temp_file_path(temp_docx_name)
+                os.makedirs(os.path.dirname(temp_docx_path), exist_ok=True)
+                with FILL_STAGE_SECONDS.time(stage="docx_save"):
+                    filled_doc.save(temp_docx_path)
+            span = current_span()
+            if span.recording:
+                span.set_attribute("docx.bytes", os.path.getsize(temp_docx_path))
+            logger.debug("DOCX temporário salvo em: %s", temp_docx_path)
+
+            if not os.path.exists(temp_docx_path):
+                raise Exception(f"Arquivo DOCX não foi salvo corretamente: {temp_docx_path}")
+
+            # Converter DOCX para PDF diretamente no diretório de saída
+            final_download_id = self.build_download_id(document_id, doc_id)
+            # Manter cópia em Word no output para download opcional
+            final_docx_path = os.path.join(self.storage.get_output_dir(), f"{final_download_id}.docx")
+            with FILL_STAGE_SECONDS.time(stage="docx_copy"):
+                shutil.copy2(temp_docx_path, final_docx_path)
+            logger.debug("Convertendo '%s' para PDF com ID: %s", doc_id, final_download_id)
+
+            final_pdf_path = await self.pdf_generator.convert_to_pdf(
+                temp_docx_path,
+                final_download_id,  # ID sem extensão .pdf (o método já adiciona)
+                self.storage.get_output_dir(),  # Salvar direto no output, não em temp
+            )
+
+            # Verificar se o PDF foi criado corretamente
+            if not os.path.exists(final_pdf_path):
+                raise Exception(f"PDF não foi gerado corretamente: {final_pdf_path}")
+
+            # Verificar se o nome do arquivo está correto
+            expected_filename = f"{final_download_id}.pdf"
+            actual_filename = os.path.basename(final_pdf_path)
+            if actual_filename != expected_filename:
+                logger.warning("Nome do PDF diferente do esperado: %s (esperado %s)", actual_filename, expected_filename)
+                # Tentar renomear para o nome correto
+                correct_path = os.path.join(os.path.dirname(final_pdf_path), expected_filename)
+                if os.path.exists(correct_path):
+                    os.remove(correct_path)
+                os.rename(final_pdf_path, correct_path)
+                final_pdf_path = correct_path
+
+            # Enviar DOCX e PDF finais ao backend de armazenamento (no-op se local)
+            span.set_attribute("download_id", final_download_id)
+            with FILL_STAGE_SECONDS.time(stage="publish"):
+                await asyncio.to_thread(self._publish, final_download_id)
+
+            logger.debug("PDF final: %s", final_pdf_path)
+            return final_download_id
+        finally:
+            # Sempre tentar remover o DOCX temporário
+            if temp_docx_path and os.path.exists(temp_docx_path):
+                try:
+                    os.remove(temp_docx_path)
+                except Exception as e:
+                    logger.warning("Não foi possível remover DOCX temporário: %s", e)
+
+    def _publish(self, download_id: str) -> None:
+        """Envia DOCX e PDF ao backend (síncrono: no S3 são uploads boto3)"""
+        self.storage.publish_output(f"{download_id}.docx")
+        self.storage.publish_output(f"{download_id}.pdf")
+
+    def _outputs_exist(self, download_id: str) -> bool:
+        return all(self.storage.stat_output(f"{download_id}{ext}") is not None for ext in (".pdf", ".docx"))
+
+    async def rerender_from_record(self, download_id: str) -> bool:
+        """
+        Re-renderiza um documento removido do output a partir do registro salvo.
+        Retorna False se não houver registro ou se o template mudou desde o fill
+        (nesse caso o resultado não seria idêntico ao contrato original).
+
+        Re-renderizações do mesmo download_id são serializadas: quem esperou
+        pelo lock encontra os arquivos já gerados e não renderiza de novo.
+        """
+        resolved = self.record_store.resolve_download_id(download_id)
+        if resolved is None:
+            return False
+        record, doc_id = resolved
+
+        lock = _rerender_locks.get(download_id)
+        if lock is None:
+            lock = _rerender_locks[download_id] = asyncio.Lock()
+        async with lock:
+            if await asyncio.to_thread(self._outputs_exist, download_id):
+                return True
+
+            # Versão, documentos e schema do mesmo snapshot do template
+            entry = TemplateService.get_template(record.template_id)
+            if entry.version != record.template_version:
+                logger.warning(
+                    "Template '%s' mudou desde o fill; não é possível re-renderizar %s",
+                    record.template_id,
+                    download_id,
+                )
+                return False
+            document = next((d for d in entry.documents if d.id == doc_id), None)
+            if document is None:
+                return False
+            with start_span("rerender_from_record", template_id=record.template_id, doc_id=doc_id,
+                            document_id=record.document_id):
+                prepared = self.filler.prepare_fields(build_fields_to_fill(record.fields), entry.schema)
+                await self.render_document(record.document_id, document, prepared)
+            return True
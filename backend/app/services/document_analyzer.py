@@ -1,19 +1,32 @@
 """
 Serviço principal para análise de documentos
 Combina parser e IA para gerar análise completa
+
+Campos que seguem as convenções de nome são classificados por regras
+(field_classifier.py); só os ambíguos são enviados à IA. Análises já feitas
+ficam no cache persistente (analysis_cache.py): o mesmo texto, com os mesmos
+placeholders, modelo e versão do prompt, é respondido do disco sem chamar a
+OpenAI.
 """
+import logging
 import os
-from typing import List
+from typing import List, Optional
 from app.services.document_parser import DocumentParser
-from app.services.ai_analyzer import AIAnalyzer
-from app.models.schemas import AnalysisResponse, FieldInfo
+from app.services.ai_analyzer import PROMPT_VERSION, AIAnalyzer, get_model_name
+from app.services.analysis_cache import AnalysisCache, analysis_cache
+from app.services.field_classifier import CLASSIFIER_VERSION, FieldClassifier
+from app.models.schemas import AnalysisResponse, FieldInfo, SectionInfo
+
+logger = logging.getLogger(__name__)
 
 
 class DocumentAnalyzer:
     """Orquestra a análise completa do documento"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[AnalysisCache] = None):
         self.parser = DocumentParser()
+        self.cache = cache or analysis_cache
+        self.classifier = FieldClassifier()
         # Inicializar AIAnalyzer apenas quando necessário (lazy loading)
         self._ai_analyzer = None
     
@@ -30,57 +43,78 @@ class DocumentAnalyzer:
         """
         try:
             # Extrair texto
-            print(f"Extraindo texto do documento: {docx_path}")
+            logger.debug("Extraindo texto do documento: %s", docx_path)
             document_text = self.parser.extract_text(docx_path)
             
             if not document_text or len(document_text.strip()) == 0:
                 raise ValueError("O documento está vazio ou não pôde ser lido corretamente")
             
-            print(f"Texto extraído: {len(document_text)} caracteres")
+            logger.debug("Texto extraído: %d caracteres", len(document_text))
             
-            # Encontrar placeholders
-            placeholder_matches = self.parser.find_placeholders(document_text)
-            print(f"Placeholders encontrados: {len(placeholder_matches)}")
+            # Encontrar placeholders direto no XML (inclui cabeçalhos, rodapés
+            # e caixas de texto); o contexto é o texto do parágrafo
+            placeholders = self.parser.scan_placeholders(docx_path)
+            logger.debug("Placeholders encontrados: %d", len(placeholders))
             
-            # Preparar dados dos placeholders com contexto
-            placeholders = []
-            for placeholder_text, start, end in placeholder_matches:
-                context = self.parser.get_context_around_placeholder(
-                    document_text, start, end
-                )
-                placeholders.append({
-                    "text": placeholder_text,
-                    "start": start,
-                    "end": end,
-                    "context": context
-                })
+            # Gerar document_id a partir do caminho do arquivo
+            document_id = os.path.basename(docx_path).replace('.docx', '')
             
-            # Usar IA para análise inteligente
-            print("Iniciando análise com IA...")
-            print(f"Documento tem {len(document_text)} caracteres")
-            print(f"Encontrados {len(placeholders)} placeholders para analisar")
+            cache_key = self.cache.make_key(
+                document_text, (p["text"] for p in placeholders), get_model_name(),
+                f"{PROMPT_VERSION}+rules{CLASSIFIER_VERSION}",
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("Análise encontrada no cache (%s), sem chamar a IA", cache_key[:12])
+                return cached.model_copy(update={"document_id": document_id})
             
             import time
             start_time = time.time()
-            fields = await self.ai_analyzer.analyze_fields(document_text, placeholders)
+            
+            # Caminho rápido: campos que seguem as convenções de nome são
+            # classificados por regras; só os ambíguos vão para a IA
+            fields, ambiguous = self.classifier.classify_placeholders(placeholders)
+            cacheable = True
+            logger.info("Campos classificados por regras: %d; ambíguos: %d", len(fields), len(ambiguous))
+            
+            if ambiguous:
+                # Usar IA para análise inteligente
+                logger.info(
+                    "Iniciando análise com IA: %d placeholder(s), documento com %d caracteres",
+                    len(ambiguous),
+                    len(document_text),
+                )
+                ai_fields = await self.ai_analyzer.analyze_fields(document_text, ambiguous)
+                cacheable = not AIAnalyzer.is_fallback(ai_fields)
+                known = {f.field_id for f in fields}
+                fields.extend(f for f in ai_fields if f.field_id not in known)
+            
+            # Ordem de aparição no documento
+            first_seen = {}
+            for index, placeholder in enumerate(placeholders):
+                first_seen.setdefault(placeholder["text"], index)
+            fields.sort(key=lambda f: first_seen.get(f.original_text, len(placeholders)))
+            
             elapsed_time = time.time() - start_time
-            print(f"Análise concluída em {elapsed_time:.2f} segundos")
-            print(f"Campos identificados: {len(fields)}")
+            logger.info("Análise concluída em %.2f segundos: %d campos identificados", elapsed_time, len(fields))
             
             # Extrair seções únicas
-            sections = list(set([f.section for f in fields if f.section]))
-            
-            # Gerar document_id a partir do caminho do arquivo
-            document_id = os.path.basename(docx_path).replace('.docx', '')
+            sections = {}
+            for f in fields:
+                if f.section:
+                    section_id = f.section_id or f.section
+                    sections.setdefault(section_id, SectionInfo(id=section_id, name=f.section))
+            sections = list(sections.values())
             
-            return AnalysisResponse(
+            response = AnalysisResponse(
                 document_id=document_id,
                 fields=fields,
                 sections=sections,
                 total_fields=len(fields)
             )
+            if cacheable:
+                self.cache.set(cache_key, response)
+            return response
         except Exception as e:
-            print(f"Erro em analyze_document: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+            logger.exception("Erro em analyze_document: %s", e)
             raise
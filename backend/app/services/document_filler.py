@@ -1,51 +1,170 @@
 """
 Serviço para preencher documentos DOCX com dados do formulário
 """
+import hashlib
+import json
+import logging
 import os
 import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
 from docx import Document
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from docx.enum.table import WD_CELL_VERTICAL_ALIGNMENT
-from typing import Dict, Any, Optional
+from typing import Dict, Any, FrozenSet, List, Optional
 import re
 from app.services.document_storage import DocumentStorage
+from app.services.field_formatter import FieldFormatter
 from app.services.field_validator import FieldValidator
-from app.services.contract_schema import ROTA_DO_SOL_SCHEMA, FieldType
+from app.services.metrics import CACHE_REQUESTS, FILL_STAGE_SECONDS
+from app.services.placeholder_scanner import PLACEHOLDER_RE
+from app.services.tracing import start_span
+from app.services.contract_schema import ROTA_DO_SOL_SCHEMA, FieldDefinition, FieldType
+
+logger = logging.getLogger(__name__)
+
+_W_P, _W_R, _W_T = qn("w:p"), qn("w:r"), qn("w:t")
+
+
+class PreparedFields:
+    """
+    Resultado do estágio de validação + formatação de um payload.
+    Compartilhado por todos os documentos de uma requisição (e por retries).
+    """
+
+    def __init__(self, fields: Dict[str, Any], formatted: Dict[str, str], buyer_type: Optional[str]):
+        self.fields = fields
+        self.formatted = formatted
+        self.buyer_type = buyer_type
 
 
 class DocumentFiller:
     """Preenche campos em documentos DOCX"""
+
+    # Quantidade de payloads preparados mantidos em cache (LRU)
+    PREPARED_CACHE_SIZE = 128
+
+    # Única parte do DOCX onde os placeholders são substituídos: todos os
+    # parágrafos do corpo (tabelas, inclusive aninhadas, caixas de texto,
+    # controles de conteúdo e hyperlinks), os mesmos que o placeholder_scanner
+    # indexa; cabeçalhos, rodapés e notas ficam como no template
+    BODY_PART = "word/document.xml"
     
     def __init__(self):
         self.storage = DocumentStorage()
         self.validator = FieldValidator()
+        self.formatter = FieldFormatter()
+        # (id(schema), hash do payload) -> (schema, resultado); o schema fica
+        # na entrada para conferir a identidade, como em FieldValidator.compile
+        self._prepared_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._prepared_lock = threading.Lock()
+
+    @staticmethod
+    def _payload_hash(fields: Dict[str, Any]) -> str:
+        data = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def prepare_fields(self, fields: Dict[str, Any],
+                       schema: Optional[Dict[str, FieldDefinition]] = None) -> PreparedFields:
+        """
+        Valida e formata o payload uma única vez, antes de qualquer I/O de template.
+        Levanta FieldValidationError com todos os campos inválidos.
+
+        O resultado é memorizado pelo hash do payload, então os documentos de
+        uma mesma requisição e os retries reaproveitam o mesmo trabalho.
+        """
+        if schema is None:
+            schema = ROTA_DO_SOL_SCHEMA
+        key = (id(schema), self._payload_hash(fields))
+        with self._prepared_lock:
+            cached = self._prepared_cache.get(key)
+            if cached is not None and cached[0] is schema:
+                self._prepared_cache.move_to_end(key)
+                CACHE_REQUESTS.inc(cache="prepared_fields", result="hit")
+                return cached[1]
+        CACHE_REQUESTS.inc(cache="prepared_fields", result="miss")
+
+        with FILL_STAGE_SECONDS.time(stage="validate"):
+            self.validator.validate_fields(fields, schema)
+        with FILL_STAGE_SECONDS.time(stage="format"):
+            prepared = PreparedFields(
+                fields=dict(fields),
+                formatted=self._format_all_fields(fields, schema),
+                buyer_type=self._detect_buyer_type(fields),
+            )
+
+        with self._prepared_lock:
+            self._prepared_cache[key] = (schema, prepared)
+            while len(self._prepared_cache) > self.PREPARED_CACHE_SIZE:
+                self._prepared_cache.popitem(last=False)
+        return prepared
     
-    def fill_document_from_path(self, template_path: str, fields: Dict[str, Any]) -> Document:
+    def unresolved_placeholders(self, placeholder_parts: Dict[str, FrozenSet[str]],
+                                prepared: PreparedFields) -> List[str]:
         """
-        Preenche um documento a partir do caminho do template.
+        Placeholders que sobrariam no documento preenchido, calculados pelo
+        índice do template (campo -> partes do DOCX, ver TemplateDocument)
+        em vez de varrer o XML gerado: campos sem valor no payload, exceto os
+        da seção de comprador removida, e campos fora do corpo do documento.
+        """
+        removed_prefix = {"PF": "COMPRADOR_PJ_", "PJ": "COMPRADOR_PF_"}.get(prepared.buyer_type)
+        unresolved = []
+        for field_id, parts in placeholder_parts.items():
+            if parts == {self.BODY_PART}:
+                if field_id in prepared.formatted:
+                    continue
+                if removed_prefix and field_id.startswith(removed_prefix):
+                    continue
+            unresolved.append(field_id)
+        return sorted(unresolved)
+
+    def fill_document_from_path(self, template_path, fields: Dict[str, Any],
+                                prepared: Optional[PreparedFields] = None) -> Document:
+        """
+        Preenche um documento a partir do caminho do template (ou de um
+        stream com o DOCX, ex.: bytes em cache do TemplateRegistry).
         Retorna o documento preenchido (Document) sem salvar.
+
+        Se prepared não for informado, os campos são validados e formatados
+        aqui (antes de carregar o template).
         """
+        if prepared is None:
+            prepared = self.prepare_fields(fields)
+
+        with start_span("fill_document_from_path", fields=len(prepared.fields),
+                        buyer_type=prepared.buyer_type) as span:
+            if span.recording and hasattr(template_path, "getbuffer"):
+                span.set_attribute("template.bytes", template_path.getbuffer().nbytes)
+            return self._fill_loaded_template(template_path, prepared)
+
+    def _fill_loaded_template(self, template_path, prepared: PreparedFields) -> Document:
         # Carregar documento do template
-        doc = Document(template_path)
-        
-        # Validar campos antes de preencher
-        self.validator.validate_fields(fields)
+        with FILL_STAGE_SECONDS.time(stage="template_load"):
+            doc = Document(template_path)
         
         # Detectar tipo de comprador (PF ou PJ) e remover seção não utilizada
-        buyer_type = self._detect_buyer_type(fields)
-        if buyer_type:
-            self._remove_unused_buyer_section(doc, buyer_type)
+        if prepared.buyer_type:
+            with FILL_STAGE_SECONDS.time(stage="buyer_section"):
+                self._remove_unused_buyer_section(doc, prepared.buyer_type)
         
         # Preencher campos no documento
-        self._replace_fields_in_document(doc, fields, field_mapping=None)
-        
-        # Corrigir textos verticais PRIMEIRO (antes de outras formatações)
-        # Isso é importante para garantir que a tabela "VISTO DO COMPRADOR" seja corrigida
-        self._fix_vertical_text(doc)
-        
-        # Ajustar formatação das linhas de assinatura
-        self._format_signature_lines(doc)
+        with FILL_STAGE_SECONDS.time(stage="substitution"):
+            self._replace_fields_in_document(doc, prepared.fields, field_mapping=None,
+                                             formatted_fields=prepared.formatted)
+        
+        with FILL_STAGE_SECONDS.time(stage="layout_fixes"):
+            # Corrigir textos verticais PRIMEIRO (antes de outras formatações)
+            # Isso é importante para garantir que a tabela "VISTO DO COMPRADOR" seja corrigida
+            self._fix_vertical_text(doc)
+            
+            # Ajustar formatação das linhas de assinatura
+            self._format_signature_lines(doc)
         
         return doc
     
@@ -58,59 +177,76 @@ class DocumentFiller:
         field_mapping: mapeamento field_id -> original_text para substituição precisa
         Retorna o ID do documento preenchido
         """
+        # Validar e formatar campos antes de carregar o documento
+        prepared = self.prepare_fields(fields)
+
         # Carregar documento original
         doc = Document(original_path)
         
-        # Validar campos antes de preencher
-        self.validator.validate_fields(fields)
-        
         # Preencher campos no documento
-        self._replace_fields_in_document(doc, fields, field_mapping)
+        self._replace_fields_in_document(doc, fields, field_mapping,
+                                         formatted_fields=prepared.formatted)
         
         # Salvar documento preenchido
         filled_document_id = f"{original_document_id}_filled"
         filled_path = self.storage.get_filled_file_path(filled_document_id)
         
-        print(f"Salvando documento preenchido em: {filled_path}")
+        logger.debug("Salvando documento preenchido em: %s", filled_path)
         doc.save(filled_path)
         
         # Verificar se o arquivo foi salvo corretamente
         import os
         if os.path.exists(filled_path):
             file_size = os.path.getsize(filled_path)
-            print(f"Documento salvo com sucesso! Tamanho: {file_size} bytes")
+            logger.debug("Documento salvo (%d bytes)", file_size)
         else:
-            print(f"ERRO: Arquivo não foi salvo em {filled_path}")
+            logger.error("Arquivo não foi salvo em %s", filled_path)
         
         return filled_document_id
     
     def _replace_fields_in_document(self, doc: Document, 
                                     fields: Dict[str, Any],
-                                    field_mapping: Optional[Dict[str, str]] = None):
+                                    field_mapping: Optional[Dict[str, str]] = None,
+                                    formatted_fields: Optional[Dict[str, str]] = None):
         """
         Substitui placeholders {{CAMPO}} no documento pelos valores fornecidos
         """
-        # Formatar valores antes de substituir
-        formatted_fields = self._format_all_fields(fields)
-        
-        # Substituir em parágrafos
-        for para in doc.paragraphs:
-            self._replace_in_paragraph(para, formatted_fields)
-        
-        # Substituir em tabelas (CUIDADO: não quebrar formatação)
-        # Só processar células que contêm placeholders para evitar quebrar formatação de tabelas
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs:
-                        # Só substituir se houver placeholder
-                        if '{{' in para.text:
-                            self._replace_in_paragraph(para, formatted_fields)
+        # Formatar valores antes de substituir (se ainda não vieram formatados)
+        if formatted_fields is None:
+            formatted_fields = self._format_all_fields(fields)
+        
+        # Substituir em todos os parágrafos do corpo: nível superior, células
+        # de tabelas (inclusive aninhadas) e caixas de texto. A lista é montada
+        # antes, pois a substituição altera os runs durante o percurso.
+        # Só processar parágrafos com placeholder, para não mexer na
+        # formatação dos demais (ex.: tabelas)
+        for p in list(doc.element.body.iter(_W_P)):
+            if '{{' in ''.join(t.text or '' for t in p.iter(_W_T)):
+                self._replace_in_paragraph(Paragraph(p, doc._body), formatted_fields)
+    
+    @staticmethod
+    def _own_runs(paragraph) -> List[Run]:
+        """
+        Runs do parágrafo, inclusive os de hyperlinks, controles de conteúdo
+        (w:sdt) e revisões, sem os runs de parágrafos aninhados (caixas de texto)
+        """
+        p = paragraph._p
+        return [
+            Run(r, paragraph) for r in p.iter(_W_R)
+            if next(r.iterancestors(_W_P), None) is p
+        ]
     
     def _replace_in_paragraph(self, paragraph, fields: Dict[str, str]):
         """
         Substitui placeholders mantendo a formatação do parágrafo
         """
+        own_runs = self._own_runs(paragraph)
+        if len(own_runs) != len(paragraph.runs):
+            # Há runs dentro de hyperlinks/controles de conteúdo: substituir
+            # sem mover texto entre eles
+            self._replace_across_runs(own_runs, fields)
+            return
+        
         # Combinar todos os runs em um texto único
         full_text = ''.join([run.text for run in paragraph.runs])
         
@@ -151,80 +287,42 @@ class DocumentFiller:
                 # Se não há runs, adicionar texto diretamente
                 paragraph.text = new_text
     
-    def _format_all_fields(self, fields: Dict[str, Any]) -> Dict[str, str]:
+    @staticmethod
+    def _replace_across_runs(runs: List[Run], fields: Dict[str, str]):
         """
-        Formata todos os campos conforme seu tipo
+        Substitui cada placeholder no run onde ele começa e remove o restante
+        dele dos runs seguintes (placeholders quebrados entre runs). O texto
+        fora dos placeholders fica no run (e no hyperlink/controle) de origem.
         """
-        formatted = {}
-        
-        for field_id, value in fields.items():
-            if field_id in ROTA_DO_SOL_SCHEMA:
-                field_def = ROTA_DO_SOL_SCHEMA[field_id]
-                formatted[field_id] = self._format_value(value, field_def.type)
-            else:
-                formatted[field_id] = str(value) if value is not None else ''
-        
-        return formatted
+        texts = [run.text for run in runs]
+        original = list(texts)
+        starts = [0, *accumulate(len(t) for t in texts)][:-1]
+        matches = [m for m in PLACEHOLDER_RE.finditer(''.join(texts)) if m.group(1) in fields]
+        # Do fim para o início: as posições dos placeholders anteriores continuam válidas
+        for match in reversed(matches):
+            first = bisect_right(starts, match.start()) - 1
+            last = bisect_right(starts, match.end() - 1) - 1
+            for i in range(last, first - 1, -1):
+                begin = max(match.start() - starts[i], 0)
+                end = min(match.end() - starts[i], len(texts[i]))
+                value = str(fields[match.group(1)]) if i == first else ''
+                texts[i] = texts[i][:begin] + value + texts[i][end:]
+        for run, before, text in zip(runs, original, texts):
+            if text != before:
+                run.text = text
+    
+    def _format_all_fields(self, fields: Dict[str, Any],
+                           schema: Optional[Dict[str, FieldDefinition]] = None) -> Dict[str, str]:
+        """
+        Formata todos os campos conforme seu tipo (formatadores compilados por schema)
+        """
+        return self.formatter.format_fields(fields, schema)
     
     def _format_value(self, value: Any, field_type: FieldType) -> str:
         """
         Formata um valor conforme seu tipo
         """
-        if value is None or value == '':
-            return ''
-        
-        value_str = str(value)
-        
-        if field_type == FieldType.CPF:
-            # Remove não-numéricos e formata
-            digits = re.sub(r'\D', '', value_str)
-            if len(digits) == 11:
-                return f'{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}'
-            return value_str
-        
-        elif field_type == FieldType.CNPJ:
-            digits = re.sub(r'\D', '', value_str)
-            if len(digits) == 14:
-                return f'{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}'
-            return value_str
-        
-        elif field_type == FieldType.CEP:
-            digits = re.sub(r'\D', '', value_str)
-            if len(digits) == 8:
-                return f'{digits[:5]}-{digits[5:]}'
-            return value_str
-        
-        elif field_type == FieldType.CURRENCY:
-            # IMPORTANTE: NÃO adicionar "R$ " pois já está no template
-            try:
-                # Limpar valor e converter
-                clean_value = re.sub(r'[^\d,.]', '', value_str)
-                clean_value = clean_value.replace(',', '.')
-                num = float(clean_value)
-                # Formatar sem o prefixo R$
-                formatted = f'{num:,.2f}'
-                # Converter para formato brasileiro (1.234,56)
-                formatted = formatted.replace(',', 'X').replace('.', ',').replace('X', '.')
-                return formatted
-            except:
-                return value_str
-        
-        elif field_type == FieldType.PHONE:
-            digits = re.sub(r'\D', '', value_str)
-            if len(digits) == 9:
-                return f'{digits[:5]}-{digits[5:]}'
-            elif len(digits) == 8:
-                return f'{digits[:4]}-{digits[4:]}'
-            return value_str
-        
-        elif field_type == FieldType.DATE:
-            # Converter de YYYY-MM-DD para DD/MM/YYYY se necessário
-            if re.match(r'^\d{4}-\d{2}-\d{2}$', value_str):
-                parts = value_str.split('-')
-                return f'{parts[2]}/{parts[1]}/{parts[0]}'
-            return value_str
-        
-        return value_str
+        return self.formatter.format_value(value, field_type)
     
     def _detect_buyer_type(self, fields: Dict[str, Any]) -> Optional[str]:
         """
@@ -274,7 +372,7 @@ class DocumentFiller:
         
         # Se não encontrou a seção, não remover nada (proteção)
         if comprador_section_start == -1:
-            print("AVISO: Seção '1. COMPRADOR(ES):' não encontrada. Não removendo nada.")
+            logger.warning("Seção '1. COMPRADOR(ES):' não encontrada. Não removendo nada.")
             return
         
         # Só processar parágrafos APÓS o início da seção de compradores
@@ -442,9 +540,10 @@ class DocumentFiller:
                                 # Juntar todas as linhas em uma única linha horizontal
                                 horizontal_text = ' '.join(lines)
                                 
-                                print(f"Corrigindo texto vertical na tabela {table_idx}, linha {row_idx}, celula {cell_idx}:")
-                                print(f"  Original (vertical): {repr(para_text[:100])}")
-                                print(f"  Convertido (horizontal): {horizontal_text[:100]}")
+                                logger.debug(
+                                    "Corrigindo texto vertical na tabela %d, linha %d, célula %d: %r",
+                                    table_idx, row_idx, cell_idx, para_text[:100],
+                                )
                                 
                                 # Preservar formatação do primeiro run
                                 if para.runs:
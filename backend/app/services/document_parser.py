@@ -4,6 +4,7 @@ Serviço para extração de texto e identificação de placeholders em DOCX
 import re
 from docx import Document
 from typing import List, Dict, Tuple
+from app.services.placeholder_scanner import iter_placeholders
 
 
 class DocumentParser:
@@ -80,6 +81,29 @@ class DocumentParser:
         
         return placeholders
     
+    def scan_placeholders(self, docx_path: str) -> List[Dict]:
+        """
+        Encontra os placeholders {{CAMPO}} direto no XML do DOCX (documento,
+        cabeçalhos, rodapés e caixas de texto), em streaming, sem carregar o
+        documento com python-docx. Encontra placeholders quebrados em vários
+        runs e informa a localização de cada ocorrência no documento:
+        parte (ex.: word/header1.xml), parágrafo e runs.
+        """
+        placeholders = []
+        for location in iter_placeholders(docx_path):
+            placeholders.append({
+                "field_id": location.field_id,
+                "original_text": location.original_text,
+                "text": location.original_text,
+                "part": location.part,
+                "paragraph": location.paragraph,
+                "run_start": location.run_start,
+                "run_end": location.run_end,
+                "offset": location.offset,
+                "context": location.text,
+            })
+        return placeholders
+    
     def validate_placeholders(self, found_placeholders: List[Dict], 
                                expected_fields: List[str]) -> Dict:
         """
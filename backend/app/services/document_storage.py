@@ -1,37 +1,145 @@
 """
 Serviço para gerenciamento de armazenamento temporário de documentos
+
+Os arquivos temporários (uploads, DOCX intermediários) ficam sempre no disco
+local (TEMP_DIR). Os artefatos finais (PDF/DOCX) ficam no backend configurado
+em STORAGE_BACKEND (ver storage_backends.py), sob o prefixo "output/".
+
+Uploads são gravados em blocos (sem carregar o arquivo em memória), com o
+sha256 calculado durante a escrita, e recusados acima de UPLOAD_MAX_MB ou
+quando o zip do DOCX declara conteúdo descompactado acima de
+UPLOAD_MAX_UNCOMPRESSED_MB ou mais de UPLOAD_MAX_ZIP_ENTRIES entradas
+(proteção contra zip bombs), antes de qualquer parsing. Uploads idênticos
+compartilham um único blob (TEMP_DIR/blobs/<sha256>.docx), ligado por
+hardlink ao caminho de cada document_id.
 """
+import hashlib
+import logging
 import os
+import shutil
+import zipfile
 import aiofiles
 import time
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterator, List, Optional
 from fastapi import UploadFile
 
+from app.services.storage_backends import (
+    CHUNK_SIZE,
+    StorageBackend,
+    StorageObject,
+    get_storage_backend,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class UploadRejected(ValueError):
+    """Upload recusado (tamanho, zip inválido ou zip bomb)"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class DocumentStorage:
     """Gerencia o armazenamento temporário de documentos"""
+
+    OUTPUT_PREFIX = "output"
+    BLOBS_DIR = "blobs"
     
-    def __init__(self, temp_dir: str = "./temp"):
-        self.temp_dir = Path(temp_dir)
-        self.output_dir = Path("./output")
-        self.temp_dir.mkdir(exist_ok=True)
-        self.output_dir.mkdir(exist_ok=True)
-        print(f"DocumentStorage inicializado. Diretório temp: {self.temp_dir.absolute()}")
-        print(f"DocumentStorage inicializado. Diretório output: {self.output_dir.absolute()}")
+    def __init__(self, temp_dir: Optional[str] = None, backend: Optional[StorageBackend] = None):
+        self.backend = backend or get_storage_backend()
+        self.temp_dir = Path(temp_dir or os.getenv("TEMP_DIR", "./temp"))
+        if self.backend.is_remote:
+            # Backend remoto: os artefatos são gerados em uma área local de
+            # staging e enviados ao backend por publish_output()
+            self.output_dir = self.temp_dir / "output"
+        else:
+            self.output_dir = self.backend.path_for(self.OUTPUT_PREFIX)
+        self.blobs_dir = self.temp_dir / self.BLOBS_DIR
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.upload_max_bytes = int(float(os.getenv("UPLOAD_MAX_MB", "20")) * 1024 * 1024)
+        self.upload_max_uncompressed = int(float(os.getenv("UPLOAD_MAX_UNCOMPRESSED_MB", "200")) * 1024 * 1024)
+        self.upload_max_entries = int(os.getenv("UPLOAD_MAX_ZIP_ENTRIES", "2000"))
+        logger.debug("DocumentStorage: temp em %s, output em %s",
+                     self.temp_dir.absolute(), self.output_dir.absolute())
     
     async def save_uploaded_file(self, document_id: str, file: UploadFile) -> str:
         """
         Salva um arquivo enviado e retorna o caminho completo
+
+        O conteúdo é gravado em blocos num arquivo temporário, com limite de
+        tamanho e sha256 calculado durante a escrita; depois o zip é
+        verificado (check_docx_archive) e o arquivo vira o blob do hash
+        (ou é descartado, se um upload idêntico já existir).
+        Levanta UploadRejected se o upload for recusado.
         """
+        declared_size = getattr(file, "size", None)
+        if declared_size is not None and declared_size > self.upload_max_bytes:
+            raise self._too_large()
+
+        tmp_path = self.blobs_dir / f".{document_id}.upload"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = await file.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.upload_max_bytes:
+                        raise self._too_large()
+                    digest.update(chunk)
+                    await f.write(chunk)
+            self.check_docx_archive(tmp_path)
+            blob_path = self._store_blob(tmp_path, digest.hexdigest())
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
         file_path = self.temp_dir / f"{document_id}.docx"
-        
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-        
+        file_path.unlink(missing_ok=True)
+        try:
+            os.link(blob_path, file_path)
+        except OSError:
+            # Sistema de arquivos sem hardlink: cópia simples
+            shutil.copyfile(blob_path, file_path)
         return str(file_path)
-    
+
+    def _too_large(self) -> UploadRejected:
+        limit_mb = self.upload_max_bytes / (1024 * 1024)
+        return UploadRejected(f"Arquivo excede o limite de {limit_mb:.0f} MB", status_code=413)
+
+    def _store_blob(self, tmp_path: Path, content_hash: str) -> Path:
+        """Move o upload para o blob do hash; se já existir, reaproveita"""
+        blob_path = self.blobs_dir / f"{content_hash}.docx"
+        if blob_path.exists():
+            os.utime(blob_path)
+        else:
+            os.replace(tmp_path, blob_path)
+        return blob_path
+
+    def check_docx_archive(self, path) -> None:
+        """
+        Verifica o zip de um DOCX sem descompactá-lo: estrutura válida,
+        quantidade de entradas e tamanho descompactado total (declarado no
+        diretório central, que o zipfile respeita ao ler cada entrada).
+        """
+        try:
+            with zipfile.ZipFile(path) as zf:
+                entries = zf.infolist()
+        except (zipfile.BadZipFile, OSError):
+            raise UploadRejected("Arquivo não é um DOCX válido")
+        if len(entries) > self.upload_max_entries:
+            raise UploadRejected(f"DOCX com entradas demais ({len(entries)})", status_code=413)
+        if sum(info.file_size for info in entries) > self.upload_max_uncompressed:
+            raise UploadRejected("Conteúdo descompactado do DOCX excede o limite", status_code=413)
+        if not any(info.filename == "word/document.xml" for info in entries):
+            raise UploadRejected("Arquivo não é um DOCX válido (word/document.xml ausente)")
+
     def get_file_path(self, document_id: str) -> str:
         """
         Retorna o caminho do arquivo baseado no document_id
@@ -82,7 +190,80 @@ class DocumentStorage:
                 file_age = current_time - file_path.stat().st_mtime
                 if file_age > max_age_seconds:
                     file_path.unlink()
+        
+        # Blobs de upload sem nenhum document_id apontando (só o próprio link)
+        for blob_path in self.blobs_dir.glob("*.docx"):
+            st = blob_path.stat()
+            if st.st_nlink <= 1 and current_time - st.st_mtime > max_age_seconds:
+                blob_path.unlink()
     
+    def output_key(self, filename: str) -> str:
+        """Key no backend de um artefato final (ex.: 'output/<id>.pdf')"""
+        return f"{self.OUTPUT_PREFIX}/{os.path.basename(filename)}"
+
+    def publish_output(self, filename: str) -> None:
+        """
+        Disponibiliza no backend um artefato gerado em get_output_dir().
+        No backend local o arquivo já está no lugar (só o hash do conteúdo é
+        registrado); no remoto é enviado em blocos e a cópia local é removida.
+        """
+        local_path = self.output_dir / os.path.basename(filename)
+        self.backend.put_file(self.output_key(filename), str(local_path))
+        if self.backend.is_remote:
+            local_path.unlink()
+
+    def stat_output(self, filename: str) -> Optional[StorageObject]:
+        """Metadados de um artefato final, ou None se não existir"""
+        return self.backend.stat(self.output_key(filename))
+
+    def iter_output(self, filename: str, start: int = 0, end: Optional[int] = None,
+                    chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Lê um artefato final do backend em blocos"""
+        return self.backend.iter_read(self.output_key(filename), start, end, chunk_size)
+
+    def list_outputs(self, name_prefix: str = "", ext: Optional[str] = None) -> List[StorageObject]:
+        """Lista artefatos finais cujo nome começa com name_prefix (e termina com ext)"""
+        objects = self.backend.list(f"{self.OUTPUT_PREFIX}/{name_prefix}")
+        if ext:
+            objects = [o for o in objects if o.key.endswith(ext)]
+        return objects
+
+    def get_output_usage(self) -> int:
+        """
+        Retorna o total de bytes ocupado pelos PDFs/DOCX do armazenamento de saída
+        """
+        return sum(
+            o.size for o in self.list_outputs()
+            if o.key.endswith((".pdf", ".docx"))
+        )
+
+    def evict_output_files(self, max_bytes: int,
+                           can_evict: Callable[[str], bool]) -> List[str]:
+        """
+        Remove os artefatos (PDF/DOCX) mais antigos do output, pela data de
+        gravação (ordem de criação, não de uso), até que o total fique abaixo
+        de max_bytes.
+
+        Só remove arquivos cujo download_id é aceito por can_evict (ex.: os que
+        têm registro para re-renderização). Retorna os keys removidos.
+        """
+        objects = [o for o in self.list_outputs() if o.key.endswith((".pdf", ".docx"))]
+        total = sum(o.size for o in objects)
+
+        removed = []
+        if total <= max_bytes:
+            return removed
+
+        for obj in sorted(objects, key=lambda o: o.modified_at):
+            if total <= max_bytes:
+                break
+            if not can_evict(Path(obj.key).stem):
+                continue
+            self.backend.delete(obj.key)
+            total -= obj.size
+            removed.append(obj.key)
+        return removed
+
     def delete_file(self, document_id: str) -> bool:
         """
         Remove um arquivo do armazenamento temporário
@@ -90,8 +271,6 @@ class DocumentStorage:
         """
         file_path = self.temp_dir / f"{document_id}.docx"
         filled_path = self.temp_dir / f"{document_id}_filled.docx"
-        pdf_path = self.output_dir / f"{document_id}.pdf"
-        docx_out = self.output_dir / f"{document_id}.docx"
         
         deleted = False
         if file_path.exists():
@@ -102,12 +281,8 @@ class DocumentStorage:
             filled_path.unlink()
             deleted = True
         
-        if pdf_path.exists():
-            pdf_path.unlink()
-            deleted = True
-
-        if docx_out.exists():
-            docx_out.unlink()
-            deleted = True
+        for ext in (".pdf", ".docx"):
+            if self.backend.delete(self.output_key(f"{document_id}{ext}")):
+                deleted = True
         
         return deleted
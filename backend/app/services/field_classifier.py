@@ -0,0 +1,217 @@
+"""
+Classificador de campos por regras (caminho rápido antes da IA)
+
+Os placeholders dos templates seguem convenções de nome (*_CPF, *_CEP,
+*_VALOR*, *_EXTENSO, *_DATA*, ...). A partir do nome e do contexto ao redor
+(texto do parágrafo, via DocumentParser.scan_placeholders), tabelas de palavras-chave
+definem tipo, seção e label de cada campo de forma determinística.
+
+Um campo só é considerado classificado quando a seção é conhecida e todas
+as partes do nome estão nas tabelas; os demais (ambíguos) seguem para o
+AIAnalyzer. Na prática, templates que seguem as convenções são analisados
+inteiramente offline.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+from app.models.schemas import FieldInfo, FieldType
+
+# Incrementar ao mudar as tabelas abaixo: invalida o cache de análises
+CLASSIFIER_VERSION = "1"
+
+_FIELD_ID_RE = re.compile(r"^[A-Z][A-Z0-9_]*$")
+
+# Prefixo do field_id -> (section_id, nome da seção, complemento do label)
+SECTION_PREFIXES: List[Tuple[str, Tuple[str, str, str]]] = [
+    ("COMPRADOR_PF", ("COMPRADOR_PF", "Dados do Comprador (Pessoa Física)", "do comprador")),
+    ("COMPRADOR_PJ", ("COMPRADOR_PJ", "Dados do Comprador (Pessoa Jurídica)", "do comprador")),
+    ("COMPRADOR", ("COMPRADOR", "Dados do Comprador", "do comprador")),
+    ("VENDEDOR", ("VENDEDOR", "Dados do Vendedor", "do vendedor")),
+    ("UNIDADE", ("UNIDADE", "Dados da Unidade", "da unidade")),
+    ("IMOVEL", ("UNIDADE", "Dados da Unidade", "do imóvel")),
+    ("PRECO", ("PRECO", "Preço Total", "do preço")),
+    ("COMISSAO", ("COMISSAO", "Comissão de Corretagem", "da comissão")),
+    ("IMOBILIARIA", ("IMOBILIARIA", "Dados da Imobiliária", "da imobiliária")),
+    ("BEM", ("BEM", "Preço do Bem e Entrada", "do bem")),
+    ("PARCELAS", ("PARCELAS", "Parcelamento", "das parcelas")),
+    ("ASSINATURA", ("ASSINATURA", "Data e Local", "da assinatura")),
+    ("TESTEMUNHA", ("TESTEMUNHAS", "Testemunhas", "da testemunha")),
+]
+
+# Palavras do contexto -> prefixo de seção (quando o nome não tem prefixo conhecido)
+CONTEXT_SECTIONS: List[Tuple[str, str]] = [
+    ("COMPRADOR", "COMPRADOR"),
+    ("VENDEDOR", "VENDEDOR"),
+    ("IMOBILIÁRIA", "IMOBILIARIA"),
+    ("CORRETAGEM", "COMISSAO"),
+    ("TESTEMUNHA", "TESTEMUNHA"),
+    ("LOTE", "UNIDADE"),
+    ("IMÓVEL", "UNIDADE"),
+    ("PARCELA", "PARCELAS"),
+]
+
+# Parte do nome -> trecho do label
+WORD_LABELS: Dict[str, str] = {
+    "NOME": "nome", "NACIONALIDADE": "nacionalidade", "ESTADO": "estado", "CIVIL": "civil",
+    "PROFISSAO": "profissão", "RG": "RG", "CPF": "CPF", "CNPJ": "CNPJ", "CEP": "CEP",
+    "RUA": "rua", "LOGRADOURO": "logradouro", "BAIRRO": "bairro", "CIDADE": "cidade",
+    "MUNICIPIO": "município", "UF": "UF", "ENDERECO": "endereço", "COMPLEMENTO": "complemento",
+    "EMAIL": "e-mail", "TELEFONE": "telefone", "CELULAR": "celular", "DDD": "DDD",
+    "NUMERO": "número", "LOTE": "lote", "QUADRA": "quadra", "MATRICULA": "matrícula",
+    "INSCRICAO": "inscrição", "IMOBILIARIA": "imobiliária", "CONFRONTACOES": "confrontações",
+    "AREA": "área", "VALOR": "valor", "TOTAL": "total", "UNITARIO": "unitário",
+    "EXTENSO": "por extenso", "PRECO": "preço", "ENTRADA": "entrada", "PARCELA": "parcela",
+    "PARCELAS": "parcelas", "QTD": "quantidade", "QUANTIDADE": "quantidade",
+    "DATA": "data", "DIA": "dia", "MES": "mês", "ANO": "ano", "PRIMEIRA": "primeira",
+    "VENCIMENTO": "vencimento", "BANCO": "banco", "CODIGO": "código", "AGENCIA": "agência",
+    "CONTA": "conta", "PIX": "chave PIX", "CRECI": "CRECI", "COMPRADOR": "comprador",
+    "VENDEDOR": "vendedor", "TESTEMUNHA": "testemunha", "COMISSAO": "comissão",
+    "BEM": "bem", "ASSINATURA": "assinatura", "RAZAO": "razão", "SOCIAL": "social",
+    "REPRESENTANTE": "representante", "LEGAL": "legal",
+}
+
+# Partes ignoradas no label (tipo de pessoa, já indicado pela seção)
+SKIP_WORDS = frozenset({"PF", "PJ"})
+
+# Regras de tipo, em ordem de prioridade: (partes exigidas, partes proibidas, tipo)
+TYPE_RULES: List[Tuple[frozenset, frozenset, FieldType]] = [
+    (frozenset({"EXTENSO"}), frozenset(), FieldType.TEXT),
+    (frozenset({"CPF"}), frozenset(), FieldType.CPF),
+    (frozenset({"CNPJ"}), frozenset(), FieldType.CNPJ),
+    (frozenset({"CEP"}), frozenset(), FieldType.CEP),
+    (frozenset({"EMAIL"}), frozenset(), FieldType.EMAIL),
+    (frozenset({"PIX"}), frozenset(), FieldType.TEXT),
+    (frozenset({"DDD"}), frozenset(), FieldType.TEXT),
+    (frozenset({"TELEFONE"}), frozenset(), FieldType.PHONE),
+    (frozenset({"CELULAR"}), frozenset(), FieldType.PHONE),
+    (frozenset({"VALOR"}), frozenset(), FieldType.CURRENCY),
+    (frozenset({"DATA", "MES"}), frozenset(), FieldType.TEXT),
+    (frozenset({"DATA", "DIA"}), frozenset(), FieldType.NUMBER),
+    (frozenset({"DATA", "ANO"}), frozenset(), FieldType.NUMBER),
+    (frozenset({"DATA"}), frozenset(), FieldType.DATE),
+    (frozenset({"DIA", "VENCIMENTO"}), frozenset(), FieldType.NUMBER),
+    (frozenset({"QTD"}), frozenset(), FieldType.NUMBER),
+    (frozenset({"QUANTIDADE"}), frozenset(), FieldType.NUMBER),
+    (frozenset({"CONFRONTACOES"}), frozenset(), FieldType.TEXTAREA),
+    # Lote, quadra e número da via aceitam sufixos alfabéticos (15B, 22A)
+    (frozenset({"NUMERO"}), frozenset({"TELEFONE"}), FieldType.TEXT),
+]
+
+TYPE_MASKS: Dict[FieldType, str] = {
+    FieldType.CPF: "999.999.999-99",
+    FieldType.CNPJ: "99.999.999/9999-99",
+    FieldType.CEP: "99999-999",
+    FieldType.PHONE: "99999-9999",
+}
+
+FIELD_OPTIONS: Dict[Tuple[str, ...], List[str]] = {
+    ("ESTADO", "CIVIL"): ["solteiro(a)", "casado(a)", "divorciado(a)", "viúvo(a)", "união estável"],
+    ("UF",): [
+        "AC", "AL", "AP", "AM", "BA", "CE", "DF", "ES", "GO", "MA", "MT", "MS", "MG",
+        "PA", "PB", "PR", "PE", "PI", "RJ", "RN", "RS", "RO", "RR", "SC", "SP", "SE", "TO",
+    ],
+}
+
+
+class FieldClassifier:
+    """Classifica placeholders {{CAMPO}} por convenções de nome e contexto"""
+
+    def _section_for(self, field_id: str, context: str) -> Tuple[Optional[Tuple[str, str, str]], List[str]]:
+        """Seção do campo e as partes do nome que sobram depois do prefixo"""
+        for prefix, section in SECTION_PREFIXES:
+            if field_id == prefix or field_id.startswith(prefix + "_"):
+                rest = field_id[len(prefix) + 1:]
+                return section, rest.split("_") if rest else []
+        context_upper = context.upper()
+        for keyword, prefix in CONTEXT_SECTIONS:
+            if keyword in context_upper:
+                section = dict(SECTION_PREFIXES)[prefix]
+                return section, field_id.split("_")
+        return None, field_id.split("_")
+
+    @staticmethod
+    def _type_for(words: List[str]) -> FieldType:
+        word_set = set(words)
+        for required, forbidden, field_type in TYPE_RULES:
+            if required <= word_set and not (forbidden & word_set):
+                return field_type
+        return FieldType.TEXT
+
+    @staticmethod
+    def _label_for(words: List[str], suffix: str) -> Optional[str]:
+        """
+        Label a partir das partes do nome; None se alguma parte é desconhecida.
+        Números (TESTEMUNHA_1_NOME) vão para o fim: "Nome da testemunha 1".
+        """
+        parts = []
+        numbers = []
+        for word in words:
+            if word in SKIP_WORDS:
+                continue
+            if word.isdigit():
+                numbers.append(word)
+                continue
+            label = WORD_LABELS.get(word)
+            if label is None:
+                return None
+            parts.append(label)
+        if not parts:
+            return None
+        text = " ".join(parts + ([suffix] if suffix else []) + numbers)
+        return text[0].upper() + text[1:]
+
+    def classify(self, field_id: str, context: str = "") -> Optional[FieldInfo]:
+        """
+        Classifica um campo. Retorna None quando o campo é ambíguo
+        (nome fora das convenções ou seção desconhecida).
+        """
+        if not _FIELD_ID_RE.match(field_id):
+            return None
+        section, words = self._section_for(field_id, context)
+        if section is None or not words:
+            return None
+        section_id, section_name, label_suffix = section
+        label = self._label_for(words, label_suffix)
+        if label is None:
+            return None
+        field_type = self._type_for(field_id.split("_"))
+        options = FIELD_OPTIONS.get(tuple(w for w in words if w not in SKIP_WORDS))
+        if options:
+            field_type = FieldType.SELECT
+        return FieldInfo(
+            field_id=field_id,
+            label=label,
+            type=field_type,
+            required=True,
+            original_text=f"{{{{{field_id}}}}}",
+            context=context,
+            section=section_name,
+            section_id=section_id,
+            options=options,
+            mask=TYPE_MASKS.get(field_type),
+        )
+
+    def classify_placeholders(self, placeholders: List[Dict]) -> Tuple[List[FieldInfo], List[Dict]]:
+        """
+        Classifica os placeholders do documento (dicts com "text" = {{CAMPO}}
+        e "context"). Retorna (campos classificados, um por field_id, e os
+        placeholders ambíguos, a enviar para a IA).
+        """
+        classified: Dict[str, FieldInfo] = {}
+        ambiguous: List[Dict] = []
+        ambiguous_ids = set()
+        for placeholder in placeholders:
+            text = placeholder.get("text") or ""
+            field_id = text.strip("{} ")
+            if field_id in classified:
+                continue
+            if field_id in ambiguous_ids:
+                ambiguous.append(placeholder)
+                continue
+            field = self.classify(field_id, placeholder.get("context", ""))
+            if field is None:
+                ambiguous_ids.add(field_id)
+                ambiguous.append(placeholder)
+            else:
+                classified[field_id] = field
+        return list(classified.values()), ambiguous
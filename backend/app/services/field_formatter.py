@@ -0,0 +1,199 @@
+"""
+Formatação dos valores dos campos para inserção no documento
+
+Como os validadores (field_validator.py), os formatadores são compilados uma
+vez por schema de template em uma tabela field_id -> função, com um
+formatador pré-compilado por FieldType. O payload inteiro é formatado em uma
+passada; DocumentFiller.prepare_fields memoriza o resultado por hash do
+payload, então todos os documentos da requisição (e retries) o reaproveitam.
+"""
+import re
+from collections import OrderedDict
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Optional
+
+from app.services.contract_schema import ROTA_DO_SOL_SCHEMA, FieldDefinition, FieldType
+
+_NON_DIGIT_RE = re.compile(r'\D')
+_CURRENCY_CLEAN_RE = re.compile(r'[^\d,.\-]')
+_ISO_DATE_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+
+_CENTS = Decimal('0.01')
+# 1,234,567.89 -> 1.234.567,89
+_BR_SEPARATORS = str.maketrans({',': '.', '.': ','})
+
+
+def _parse_decimal(value: Any) -> Decimal:
+    """
+    Converte um valor monetário em Decimal exato.
+    Aceita números e textos como '1234.56', '1.234,56', '1,234.56' e 'R$ 1.234,56':
+    com os dois separadores, o último é o decimal; só vírgula é decimal;
+    vários pontos sem vírgula são separadores de milhar.
+    """
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        # repr do float ('0.1') e não sua expansão binária
+        return Decimal(repr(value))
+    text = _CURRENCY_CLEAN_RE.sub('', str(value))
+    if ',' in text and '.' in text:
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    elif ',' in text:
+        text = text.replace(',', '.')
+    elif text.count('.') > 1:
+        text = text.replace('.', '')
+    return Decimal(text)
+
+
+def _format_cpf(value_str: str) -> str:
+    digits = _NON_DIGIT_RE.sub('', value_str)
+    if len(digits) == 11:
+        return f'{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}'
+    return value_str
+
+
+def _format_cnpj(value_str: str) -> str:
+    digits = _NON_DIGIT_RE.sub('', value_str)
+    if len(digits) == 14:
+        return f'{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}'
+    return value_str
+
+
+def _format_cep(value_str: str) -> str:
+    digits = _NON_DIGIT_RE.sub('', value_str)
+    if len(digits) == 8:
+        return f'{digits[:5]}-{digits[5:]}'
+    return value_str
+
+
+def _format_phone(value_str: str) -> str:
+    digits = _NON_DIGIT_RE.sub('', value_str)
+    if len(digits) == 9:
+        return f'{digits[:5]}-{digits[5:]}'
+    elif len(digits) == 8:
+        return f'{digits[:4]}-{digits[4:]}'
+    return value_str
+
+
+def _format_date(value_str: str) -> str:
+    # Converter de YYYY-MM-DD para DD/MM/YYYY se necessário
+    match = _ISO_DATE_RE.match(value_str)
+    if match:
+        year, month, day = match.groups()
+        return f'{day}/{month}/{year}'
+    return value_str
+
+
+def format_currency(value: Any) -> str:
+    """
+    Formata valor monetário no padrão brasileiro (1.234,56), com Decimal
+    e arredondamento comercial nos centavos.
+    IMPORTANTE: NÃO adiciona "R$ " pois já está no template.
+    """
+    try:
+        amount = _parse_decimal(value).quantize(_CENTS, rounding=ROUND_HALF_UP)
+    except (InvalidOperation, ValueError):
+        return str(value)
+    return f'{amount:,.2f}'.translate(_BR_SEPARATORS)
+
+
+def _format_text(value_str: str) -> str:
+    return value_str
+
+
+# Formatadores que recebem o valor já como texto
+_TEXT_FORMATTERS: Dict[FieldType, Callable[[str], str]] = {
+    FieldType.CPF: _format_cpf,
+    FieldType.CNPJ: _format_cnpj,
+    FieldType.CEP: _format_cep,
+    FieldType.PHONE: _format_phone,
+    FieldType.DATE: _format_date,
+}
+
+
+def _make_formatter(field_type: Optional[FieldType]) -> Callable[[Any], str]:
+    """Formatador de um tipo (vazio/None vira '')"""
+    if field_type == FieldType.CURRENCY:
+        def format_value(value: Any) -> str:
+            if value is None or value == '':
+                return ''
+            return format_currency(value)
+        return format_value
+
+    text_formatter = _TEXT_FORMATTERS.get(field_type, _format_text)
+
+    def format_value(value: Any) -> str:
+        if value is None or value == '':
+            return ''
+        return text_formatter(str(value))
+    return format_value
+
+
+# Um formatador pré-compilado por FieldType (None = campo fora do schema)
+TYPE_FORMATTERS: Dict[Optional[FieldType], Callable[[Any], str]] = {
+    field_type: _make_formatter(field_type) for field_type in (*FieldType, None)
+}
+
+
+class CompiledFormatter:
+    """Tabela field_id -> formatador compilada a partir de um schema"""
+
+    def __init__(self, schema: Dict[str, FieldDefinition],
+                 formatters: Dict[str, Callable[[Any], str]]):
+        self.schema = schema  # mantém a referência para a chave do cache (id) não ser reutilizada
+        self.formatters = formatters
+
+    def format_all(self, fields: Dict[str, Any]) -> Dict[str, str]:
+        """Formata o payload inteiro em uma passada"""
+        formatters = self.formatters
+        # Campos fora do schema entram como texto
+        untyped = TYPE_FORMATTERS[None]
+        return {
+            field_id: formatters.get(field_id, untyped)(value)
+            for field_id, value in fields.items()
+        }
+
+
+class FieldFormatter:
+    """Compila e mantém em cache os formatadores de cada schema"""
+
+    # Schemas compilados mantidos em cache (LRU), como em FieldValidator
+    COMPILED_CACHE_SIZE = 16
+
+    def __init__(self):
+        self._compiled: "OrderedDict[int, CompiledFormatter]" = OrderedDict()
+
+    def compile(self, schema: Optional[Dict[str, FieldDefinition]] = None) -> CompiledFormatter:
+        """
+        Retorna a tabela de formatadores do schema, compilando apenas na primeira vez
+        """
+        if schema is None:
+            schema = ROTA_DO_SOL_SCHEMA
+        compiled = self._compiled.get(id(schema))
+        if compiled is not None and compiled.schema is schema:
+            self._compiled.move_to_end(id(schema))
+            return compiled
+
+        formatters = {
+            field_id: TYPE_FORMATTERS[field_def.type]
+            for field_id, field_def in schema.items()
+        }
+        compiled = CompiledFormatter(schema, formatters)
+        self._compiled[id(schema)] = compiled
+        while len(self._compiled) > self.COMPILED_CACHE_SIZE:
+            self._compiled.popitem(last=False)
+        return compiled
+
+    def format_fields(self, fields: Dict[str, Any],
+                      schema: Optional[Dict[str, FieldDefinition]] = None) -> Dict[str, str]:
+        return self.compile(schema).format_all(fields)
+
+    @staticmethod
+    def format_value(value: Any, field_type: Optional[FieldType]) -> str:
+        """Formata um valor isolado conforme seu tipo"""
+        return TYPE_FORMATTERS.get(field_type, TYPE_FORMATTERS[None])(value)
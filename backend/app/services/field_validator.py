@@ -1,55 +1,318 @@
 """
 Serviço para validação de campos do formulário
+
+Os validadores são compilados uma vez por schema de template em uma tabela
+field_id -> função, usando o tipo declarado em FieldDefinition.type (só os
+COMPILED_CACHE_SIZE schemas usados mais recentemente ficam em cache). Campos
+fora do schema (ex.: VENDEDOR_*) continuam com o tipo inferido pelo field_id,
+a cada chamada: são chaves enviadas pelo cliente e não entram na tabela.
+
+Para importações em lote (planilhas com milhares de compradores) há também
+uma API por coluna (validate_columns), que calcula os dígitos verificadores
+de CPF/CNPJ e o tamanho de CEP com aritmética de arrays NumPy.
 """
 import re
-from typing import Dict, Any
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+from app.services.contract_schema import ROTA_DO_SOL_SCHEMA, FieldDefinition, FieldType
+
+_NON_DIGIT_RE = re.compile(r'\D')
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_DATE_RES = (
+    re.compile(r'^\d{2}/\d{2}/\d{4}$'),
+    re.compile(r'^\d{4}-\d{2}-\d{2}$'),
+)
+
+
+class FieldValidationError(ValueError):
+    """Erro de validação com todos os campos inválidos (field_id -> mensagem)"""
+
+    def __init__(self, errors: Dict[str, str]):
+        self.errors = errors
+        super().__init__("; ".join(f"Campo '{field_id}': {msg}" for field_id, msg in errors.items()))
+
+
+# Pesos dos dígitos verificadores
+_CPF_WEIGHTS_1 = np.arange(10, 1, -1)            # 10..2 sobre os 9 primeiros dígitos
+_CPF_WEIGHTS_2 = np.arange(11, 1, -1)            # 11..2 sobre os 10 primeiros dígitos
+_CNPJ_WEIGHTS_1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+_CNPJ_WEIGHTS_2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or (isinstance(value, str) and value.strip() == "")
+
+
+def _check_digit(weighted_sum):
+    """Dígito verificador módulo 11 (resto < 2 -> 0); aceita escalar ou array"""
+    remainder = weighted_sum % 11
+    return np.where(remainder < 2, 0, 11 - remainder)
+
+
+def _ascii_digits(text: str) -> bytes:
+    """
+    Bytes ASCII com os mesmos dígitos que _NON_DIGIT_RE enxerga: dígitos
+    Unicode (ex.: '٣') viram o ASCII equivalente e o resto dos caracteres
+    não ASCII vira '?', contado como não dígito como na validação por valor.
+    """
+    if text.isascii():
+        return text.encode("ascii")
+    return "".join(
+        str(unicodedata.decimal(c)) if c.isdecimal() else (c if c.isascii() else "?")
+        for c in text
+    ).encode("ascii")
+
+
+def _digit_matrix(values: Sequence[Any], length: int):
+    """
+    Converte uma coluna de valores em uma matriz (n, length) de dígitos.
+
+    Os valores viram uma matriz de bytes; os não dígitos (pontos, traços,
+    barras, espaços) são empurrados para o fim de cada linha com uma
+    ordenação estável, sem regex por valor. Retorna (dígitos, quantidade de
+    dígitos por valor, máscara de vazios).
+    """
+    raw = [b"" if _is_empty(v) else _ascii_digits(str(v)) for v in values]
+    empty = np.fromiter((_is_empty(v) for v in values), dtype=bool, count=len(raw))
+    width = max([length, *map(len, raw)])
+    chars = np.array(raw, dtype=f"S{width}").view(np.uint8).reshape(len(raw), width)
+    is_digit = (chars >= ord("0")) & (chars <= ord("9"))
+    counts = is_digit.sum(axis=1)
+    order = np.argsort(~is_digit, axis=1, kind="stable")
+    digits = np.take_along_axis(chars, order, axis=1)[:, :length].astype(np.int64) - ord("0")
+    return digits, counts, empty
+
+
+class BulkValidationResult:
+    """Resultado da validação de uma coluna: máscara de válidos e erros por índice"""
+
+    def __init__(self, valid: np.ndarray, errors: Dict[int, str]):
+        self.valid = valid
+        self.errors = errors
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    @property
+    def all_valid(self) -> bool:
+        return not self.errors
+
+
+class CompiledValidator:
+    """Tabela field_id -> validador compilada a partir de um schema"""
+
+    def __init__(self, schema: Dict[str, FieldDefinition],
+                 validators: Dict[str, Optional[Callable[[Any], None]]],
+                 fallback: Callable[[str, Any], Optional[Callable[[Any], None]]]):
+        self.schema = schema  # mantém a referência para a chave do cache (id) não ser reutilizada
+        self.validators = validators
+        self._fallback = fallback
+
+    def collect_errors(self, fields: Dict[str, Any]) -> Dict[str, str]:
+        """Valida todos os campos em uma passada e retorna os erros (vazio se tudo ok)"""
+        errors: Dict[str, str] = {}
+        validators = self.validators
+        for field_id, value in fields.items():
+            # Pular campos vazios ou None (não são obrigatórios para validação)
+            if _is_empty(value):
+                continue
+            if field_id in validators:
+                validator = validators[field_id]
+            else:
+                # Campo fora do schema: inferir o tipo sem memorizar (as chaves
+                # vêm do cliente e fariam a tabela crescer sem limite)
+                validator = self._fallback(field_id, value)
+            if validator is None:
+                continue
+            try:
+                validator(value)
+            except ValueError as e:
+                errors[field_id] = str(e)
+        return errors
 
 
 class FieldValidator:
     """Valida valores de campos conforme seus tipos"""
-    
-    def validate_fields(self, fields: Dict[str, Any]):
+
+    # Schemas compilados mantidos em cache (LRU): cada recarga de template
+    # gera um schema novo
+    COMPILED_CACHE_SIZE = 16
+
+    def __init__(self):
+        self._compiled: "OrderedDict[int, CompiledValidator]" = OrderedDict()
+        self._type_validators: Dict[FieldType, Callable[[Any], None]] = {
+            FieldType.CPF: self._validate_cpf,
+            FieldType.CNPJ: self._validate_cnpj,
+            FieldType.CEP: self._validate_cep,
+            FieldType.EMAIL: self._validate_email,
+            FieldType.PHONE: self._validate_phone,
+            FieldType.DATE: self._validate_date,
+            FieldType.CURRENCY: self._validate_currency,
+            FieldType.NUMBER: self._validate_number,
+        }
+
+    def compile(self, schema: Optional[Dict[str, FieldDefinition]] = None) -> CompiledValidator:
+        """
+        Retorna a tabela de validadores do schema, compilando apenas na primeira vez
+        """
+        if schema is None:
+            schema = ROTA_DO_SOL_SCHEMA
+        compiled = self._compiled.get(id(schema))
+        if compiled is not None and compiled.schema is schema:
+            self._compiled.move_to_end(id(schema))
+            return compiled
+
+        # None = campo sem validação de formato (texto, textarea)
+        validators: Dict[str, Optional[Callable[[Any], None]]] = {}
+        for field_id, field_def in schema.items():
+            if field_def.type == FieldType.SELECT and field_def.options:
+                validators[field_id] = self._make_select_validator(field_def.options)
+            else:
+                validators[field_id] = self._type_validators.get(field_def.type)
+
+        compiled = CompiledValidator(schema, validators, self._fallback_validator)
+        self._compiled[id(schema)] = compiled
+        while len(self._compiled) > self.COMPILED_CACHE_SIZE:
+            self._compiled.popitem(last=False)
+        return compiled
+
+    def validate_fields(self, fields: Dict[str, Any],
+                        schema: Optional[Dict[str, FieldDefinition]] = None):
         """
         Valida todos os campos fornecidos
-        Levanta exceção se algum campo for inválido
+        Levanta FieldValidationError (ValueError) com todos os campos inválidos
         """
-        for field_id, value in fields.items():
-            # Pular campos vazios ou None (não são obrigatórios para validação)
-            if value is None or value == "" or (isinstance(value, str) and value.strip() == ""):
+        errors = self.compile(schema).collect_errors(fields)
+        if errors:
+            raise FieldValidationError(errors)
+
+    def validate_columns(self, columns: Dict[str, Sequence[Any]],
+                         schema: Optional[Dict[str, FieldDefinition]] = None) -> Dict[str, BulkValidationResult]:
+        """
+        Valida colunas de valores (field_id -> lista de valores, uma linha por
+        comprador). CPF, CNPJ e CEP são validados de forma vetorizada; os
+        demais tipos usam o validador compilado do campo, valor a valor.
+        Valores vazios são considerados válidos, como em validate_fields.
+        """
+        compiled = self.compile(schema)
+        bulk_validators = {
+            self._validate_cpf: self.validate_cpf_bulk,
+            self._validate_cnpj: self.validate_cnpj_bulk,
+            self._validate_cep: self.validate_cep_bulk,
+        }
+        results: Dict[str, BulkValidationResult] = {}
+        for field_id, values in columns.items():
+            values = list(values)
+            if not values:
+                results[field_id] = BulkValidationResult(np.ones(0, dtype=bool), {})
                 continue
-            
-            # Determinar tipo baseado no field_id ou valor
-            field_type = self._infer_field_type(field_id, value)
-            
-            try:
-                if field_type == "cpf":
-                    self._validate_cpf(value)
-                elif field_type == "cnpj":
-                    self._validate_cnpj(value)
-                elif field_type == "email":
-                    self._validate_email(value)
-                elif field_type == "phone":
-                    self._validate_phone(value)
-                elif field_type == "date":
-                    self._validate_date(value)
-                elif field_type == "currency":
-                    self._validate_currency(value)
-                elif field_type == "number":
-                    self._validate_number(value)
-            except ValueError as e:
-                # Adicionar field_id ao erro para facilitar debug
-                raise ValueError(f"Campo '{field_id}': {str(e)}")
-    
+            if field_id in compiled.validators:
+                validator = compiled.validators[field_id]
+            else:
+                validator = compiled._fallback(field_id, values[0])
+            bulk = bulk_validators.get(validator)
+            if bulk is not None:
+                results[field_id] = bulk(values)
+            else:
+                results[field_id] = self._validate_column(values, validator)
+        return results
+
+    @staticmethod
+    def _validate_column(values: Sequence[Any],
+                         validator: Optional[Callable[[Any], None]]) -> BulkValidationResult:
+        valid = np.ones(len(values), dtype=bool)
+        errors: Dict[int, str] = {}
+        if validator is not None:
+            for i, value in enumerate(values):
+                if _is_empty(value):
+                    continue
+                try:
+                    validator(value)
+                except ValueError as e:
+                    valid[i] = False
+                    errors[i] = str(e)
+        return BulkValidationResult(valid, errors)
+
+    @staticmethod
+    def _bulk_result(empty: np.ndarray, checks) -> BulkValidationResult:
+        """
+        Combina as verificações (máscara de falha, mensagem), na ordem de
+        prioridade, em uma máscara de válidos e nas mensagens por índice
+        """
+        valid = np.ones(len(empty), dtype=bool)
+        errors: Dict[int, str] = {}
+        for failed, message in checks:
+            failed = failed & valid & ~empty
+            for i in np.flatnonzero(failed).tolist():
+                errors[i] = message
+            valid &= ~failed
+        return BulkValidationResult(valid, dict(sorted(errors.items())))
+
+    def validate_cpf_bulk(self, values: Sequence[Any]) -> BulkValidationResult:
+        """Valida uma coluna de CPFs (tamanho e dígitos verificadores)"""
+        digits, counts, empty = _digit_matrix(values, 11)
+        d1 = _check_digit(digits[:, :9] @ _CPF_WEIGHTS_1)
+        d2 = _check_digit(digits[:, :10] @ _CPF_WEIGHTS_2)
+        repeated = (digits == digits[:, :1]).all(axis=1)
+        return self._bulk_result(empty, [
+            (counts != 11, "CPF inválido: deve ter 11 dígitos"),
+            (repeated | (d1 != digits[:, 9]) | (d2 != digits[:, 10]),
+             "CPF inválido: dígitos verificadores incorretos"),
+        ])
+
+    def validate_cnpj_bulk(self, values: Sequence[Any]) -> BulkValidationResult:
+        """Valida uma coluna de CNPJs (tamanho e dígitos verificadores)"""
+        digits, counts, empty = _digit_matrix(values, 14)
+        d1 = _check_digit(digits[:, :12] @ _CNPJ_WEIGHTS_1)
+        d2 = _check_digit(digits[:, :13] @ _CNPJ_WEIGHTS_2)
+        repeated = (digits == digits[:, :1]).all(axis=1)
+        return self._bulk_result(empty, [
+            (counts != 14, "CNPJ inválido: deve ter 14 dígitos"),
+            (repeated | (d1 != digits[:, 12]) | (d2 != digits[:, 13]),
+             "CNPJ inválido: dígitos verificadores incorretos"),
+        ])
+
+    def validate_cep_bulk(self, values: Sequence[Any]) -> BulkValidationResult:
+        """Valida uma coluna de CEPs (8 dígitos)"""
+        _, counts, empty = _digit_matrix(values, 8)
+        return self._bulk_result(empty, [(counts != 8, "CEP inválido: deve ter 8 dígitos")])
+
+    @staticmethod
+    def _make_select_validator(options) -> Callable[[Any], None]:
+        allowed = frozenset(options)
+        allowed_text = ", ".join(options)
+
+        def validate_select(value: Any):
+            if str(value).strip() not in allowed:
+                raise ValueError(f"Opção inválida: {value}. Opções: {allowed_text}")
+
+        return validate_select
+
+    def _fallback_validator(self, field_id: str, value: Any) -> Optional[Callable[[Any], None]]:
+        """Validador de campos fora do schema, pelo tipo inferido do field_id"""
+        field_type = self._infer_field_type(field_id, value)
+        if field_type == "text":
+            return None
+        return self._type_validators[FieldType(field_type)]
+
     def _infer_field_type(self, field_id: str, value: Any) -> str:
         """
         Infere o tipo do campo baseado no field_id
+        (usado só para campos que não estão no schema do template)
         """
         field_id_lower = field_id.lower()
-        
+
         if "cpf" in field_id_lower:
             return "cpf"
         elif "cnpj" in field_id_lower:
             return "cnpj"
+        elif "cep" in field_id_lower.split("_"):
+            # Segmento exato (COMPRADOR_PF_CEP), para não pegar ex.: RECEPCAO
+            return "cep"
         elif "email" in field_id_lower or "e-mail" in field_id_lower:
             return "email"
         elif ("phone" in field_id_lower or "telefone" in field_id_lower) and "ddd" not in field_id_lower:
@@ -66,9 +329,9 @@ class FieldValidator:
             return "text"
         elif "number" in field_id_lower or "numero" in field_id_lower:
             return "number"
-        
+
         return "text"
-    
+
     def _is_numero_endereco_ou_referencia(self, field_id: str) -> bool:
         """
         Identificadores de lote, quadra ou número de endereço no imóvel
@@ -81,27 +344,27 @@ class FieldValidator:
         if u in ("COMPRADOR_PF_NUMERO", "COMPRADOR_PJ_NUMERO"):
             return True
         return False
-    
+
     def _validate_cpf(self, value: str):
         """Valida CPF"""
         if not value:
             return
-        
+
         # Remover formatação
-        cpf = re.sub(r'\D', '', str(value))
-        
+        cpf = _NON_DIGIT_RE.sub('', str(value))
+
         if len(cpf) != 11:
             raise ValueError(f"CPF inválido: deve ter 11 dígitos")
-        
+
         # Validar dígitos verificadores
         if not self._validate_cpf_digits(cpf):
             raise ValueError(f"CPF inválido: dígitos verificadores incorretos")
-    
+
     def _validate_cpf_digits(self, cpf: str) -> bool:
         """Valida dígitos verificadores do CPF"""
         if len(cpf) != 11 or cpf == cpf[0] * 11:
             return False
-        
+
         # Calcular primeiro dígito
         sum = 0
         for i in range(9):
@@ -109,10 +372,10 @@ class FieldValidator:
         digit1 = 11 - (sum % 11)
         if digit1 >= 10:
             digit1 = 0
-        
+
         if digit1 != int(cpf[9]):
             return False
-        
+
         # Calcular segundo dígito
         sum = 0
         for i in range(10):
@@ -120,79 +383,98 @@ class FieldValidator:
         digit2 = 11 - (sum % 11)
         if digit2 >= 10:
             digit2 = 0
-        
+
         return digit2 == int(cpf[10])
-    
+
     def _validate_cnpj(self, value: str):
         """Valida CNPJ"""
         if not value:
             return
-        
+
         # Remover formatação
-        cnpj = re.sub(r'\D', '', str(value))
-        
+        cnpj = _NON_DIGIT_RE.sub('', str(value))
+
         if len(cnpj) != 14:
             raise ValueError(f"CNPJ inválido: deve ter 14 dígitos")
-    
+
+        # Validar dígitos verificadores
+        if not self._validate_cnpj_digits(cnpj):
+            raise ValueError(f"CNPJ inválido: dígitos verificadores incorretos")
+
+    def _validate_cnpj_digits(self, cnpj: str) -> bool:
+        """Valida dígitos verificadores do CNPJ"""
+        if len(cnpj) != 14 or cnpj == cnpj[0] * 14:
+            return False
+
+        digits = [int(c) for c in cnpj]
+        digit1 = int(_check_digit(sum(d * w for d, w in zip(digits[:12], _CNPJ_WEIGHTS_1.tolist()))))
+        if digit1 != digits[12]:
+            return False
+
+        digit2 = int(_check_digit(sum(d * w for d, w in zip(digits[:13], _CNPJ_WEIGHTS_2.tolist()))))
+        return digit2 == digits[13]
+
+    def _validate_cep(self, value: str):
+        """Valida CEP"""
+        if not value:
+            return
+
+        if len(_NON_DIGIT_RE.sub('', str(value))) != 8:
+            raise ValueError(f"CEP inválido: deve ter 8 dígitos")
+
     def _validate_email(self, value: str):
         """Valida e-mail"""
         if not value:
             return
-        
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(pattern, str(value)):
+
+        if not _EMAIL_RE.match(str(value)):
             raise ValueError(f"E-mail inválido: {value}")
-    
+
     def _validate_phone(self, value: str):
         """Valida telefone (sem DDD, pois DDD é campo separado)"""
         if not value:
             return
-        
+
         # Remover formatação
-        phone = re.sub(r'\D', '', str(value))
-        
+        phone = _NON_DIGIT_RE.sub('', str(value))
+
         # Telefone sem DDD pode ter:
         # - 8 dígitos (telefone fixo)
         # - 9 dígitos (celular com o 9 inicial)
         if len(phone) != 8 and len(phone) != 9:
             raise ValueError(f"Telefone inválido: deve ter 8 dígitos (fixo) ou 9 dígitos (celular)")
-    
+
     def _validate_date(self, value: str):
         """Valida data"""
         if not value:
             return
-        
+
         # Aceitar formatos comuns: DD/MM/YYYY, YYYY-MM-DD
-        date_patterns = [
-            r'^\d{2}/\d{2}/\d{4}$',
-            r'^\d{4}-\d{2}-\d{2}$'
-        ]
-        
-        valid = any(re.match(pattern, str(value)) for pattern in date_patterns)
-        if not valid:
+        value_str = str(value)
+        if not any(pattern.match(value_str) for pattern in _DATE_RES):
             raise ValueError(f"Data inválida: formato deve ser DD/MM/YYYY ou YYYY-MM-DD")
-    
+
     def _validate_currency(self, value: Any):
         """Valida valor monetário"""
         if value is None:
             return
-        
+
         try:
             # Remover formatação de moeda
             if isinstance(value, str):
                 value = value.replace('R$', '').replace('.', '').replace(',', '.').strip()
-            
+
             float_value = float(value)
             if float_value < 0:
                 raise ValueError("Valor monetário não pode ser negativo")
         except (ValueError, TypeError):
             raise ValueError(f"Valor monetário inválido: {value}")
-    
+
     def _validate_number(self, value: Any):
         """Valida número"""
         if value is None:
             return
-        
+
         try:
             float(value)
         except (ValueError, TypeError):
@@ -0,0 +1,117 @@
+"""
+Helpers de cache HTTP para respostas de arquivos armazenados.
+
+- ETag forte derivado do hash do conteúdo armazenado
+- If-None-Match -> 304 Not Modified
+- Range (um intervalo por requisição) -> 206 Partial Content / 416
+- If-Range para retomar downloads só se o arquivo não mudou
+"""
+import re
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+# Artefatos gerados são imutáveis por download_id (UUID). São dados pessoais,
+# então o cache é privado (navegador/app), nunca em proxies compartilhados.
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    """Intervalo pedido fora do tamanho do arquivo"""
+
+
+def format_etag(content_hash: str) -> str:
+    return f'"{content_hash}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Verifica If-None-Match (aceita lista, '*' e validadores fracos W/)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return any(c.removeprefix("W/") == etag for c in candidates)
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta um cabeçalho Range de intervalo único e retorna (início, fim)
+    inclusivos. Retorna None para cabeçalhos ausentes, inválidos ou com vários
+    intervalos (nesses casos a resposta é o arquivo inteiro, como permite a RFC 9110).
+    Levanta RangeNotSatisfiable se o intervalo estiver fora do arquivo.
+    """
+    if not range_header:
+        return None
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+    start_str, end_str = match.groups()
+    if not start_str and not end_str:
+        return None
+    if not start_str:
+        # Sufixo: últimos N bytes
+        length = int(end_str)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(start_str)
+    end = int(end_str) if end_str else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def cached_stream_response(
+    request: Request,
+    *,
+    size: int,
+    content_hash: Optional[str],
+    iter_bytes: Callable[[int, Optional[int]], Iterator[bytes]],
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None,
+    cache_control: str = IMMUTABLE_CACHE_CONTROL,
+) -> Response:
+    """
+    Monta a resposta de um arquivo armazenado com validadores e suporte a Range.
+
+    iter_bytes(início, fim) deve devolver os bytes do intervalo inclusivo
+    (fim=None para ir até o final).
+    """
+    response_headers = dict(headers or {})
+    response_headers["Accept-Ranges"] = "bytes"
+    response_headers["Cache-Control"] = cache_control
+    etag = format_etag(content_hash) if content_hash else None
+    if etag:
+        response_headers["ETag"] = etag
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=response_headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and (etag is None or if_range.strip() != etag):
+        # Arquivo mudou desde o download parcial: devolver o conteúdo inteiro
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        response_headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=response_headers)
+
+    if byte_range is None:
+        response_headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_bytes(0, None), media_type=media_type, headers=response_headers)
+
+    start, end = byte_range
+    response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response_headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_bytes(start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=response_headers,
+    )
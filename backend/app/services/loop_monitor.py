@@ -0,0 +1,217 @@
+"""
+Monitor de atraso (lag) do event loop e detector de chamadas bloqueantes.
+
+Com LOOP_MONITOR=1, uma task do próprio event loop acorda a cada
+LOOP_MONITOR_INTERVAL_MS e mede quanto o despertar atrasou: esse atraso é o
+tempo em que o loop ficou ocupado com trabalho síncrono (subprocess.run,
+time.sleep, parsing com python-docx, glob...) sem atender outras requisições.
+
+    event_loop_lag_seconds            histograma de todas as amostras
+    event_loop_lag_recent_seconds     p50/p95/p99/máx. das últimas amostras
+    event_loop_blocks_total           bloqueios acima do limite
+
+Uma thread vigia (watchdog) confere o último despertar da task: se o loop
+está parado há mais de LOOP_BLOCK_THRESHOLD_MS, captura a pilha da thread do
+loop com sys._current_frames(), enquanto o bloqueio acontece, junto com a
+task em execução. Enquanto o bloqueio durar, continua amostrando a linha da
+aplicação onde o loop está (samples). Os bloqueios mais recentes
+(LOOP_MONITOR_MAX_EVENTS) ficam em GET /debug/loop-blocks, com a duração
+total medida quando o loop volta.
+
+Desligado (padrão), nada é iniciado.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = registry.histogram(
+    "event_loop_lag_seconds",
+    "Atraso do event loop em cada amostra do monitor",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+LOOP_LAG_RECENT = registry.gauge(
+    "event_loop_lag_recent_seconds",
+    "Percentis do atraso do event loop nas amostras recentes",
+    ("quantile",),
+)
+LOOP_BLOCKS = registry.counter(
+    "event_loop_blocks_total",
+    "Bloqueios do event loop acima de LOOP_BLOCK_THRESHOLD_MS",
+)
+
+# Quantidade de amostras usadas nos percentis recentes
+RECENT_SAMPLES = 600
+
+# Código da aplicação (para apontar a linha responsável na pilha)
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class LoopMonitor:
+    """Mede o lag do event loop e registra as pilhas dos bloqueios"""
+
+    def __init__(self):
+        self.enabled = os.getenv("LOOP_MONITOR", "").lower() in ("1", "true", "yes")
+        self.interval = int(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50")) / 1000
+        self.threshold = int(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "200")) / 1000
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=int(os.getenv("LOOP_MONITOR_MAX_EVENTS", "50")))
+        self._recent: Deque[float] = deque(maxlen=RECENT_SAMPLES)
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._pending: Optional[Dict[str, Any]] = None  # bloqueio em andamento
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Inicia a task de amostragem e a thread vigia (chamar no startup)"""
+        if not self.enabled or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._sample(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        for quantile in ("0.5", "0.95", "0.99", "1"):
+            LOOP_LAG_RECENT.set_function(lambda q=float(quantile): self.recent_lag(q), quantile=quantile)
+        logger.info(
+            "Monitor do event loop ativo (amostra a cada %.0f ms, bloqueio acima de %.0f ms)",
+            self.interval * 1000,
+            self.threshold * 1000,
+        )
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            with self._lock:
+                self._last_beat = now
+                self._recent.append(lag)
+                pending, self._pending = self._pending, None
+            LOOP_LAG_SECONDS.observe(lag)
+            if pending is not None:
+                # O loop voltou: duração total do bloqueio capturado pela vigia
+                pending["blocked_ms"] = round(lag * 1000, 1)
+                logger.warning(
+                    "Event loop bloqueado por %.0f ms em %s",
+                    lag * 1000,
+                    pending["location"],
+                    extra={"loop_block": pending},
+                )
+
+    def _watch(self) -> None:
+        poll = max(self.threshold / 4, 0.005)
+        while not self._stop.wait(poll):
+            with self._lock:
+                beat = self._last_beat
+                has_pending = self._pending is not None
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold:
+                continue
+            # Pilha capturada e formatada fora do lock (extract_stack lê os
+            # fontes via linecache): _sample, no loop, não espera por isso
+            stack = self._loop_stack()
+            if stack is None:
+                continue
+            location = self._location(stack)
+            event = None if has_pending else self._new_event(stack, stalled)
+            with self._lock:
+                if self._last_beat != beat:
+                    # O loop voltou enquanto a pilha era capturada: amostra velha
+                    continue
+                pending = self._pending
+                if pending is not None:
+                    # Mesmo bloqueio: amostrar onde o loop está agora (bloqueios
+                    # longos costumam somar vários trechos síncronos)
+                    pending["samples"][location] = pending["samples"].get(location, 0) + 1
+                    continue
+                self._pending = event
+                self.events.append(event)
+            LOOP_BLOCKS.inc()
+
+    def _loop_stack(self) -> Optional[traceback.StackSummary]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        return traceback.extract_stack(frame) if frame is not None else None
+
+    @staticmethod
+    def _location(stack: traceback.StackSummary) -> str:
+        """Quadro mais interno do código da aplicação: onde o bloqueio está"""
+        for f in reversed(stack):
+            if f.filename.startswith(APP_DIR):
+                return f"{os.path.relpath(f.filename, os.path.dirname(APP_DIR))}:{f.lineno} in {f.name}"
+        return f"{stack[-1].filename}:{stack[-1].lineno} in {stack[-1].name}" if stack else "?"
+
+    def _new_event(self, stack: traceback.StackSummary, stalled: float) -> Dict[str, Any]:
+        task = getattr(asyncio.tasks, "_current_tasks", {}).get(self._loop)
+        location = self._location(stack)
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "blocked_ms": round(stalled * 1000, 1),  # atualizado quando o loop volta
+            "location": location,
+            "task": task.get_name() if task is not None else None,
+            "coroutine": getattr(task.get_coro(), "__qualname__", None) if task is not None else None,
+            "stack": traceback.format_list(stack),
+            "samples": {location: 1},  # local -> amostras enquanto durou o bloqueio
+        }
+
+    def recent_lag(self, quantile: float) -> float:
+        with self._lock:
+            ordered = sorted(self._recent)
+        return _percentile(ordered, quantile)
+
+    def snapshot(self, limit: int = 20) -> Dict[str, Any]:
+        """Estado do monitor e bloqueios mais recentes primeiro"""
+        with self._lock:
+            ordered = sorted(self._recent)
+            events = list(self.events)[-limit:]
+        return {
+            "enabled": self.enabled,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": {
+                "p50": round(_percentile(ordered, 0.5) * 1000, 2),
+                "p95": round(_percentile(ordered, 0.95) * 1000, 2),
+                "p99": round(_percentile(ordered, 0.99) * 1000, 2),
+                "max": round((ordered[-1] if ordered else 0.0) * 1000, 2),
+                "samples": len(ordered),
+            },
+            "blocks_total": int(LOOP_BLOCKS.value()),
+            "blocks": list(reversed(events)),
+        }
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,242 @@
+"""
+Contabilidade de memória para planejamento de capacidade.
+
+- Pico de alocações Python por preenchimento (tracemalloc), com
+  MEMORY_TRACKING=1. tracemalloc deixa as alocações mais lentas e usa
+  memória própria, por isso fica desligado por padrão. O pico do tracemalloc
+  é global no processo, então só as seções síncronas de preenchimento e
+  gravação de cada DOCX são medidas (FillMemoryTracker.measure, sem await
+  no meio: outro fill não roda no event loop durante a medição), e o maior
+  pico entre os documentos é o do fill. Uma seção por vez; as concorrentes
+  (re-renderizações, threads) seguem sem medição. Alocações de outras
+  threads durante a seção (ex.: limpeza do output) ainda entram no pico.
+  Prepare/validação e a espera do soffice ficam de fora. Os nós XML do lxml (por baixo do python-docx) são alocados pela
+  libxml2, fora do tracemalloc: o total do processo está no RSS abaixo.
+  GET /debug/memory mostra um snapshot com as linhas que mais retêm memória.
+- RSS máximo e CPU de cada conversão do soffice (ver PDFGenerator),
+  sempre medidos. A CPU vem do rusage do os.wait4. O RSS vem do VmHWM de
+  /proc/<pid>/status do soffice e dos processos filhos, lido por uma thread
+  enquanto a conversão roda: no Linux o ru_maxrss do wait4 herda o RSS da
+  API no fork e não serve para dimensionar o soffice. Sem /proc, usa o
+  ru_maxrss mesmo assim.
+- RSS máximo do próprio processo (resource.getrusage), calculado na coleta.
+
+    contract_fill_python_peak_bytes   pico de alocações Python por fill
+    pdf_conversion_max_rss_bytes      RSS máximo do soffice por conversão
+    pdf_conversion_cpu_seconds        CPU (usuário + sistema) por conversão
+    process_max_rss_bytes             RSS máximo do processo da API
+"""
+import os
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.metrics import registry
+from app.services.tracing import current_span
+
+try:
+    import resource  # indisponível no Windows
+except ImportError:
+    resource = None
+
+_MB = 1024 * 1024
+
+FILL_PYTHON_PEAK_BYTES = registry.histogram(
+    "contract_fill_python_peak_bytes",
+    "Pico de alocações Python (tracemalloc) no preenchimento e gravação dos DOCX de um fill",
+    buckets=tuple(mb * _MB for mb in (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)),
+)
+PDF_CONVERSION_MAX_RSS_BYTES = registry.histogram(
+    "pdf_conversion_max_rss_bytes",
+    "RSS máximo do processo soffice em cada conversão",
+    buckets=tuple(mb * _MB for mb in (50, 100, 150, 200, 300, 400, 500, 750, 1000, 1500, 2000, 4000)),
+)
+PDF_CONVERSION_CPU_SECONDS = registry.histogram(
+    "pdf_conversion_cpu_seconds",
+    "Tempo de CPU (usuário + sistema) do soffice em cada conversão",
+)
+PROCESS_MAX_RSS_BYTES = registry.gauge(
+    "process_max_rss_bytes",
+    "RSS máximo do processo da API desde o início",
+)
+
+
+def maxrss_bytes(ru_maxrss: int) -> int:
+    """ru_maxrss em bytes (Linux informa em KiB, macOS em bytes)"""
+    return ru_maxrss if sys.platform == "darwin" else ru_maxrss * 1024
+
+
+def child_usage(rusage, tree_peak_bytes: Optional[int] = None) -> Dict[str, Optional[float]]:
+    """
+    RSS máximo e CPU de um processo filho. tree_peak_bytes é o pico da árvore
+    lido em /proc (None sem /proc: usa o ru_maxrss do wait4). Pico 0 significa
+    que o processo terminou antes da primeira leitura: RSS desconhecido.
+    """
+    if tree_peak_bytes is None:
+        max_rss = maxrss_bytes(rusage.ru_maxrss)
+    else:
+        max_rss = tree_peak_bytes or None
+    return {
+        "max_rss_bytes": max_rss,
+        "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+    }
+
+
+def _read_hwm_and_children(pid: int) -> Tuple[int, List[int]]:
+    """VmHWM (bytes) de um processo e os PIDs dos filhos, via /proc"""
+    hwm = 0
+    with open(f"/proc/{pid}/status", "rb") as f:
+        for line in f:
+            if line.startswith(b"VmHWM:"):
+                hwm = int(line.split()[1]) * 1024
+                break
+    children: List[int] = []
+    for tid in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children", "rb") as f:
+                children.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return hwm, children
+
+
+class ProcessTreeRssSampler:
+    """
+    Acompanha, em uma thread, o pico de memória de um processo e dos seus
+    filhos (soma dos VmHWM da árvore) enquanto ele roda. O pico de um
+    processo é monotônico, então só o crescimento nos últimos
+    interval segundos antes de ele terminar fica de fora.
+    """
+
+    available = os.path.exists("/proc/self/task")
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"rss-sampler-{pid}", daemon=True)
+
+    def __enter__(self) -> "ProcessTreeRssSampler":
+        if self.available:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=1)
+
+    def _sample(self) -> int:
+        total = 0
+        pending = [self.pid]
+        seen = set()
+        while pending:
+            pid = pending.pop()
+            if pid in seen:
+                continue
+            seen.add(pid)
+            try:
+                hwm, children = _read_hwm_and_children(pid)
+            except (OSError, ValueError):
+                continue
+            total += hwm
+            pending.extend(children)
+        return total
+
+    def _run(self) -> None:
+        while True:
+            self.peak_bytes = max(self.peak_bytes, self._sample())
+            if self._stop.wait(self.interval):
+                return
+
+
+def record_conversion_usage(usage: Dict[str, Optional[float]]) -> None:
+    if usage["max_rss_bytes"] is not None:
+        PDF_CONVERSION_MAX_RSS_BYTES.observe(usage["max_rss_bytes"])
+    PDF_CONVERSION_CPU_SECONDS.observe(usage["cpu_seconds"])
+
+
+# Maior pico medido no fill em andamento (None fora de FillMemoryTracker.track)
+_fill_peak: ContextVar[Optional[List[int]]] = ContextVar("fill_peak", default=None)
+
+
+class FillMemoryTracker:
+    """Mede o pico de alocações Python das seções síncronas de um fill com tracemalloc"""
+
+    def __init__(self):
+        self.enabled = os.getenv("MEMORY_TRACKING", "").lower() in ("1", "true", "yes")
+        self.frames = int(os.getenv("MEMORY_TRACKING_FRAMES", "1"))
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Liga o tracemalloc (chamar no startup)"""
+        if resource is not None:
+            PROCESS_MAX_RSS_BYTES.set_function(
+                lambda: maxrss_bytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+            )
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    @contextmanager
+    def track(self):
+        """
+        Delimita um fill: ao sair, observa o maior pico medido pelas seções
+        measure() dentro dele (nada se nenhuma foi medida)
+        """
+        if not self.enabled or not tracemalloc.is_tracing():
+            yield
+            return
+        peaks: List[int] = []
+        token = _fill_peak.set(peaks)
+        try:
+            yield
+        finally:
+            _fill_peak.reset(token)
+            if peaks:
+                FILL_PYTHON_PEAK_BYTES.observe(max(peaks))
+                current_span().set_attribute("memory.python_peak_bytes", max(peaks))
+
+    @contextmanager
+    def measure(self):
+        """
+        Mede o pico de alocações de uma seção síncrona (sem await) do fill em
+        andamento. Fora de track() ou com outra medição em curso, não mede.
+        """
+        peaks = _fill_peak.get()
+        if peaks is None or not self._lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            try:
+                yield
+            finally:
+                peaks.append(max(0, tracemalloc.get_traced_memory()[1] - baseline))
+        finally:
+            self._lock.release()
+
+    def snapshot(self, limit: int = 25) -> Optional[Dict[str, Any]]:
+        """Linhas que mais retêm memória agora (None se o tracemalloc estiver desligado)"""
+        if not tracemalloc.is_tracing():
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )).statistics("lineno")
+        return {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {"location": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count}
+                for stat in stats[:limit]
+            ],
+        }
+
+
+memory_tracker = FillMemoryTracker()
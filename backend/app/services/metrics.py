@@ -0,0 +1,287 @@
+"""
+Métricas da aplicação no formato texto do Prometheus (GET /metrics).
+
+Implementação própria e enxuta (sem prometheus_client): contadores, gauges
+e histogramas com labels, protegidos por um lock por métrica. Registrar uma
+observação custa um lookup em dict e algumas somas, então as métricas podem
+ficar no caminho quente do /api/fill.
+
+    with FILL_STAGE_SECONDS.time(stage="substitution"):
+        ...
+    CACHE_REQUESTS.inc(cache="prepared_fields", result="hit")
+
+Gauges podem ter o valor calculado na hora da coleta (set_function), ex.:
+profundidade da fila de logs.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Buckets em segundos: de 1 ms (substituição de campos) a 3 min (timeout do soffice)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 180.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: labels esperados {self.labelnames}, recebidos {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        # Sem labels, a série existe desde o início (exportada como 0)
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """Valor calculado na coleta (ex.: tamanho de uma fila)"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    @contextmanager
+    def track_inprogress(self, **labels: str):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def value(self, **labels: str) -> float:
+        key = self._key(labels)
+        function = self._functions.get(key)
+        return float(function()) if function else self._values.get(key, 0.0)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = float(function())
+            except Exception:
+                continue
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinação de labels: [contagem por bucket..., soma, contagem total]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """Observa a duração (s) do bloco, inclusive se ele levantar exceção"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        data = self._values.get(self._key(labels))
+        return int(data[-1]) if data else 0
+
+    def sum(self, **labels: str) -> float:
+        data = self._values.get(self._key(labels))
+        return data[-2] if data else 0.0
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, list(data)) for key, data in self._values.items())
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), data[:len(self.buckets)] + [None]):
+                cumulative = data[-1] if count is None else cumulative + count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {_format_value(cumulative)}"
+            yield f"{self.name}_sum{_label_text(self.labelnames, key)} {_format_value(data[-2])}"
+            yield f"{self.name}_count{_label_text(self.labelnames, key)} {_format_value(data[-1])}"
+
+
+class MetricsRegistry:
+    """Conjunto de métricas exportadas em /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Optional[Sequence[float]] = None) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Todas as métricas no formato texto do Prometheus (versão 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Métricas do pipeline de contratos ---------------------------------------
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "Duração das requisições HTTP por rota e status",
+    ("method", "route", "status"),
+)
+FILL_STAGE_SECONDS = registry.histogram(
+    "contract_fill_stage_seconds",
+    "Duração de cada estágio do preenchimento de contratos",
+    ("stage",),
+)
+PDF_CONVERSIONS = registry.counter(
+    "pdf_conversions_total",
+    "Conversões DOCX -> PDF via LibreOffice por resultado (ok, error, timeout)",
+    ("result",),
+)
+PDF_CONVERSION_TIMEOUTS = registry.counter(
+    "pdf_conversion_timeouts_total",
+    "Conversões DOCX -> PDF interrompidas por timeout",
+)
+UNRESOLVED_PLACEHOLDERS = registry.counter(
+    "contract_unresolved_placeholders_total",
+    "Placeholders {{CAMPO}} que ficariam sem valor nos documentos gerados",
+    ("document",),
+)
+CACHE_REQUESTS = registry.counter(
+    "cache_requests_total",
+    "Consultas aos caches da aplicação por resultado (hit, miss)",
+    ("cache", "result"),
+)
+IN_PROGRESS = registry.gauge(
+    "operations_in_progress",
+    "Operações em andamento (fill, pdf_conversion)",
+    ("operation",),
+)
+QUEUE_DEPTH = registry.gauge(
+    "queue_depth",
+    "Itens aguardando em filas internas",
+    ("queue",),
+)
+POOL_SIZE = registry.gauge(
+    "pool_size",
+    "Capacidade configurada de pools/limites de concorrência",
+    ("pool",),
+)
@@ -1,11 +1,82 @@
 """
 Serviço para conversão de DOCX para PDF usando LibreOffice (soffice)
 """
+import asyncio
+import logging
 import os
+import signal
 import subprocess
+import tempfile
+import threading
 import time
 from pathlib import Path
+from typing import List
 from app.services.document_storage import DocumentStorage
+from app.services.memory_tracking import ProcessTreeRssSampler, child_usage, record_conversion_usage
+from app.services.metrics import FILL_STAGE_SECONDS, IN_PROGRESS, PDF_CONVERSIONS, PDF_CONVERSION_TIMEOUTS
+from app.services.tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+# Trecho máximo da saída do LibreOffice incluído em logs e mensagens de erro
+SOFFICE_OUTPUT_LIMIT = 500
+
+
+def _tail(output: str, limit: int = SOFFICE_OUTPUT_LIMIT) -> str:
+    output = (output or "").strip()
+    return output if len(output) <= limit else "..." + output[-limit:]
+
+
+def _run_measured(cmd: List[str], timeout: float):
+    """
+    subprocess.run(cmd, capture de stdout/stderr, timeout) que também devolve
+    o RSS máximo e a CPU do processo filho, incluindo os processos que ele
+    inicia (ex.: o soffice.bin iniciado pelo script soffice): CPU pelo
+    os.wait4, RSS pelo ProcessTreeRssSampler. Sem os.wait4 (Windows), usa
+    subprocess.run e devolve usage None.
+
+    O processo roda em uma sessão própria: no timeout, o grupo inteiro
+    (script soffice e soffice.bin) é encerrado, não só o filho direto.
+    Bloqueia até o fim do processo: chamar fora do event loop
+    (asyncio.to_thread).
+
+    Retorna (CompletedProcess, usage).
+    """
+    if not hasattr(os, "wait4"):
+        return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              text=True, timeout=timeout), None
+
+    # Saída em arquivos temporários: sem threads de leitura nem risco de
+    # travar com o buffer do pipe cheio
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, stdout=out, stderr=err, start_new_session=True)
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)  # sessão própria: pgid == pid
+            except ProcessLookupError:
+                pass
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            with ProcessTreeRssSampler(proc.pid) as sampler:
+                _, status, rusage = os.wait4(proc.pid, 0)
+        finally:
+            timer.cancel()
+        # Processo já coletado pelo wait4: registrar no Popen para ele não esperar de novo
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        err.seek(0)
+        stdout = out.read().decode("utf-8", errors="replace")
+        stderr = err.read().decode("utf-8", errors="replace")
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=stderr)
+    usage = child_usage(rusage, sampler.peak_bytes if sampler.available else None)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr), usage
 
 
 class PDFGenerator:
@@ -54,6 +125,15 @@ class PDFGenerator:
             document_id: ID do documento (sem extensão)
             output_dir: Diretório de saída (opcional, usa o mesmo do DOCX se não informado)
         """
+        with start_span("convert_to_pdf", document_id=document_id) as span:
+            pdf_path = await self._convert_to_pdf(docx_path, document_id, output_dir)
+            if span.recording:
+                span.set_attribute("docx.bytes", os.path.getsize(docx_path))
+                span.set_attribute("pdf.bytes", os.path.getsize(pdf_path))
+            return pdf_path
+
+    async def _convert_to_pdf(self, docx_path: str, document_id: str, output_dir: str = None) -> str:
+        """Conversão em si (convert_to_pdf envolve com o span de tracing)"""
         if output_dir:
             output_dir_path = Path(output_dir)
         else:
@@ -91,50 +171,49 @@ class PDFGenerator:
             abs_docx_path,
         ]
         
-        print(f"Convertendo via LibreOffice: {cmd}")
-        print(f"PDF esperado pelo LibreOffice: {expected_libreoffice_pdf}")
-        print(f"PDF final desejado: {pdf_path}")
+        logger.debug("Convertendo via LibreOffice: %s", cmd)
         
+        IN_PROGRESS.inc(operation="pdf_conversion")
         try:
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=180,  # 3 minutos
-            )
-            
-            print(f"LibreOffice stdout: {result.stdout}")
-            print(f"LibreOffice stderr: {result.stderr}")
-            print(f"LibreOffice returncode: {result.returncode}")
+            with FILL_STAGE_SECONDS.time(stage="soffice"), \
+                    start_span("subprocess", command=os.path.basename(libreoffice_exec)) as sub_span:
+                # Em uma thread: a espera pelo soffice não bloqueia o event loop
+                result, usage = await asyncio.to_thread(_run_measured, cmd, 180)  # 3 minutos
+                sub_span.set_attribute("returncode", result.returncode)
+                if usage is not None:
+                    sub_span.set_attributes(max_rss_bytes=usage["max_rss_bytes"],
+                                            cpu_seconds=round(usage["cpu_seconds"], 3))
+            if usage is not None:
+                record_conversion_usage(usage)
+                logger.debug("soffice: RSS máx. %s bytes, CPU %.2fs", usage["max_rss_bytes"], usage["cpu_seconds"])
+            rename_start = time.perf_counter()
             
             if result.returncode != 0:
                 raise Exception(
                     f"Erro na conversão via LibreOffice (código {result.returncode}): "
-                    f"{result.stderr or result.stdout}"
+                    f"{_tail(result.stderr or result.stdout)}"
                 )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("LibreOffice stdout: %s", _tail(result.stdout))
+                logger.debug("LibreOffice stderr: %s", _tail(result.stderr))
             
-            # O LibreOffice gera o PDF com o nome baseado no DOCX original
-            # Aguardar um pouco para garantir que o arquivo foi escrito completamente
-            time.sleep(0.5)
+            # O LibreOffice gera o PDF com o nome baseado no DOCX original.
+            # O processo já terminou (wait4): o arquivo está completo, sem espera.
             
             # Verificar se o PDF foi criado com o nome esperado
             if not expected_libreoffice_pdf.exists():
                 # Tentar encontrar o PDF gerado baseado no nome do DOCX temporário
                 # O nome do DOCX temporário deve corresponder ao PDF gerado
                 docx_stem = docx_path_obj.stem  # Nome do DOCX sem extensão
-                print(f"[PDF_GENERATOR] Procurando PDF com nome baseado em: {docx_stem}")
                 
                 # Listar todos os PDFs no diretório
                 pdf_files = list(output_dir_path.resolve().glob("*.pdf"))
-                print(f"[PDF_GENERATOR] PDFs encontrados no diretório: {[f.name for f in pdf_files]}")
                 
                 # Tentar encontrar PDF que corresponde ao nome do DOCX
                 matching_pdf = None
                 for pdf_file in pdf_files:
                     if pdf_file.stem == docx_stem:
                         matching_pdf = pdf_file
-                        print(f"[PDF_GENERATOR] PDF correspondente encontrado: {matching_pdf}")
                         break
                 
                 if matching_pdf:
@@ -142,7 +221,7 @@ class PDFGenerator:
                 elif pdf_files:
                     # Se não encontrou correspondência exata, usar o mais recente
                     expected_libreoffice_pdf = max(pdf_files, key=lambda p: p.stat().st_mtime)
-                    print(f"[PDF_GENERATOR] AVISO: Usando PDF mais recente encontrado: {expected_libreoffice_pdf}")
+                    logger.warning("PDF esperado não encontrado; usando o mais recente: %s", expected_libreoffice_pdf.name)
                 else:
                     raise Exception(f"PDF não foi gerado pelo LibreOffice. Esperado: {expected_libreoffice_pdf}")
             
@@ -153,13 +232,9 @@ class PDFGenerator:
             # Se o nome do PDF gerado é diferente do esperado, renomear
             pdf_path_resolved = pdf_path.resolve()
             if expected_libreoffice_pdf.resolve() != pdf_path_resolved:
-                print(f"[PDF_GENERATOR] Renomeando PDF de {expected_libreoffice_pdf} para {pdf_path_resolved}")
                 if pdf_path_resolved.exists():
                     pdf_path_resolved.unlink()  # Remover PDF antigo se existir
                 expected_libreoffice_pdf.rename(pdf_path_resolved)
-                print(f"[PDF_GENERATOR] PDF renomeado com sucesso")
-            else:
-                print(f"[PDF_GENERATOR] PDF já está com o nome correto: {pdf_path_resolved}")
             
             # Garantir que o caminho retornado é o correto
             final_pdf_path = pdf_path_resolved
@@ -168,14 +243,21 @@ class PDFGenerator:
             if not final_pdf_path.exists():
                 raise Exception(f"PDF final não encontrado após renomeação: {final_pdf_path}")
             
-            print(f"[PDF_GENERATOR] PDF final confirmado: {final_pdf_path.name}")
-            
-            print(f"PDF gerado com sucesso: {final_pdf_path} (tamanho: {final_pdf_path.stat().st_size} bytes)")
+            FILL_STAGE_SECONDS.observe(time.perf_counter() - rename_start, stage="pdf_rename")
+            PDF_CONVERSIONS.inc(result="ok")
+            logger.info(
+                "PDF gerado: %s",
+                final_pdf_path.name,
+                extra={"bytes": final_pdf_path.stat().st_size},
+            )
             return str(final_pdf_path)
         
         except subprocess.TimeoutExpired:
+            PDF_CONVERSIONS.inc(result="timeout")
+            PDF_CONVERSION_TIMEOUTS.inc()
             raise Exception("Timeout na conversão para PDF via LibreOffice (processo demorou demais).")
         except FileNotFoundError:
+            PDF_CONVERSIONS.inc(result="error")
             raise Exception(
                 "LibreOffice (soffice) não foi encontrado no sistema.\n\n"
                 "Verifique se o LibreOffice está instalado e se o executável 'soffice' "
@@ -183,4 +265,7 @@ class PDFGenerator:
                 "com o caminho completo para o executável."
             )
         except Exception as e:
+            PDF_CONVERSIONS.inc(result="error")
             raise Exception(f"Erro ao converter para PDF via LibreOffice: {str(e)}")
+        finally:
+            IN_PROGRESS.dec(operation="pdf_conversion")
@@ -9,11 +9,14 @@ Tenta usar, nesta ordem:
 Se nenhuma ferramenta estiver disponível, lança um erro explicando
 o que precisa ser instalado.
 """
+import os
 from pathlib import Path
 from typing import List
 import subprocess
 import shutil
 
+from app.services.tracing import start_span
+
 
 class PDFMerger:
     """Serviço para mesclar múltiplos PDFs em um único arquivo"""
@@ -30,6 +33,24 @@ class PDFMerger:
         Returns:
             Caminho do PDF mesclado
         """
+        with start_span("merge_pdfs", inputs=len(pdf_paths)) as span:
+            if span.recording:
+                span.set_attribute("input.bytes", sum(os.path.getsize(p) for p in pdf_paths if os.path.exists(p)))
+            merged = PDFMerger._merge(pdf_paths, output_path)
+            if span.recording:
+                span.set_attribute("output.bytes", os.path.getsize(merged))
+            return merged
+
+    @staticmethod
+    def _run_tool(cmd: List[str]) -> subprocess.CompletedProcess:
+        """Executa uma ferramenta de merge em um span filho"""
+        with start_span("subprocess", command=cmd[0]) as span:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            span.set_attribute("returncode", result.returncode)
+            return result
+
+    @staticmethod
+    def _merge(pdf_paths: List[str], output_path: str) -> str:
         if not pdf_paths:
             raise ValueError("Lista de PDFs vazia")
 
@@ -51,7 +72,7 @@ class PDFMerger:
         # 1) Tentar pdfunite (poppler-utils)
         try:
             cmd = ["pdfunite"] + pdf_paths + [output_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            result = PDFMerger._run_tool(cmd)
             if result.returncode == 0 and Path(output_path).exists():
                 return output_path
         except (subprocess.TimeoutExpired, FileNotFoundError):
@@ -60,7 +81,7 @@ class PDFMerger:
         # 2) Tentar pdftk
         try:
             cmd = ["pdftk"] + pdf_paths + ["cat", "output", output_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            result = PDFMerger._run_tool(cmd)
             if result.returncode == 0 and Path(output_path).exists():
                 return output_path
         except (subprocess.TimeoutExpired, FileNotFoundError):
@@ -76,7 +97,7 @@ class PDFMerger:
                 "-sDEVICE=pdfwrite",
                 f"-sOutputFile={output_path}",
             ] + pdf_paths
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            result = PDFMerger._run_tool(cmd)
             if result.returncode == 0 and Path(output_path).exists():
                 return output_path
         except (subprocess.TimeoutExpired, FileNotFoundError):
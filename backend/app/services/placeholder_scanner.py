@@ -0,0 +1,149 @@
+"""
+Varredura de placeholders {{CAMPO}} direto no XML do DOCX.
+
+Lê as partes word/*.xml (documento, cabeçalhos, rodapés, notas) do zip em
+streaming com lxml.etree.iterparse, sem montar o documento inteiro com
+python-docx. O texto de cada parágrafo é juntado a partir dos runs, então
+placeholders quebrados em vários runs (comum depois de edições no Word) são
+encontrados, e cada ocorrência informa a parte, o parágrafo e os runs onde
+está. Parágrafos de caixas de texto (w:txbxContent) também são varridos.
+
+A memória fica limitada ao parágrafo corrente: os elementos já processados
+são descartados durante a leitura.
+"""
+import io
+import re
+import zipfile
+from bisect import bisect_right
+from typing import Iterator, List, Optional, Union
+
+from lxml import etree
+from pydantic import BaseModel
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+_P, _R, _T = f"{_W}p", f"{_W}r", f"{_W}t"
+
+PLACEHOLDER_RE = re.compile(r"\{\{([A-Z0-9_]+)\}\}")
+TEXT_PART_RE = re.compile(r"^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$")
+
+
+class PlaceholderLocation(BaseModel):
+    """Uma ocorrência de placeholder no DOCX"""
+    field_id: str
+    part: str            # ex.: word/document.xml, word/header1.xml
+    paragraph: int       # índice do parágrafo (w:p) na parte, em ordem de documento
+    run_start: int       # índice do run (no parágrafo) onde o placeholder começa
+    run_end: int         # índice do run onde termina (> run_start se quebrado)
+    offset: int          # posição no texto do parágrafo
+    text: str            # texto completo do parágrafo (contexto)
+
+    @property
+    def original_text(self) -> str:
+        return f"{{{{{self.field_id}}}}}"
+
+    @property
+    def split_across_runs(self) -> bool:
+        return self.run_end != self.run_start
+
+
+class _Paragraph:
+    """Texto de um parágrafo em construção, com o run de cada trecho"""
+
+    __slots__ = ("index", "run", "pieces", "starts", "runs", "length")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.run = -1                 # índice do run corrente
+        self.pieces: List[str] = []
+        self.starts: List[int] = []   # posição de cada trecho no texto do parágrafo
+        self.runs: List[int] = []     # run de cada trecho
+        self.length = 0
+
+    def add_text(self, text: str) -> None:
+        if not text:
+            return
+        self.starts.append(self.length)
+        self.runs.append(max(self.run, 0))
+        self.pieces.append(text)
+        self.length += len(text)
+
+    def locations(self, part: str) -> Iterator[PlaceholderLocation]:
+        if not self.pieces:
+            return
+        text = "".join(self.pieces)
+        if "{{" not in text:
+            return
+        for match in PLACEHOLDER_RE.finditer(text):
+            first = bisect_right(self.starts, match.start()) - 1
+            last = bisect_right(self.starts, match.end() - 1) - 1
+            yield PlaceholderLocation(
+                field_id=match.group(1),
+                part=part,
+                paragraph=self.index,
+                run_start=self.runs[first],
+                run_end=self.runs[last],
+                offset=match.start(),
+                text=text,
+            )
+
+
+def _scan_part(stream, part: str) -> Iterator[PlaceholderLocation]:
+    # Pilha de parágrafos abertos: parágrafos de caixas de texto ficam
+    # aninhados dentro de um run do parágrafo que as contém
+    stack: List[_Paragraph] = []
+    paragraph_count = 0
+    fallback_depth = 0
+
+    for event, elem in etree.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if tag == _MC_FALLBACK:
+            # Conteúdo alternativo (VML) repete as caixas de texto de mc:Choice
+            fallback_depth += 1 if event == "start" else -1
+            continue
+        if fallback_depth:
+            continue
+
+        if event == "start":
+            if tag == _P:
+                stack.append(_Paragraph(paragraph_count))
+                paragraph_count += 1
+            elif tag == _R and stack:
+                stack[-1].run += 1
+            continue
+
+        if tag == _T and stack:
+            stack[-1].add_text(elem.text or "")
+        elif tag == _P and stack:
+            yield from stack.pop().locations(part)
+            if not stack:
+                # Parágrafo de nível superior processado: liberar a memória
+                elem.clear()
+                parent = elem.getparent()
+                if parent is not None:
+                    while elem.getprevious() is not None:
+                        del parent[0]
+
+
+def iter_placeholders(source: Union[str, bytes, bytearray, io.IOBase],
+                      parts: Optional[re.Pattern] = None) -> Iterator[PlaceholderLocation]:
+    """
+    Itera pelas ocorrências de placeholders de um DOCX (caminho, bytes ou
+    stream), parte a parte, na ordem do documento. parts restringe as partes
+    varridas (padrão: documento, cabeçalhos, rodapés e notas).
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    parts = parts or TEXT_PART_RE
+    with zipfile.ZipFile(source) as zf:
+        names = [name for name in zf.namelist() if parts.match(name)]
+        # word/document.xml primeiro, depois cabeçalhos, rodapés e notas
+        names.sort(key=lambda name: (name != "word/document.xml", name))
+        for name in names:
+            with zf.open(name) as stream:
+                yield from _scan_part(stream, name)
+
+
+def scan_placeholders(source, parts: Optional[re.Pattern] = None) -> List[PlaceholderLocation]:
+    """Lista todas as ocorrências de placeholders do DOCX"""
+    return list(iter_placeholders(source, parts))
@@ -0,0 +1,146 @@
+"""
+Profiling sob demanda de requisições (diagnóstico em produção).
+
+Com PROFILING_ENABLED=1, qualquer endpoint pode ser executado sob profiler
+enviando o cabeçalho X-Profile (ou o parâmetro ?profile=) com o modo:
+
+    1 / cprofile   cProfile, salvo como .pstats (snakeviz, pstats, gprof2dot)
+    pyinstrument   amostragem, salvo como speedscope JSON (speedscope.app)
+                   (requer `pip install pyinstrument`, opcional; sem ele,
+                   usa cProfile)
+
+A requisição também precisa do X-Admin-Token correto (ADMIN_TOKEN); caso
+contrário o pedido de profiling é ignorado e a requisição segue normal.
+Os perfis ficam em PROFILES_DIR (padrão TEMP_DIR/profiles), mantendo os
+PROFILES_MAX mais recentes, e são listados em GET /debug/profiles. O nome
+do perfil gerado volta no cabeçalho X-Profile-Id.
+
+Com PROFILING_ENABLED desligado o middleware nem é registrado: custo zero.
+
+Os dois modos medem a thread do event loop durante a requisição: outras
+requisições concorrentes aparecem no perfil, e trabalho em threads
+(asyncio.to_thread) não. Apenas um perfil é capturado por vez.
+"""
+import asyncio
+import cProfile
+import hmac
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import Request
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler  # opcional
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+    SamplingProfiler = None
+    SpeedscopeRenderer = None
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY = "profile"
+
+_MODES = {"1": "cprofile", "true": "cprofile", "cprofile": "cprofile", "pyinstrument": "pyinstrument"}
+_SLUG_RE = re.compile(r"[^A-Za-z0-9]+")
+
+
+class RequestProfiler:
+    """Executa requisições marcadas sob profiler e guarda os resultados"""
+
+    def __init__(self):
+        self.enabled = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+        profiles_dir = os.getenv("PROFILES_DIR") or os.path.join(os.getenv("TEMP_DIR", "./temp"), "profiles")
+        self.profiles_dir = Path(profiles_dir)
+        self.max_profiles = int(os.getenv("PROFILES_MAX", "50"))
+        self._lock = threading.Lock()
+
+    def requested_mode(self, request: Request) -> Optional[str]:
+        """Modo de profiling pedido pela requisição (None se não pedido/autorizado)"""
+        value = request.headers.get(PROFILE_HEADER) or request.query_params.get(PROFILE_QUERY)
+        mode = _MODES.get((value or "").strip().lower())
+        if mode is None:
+            return None
+        expected = os.getenv("ADMIN_TOKEN")
+        token = request.headers.get("X-Admin-Token") or ""
+        if not expected or not hmac.compare_digest(token, expected):
+            return None
+        if mode == "pyinstrument" and SamplingProfiler is None:
+            mode = "cprofile"
+        return mode
+
+    def _profile_path(self, request: Request, suffix: str) -> Path:
+        slug = _SLUG_RE.sub("_", request.url.path).strip("_")[:60] or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{request.method}_{slug}_{uuid.uuid4().hex[:8]}{suffix}"
+        return self.profiles_dir / name
+
+    async def run(self, request: Request, call_next, mode: str):
+        """Executa call_next sob o profiler; retorna (resposta, caminho do perfil ou None)"""
+        if not self._lock.acquire(blocking=False):
+            # Outro perfil em andamento: atender sem profiling
+            return await call_next(request), None
+        try:
+            if mode == "pyinstrument":
+                # Amostra a thread inteira: o endpoint roda em outra task
+                profiler = SamplingProfiler(async_mode="disabled")
+                profiler.start()
+                try:
+                    response = await call_next(request)
+                finally:
+                    profiler.stop()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    response = await call_next(request)
+                finally:
+                    profiler.disable()
+        finally:
+            self._lock.release()
+
+        self.profiles_dir.mkdir(parents=True, exist_ok=True)
+        if mode == "pyinstrument":
+            path = self._profile_path(request, ".speedscope.json")
+            output = profiler.output(SpeedscopeRenderer())
+            await asyncio.to_thread(path.write_text, output, encoding="utf-8")
+        else:
+            path = self._profile_path(request, ".pstats")
+            await asyncio.to_thread(profiler.dump_stats, str(path))
+        await asyncio.to_thread(self._prune)
+        return response, path
+
+    def _prune(self) -> None:
+        if self.max_profiles <= 0:
+            return
+        profiles = sorted(self.profiles_dir.glob("*"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for path in profiles[self.max_profiles:]:
+            path.unlink(missing_ok=True)
+
+    def list_profiles(self, limit: int = 20) -> List[Dict]:
+        """Perfis mais recentes primeiro"""
+        if not self.profiles_dir.exists():
+            return []
+        entries = []
+        for path in self.profiles_dir.glob("*"):
+            if not path.is_file():
+                continue
+            st = path.stat()
+            entries.append((st.st_mtime, {
+                "name": path.name,
+                "format": "speedscope" if path.name.endswith(".speedscope.json") else "pstats",
+                "bytes": st.st_size,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(st.st_mtime)),
+            }))
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        return [entry for _, entry in entries[:limit]]
+
+    def get_profile_path(self, name: str) -> Optional[Path]:
+        """Caminho de um perfil pelo nome (sem permitir sair do diretório)"""
+        path = self.profiles_dir / Path(name).name
+        return path if path.is_file() else None
+
+
+request_profiler = RequestProfiler()
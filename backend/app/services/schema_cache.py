@@ -0,0 +1,172 @@
+"""
+Respostas pré-computadas de /api/schema e /api/templates.
+
+O schema de um template é estático para cada versão do template, então o
+JSON é serializado uma única vez por versão (no startup ou no primeiro
+acesso após uma recarga do template), junto com um ETag e versões
+pré-comprimidas (gzip e, se o pacote brotli estiver instalado, br). Cada
+requisição só escolhe a representação e responde 304 quando o cliente já
+tem a versão atual.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.models.schemas import FieldInfo, FieldType, SectionInfo
+from app.services.contract_schema import FieldDefinition
+from app.services.http_cache import etag_matches
+from app.services.metrics import CACHE_REQUESTS
+from app.services.template_service import TemplateService
+
+try:
+    import brotli  # opcional
+except ImportError:
+    brotli = None
+
+# O schema pode mudar com a versão do template: o cliente sempre revalida,
+# mas com ETag a revalidação custa só um 304 sem corpo
+SCHEMA_CACHE_CONTROL = "no-cache"
+
+
+class PrecomputedResponse:
+    """Corpo JSON serializado com suas variantes comprimidas e ETag"""
+
+    def __init__(self, payload: dict):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag_base = hashlib.sha256(self.body).hexdigest()[:32]
+        self.variants: Dict[str, bytes] = {"gzip": gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(self.body, quality=11)
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        # ETag forte diferente por codificação, como exige a RFC 9110
+        return f'"{self.etag_base}-{encoding}"' if encoding else f'"{self.etag_base}"'
+
+    def _choose_encoding(self, accept_encoding: str) -> Optional[str]:
+        accepted = set()
+        for item in accept_encoding.split(","):
+            token, _, params = item.strip().partition(";")
+            if params.replace(" ", "") in ("q=0", "q=0.0"):
+                continue
+            accepted.add(token.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return None
+
+    def to_response(self, request: Request) -> Response:
+        encoding = self._choose_encoding(request.headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": self.etag(encoding),
+            "Cache-Control": SCHEMA_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if any(etag_matches(if_none_match, self.etag(e)) for e in (None, *self.variants)):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(self.variants[encoding], media_type="application/json", headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+
+def build_schema_fields(schema: Dict[str, FieldDefinition],
+                        section_order: List[Tuple[str, str]]) -> Tuple[List[FieldInfo], List[SectionInfo]]:
+    """
+    Monta a lista de campos do formulário na ordem das seções,
+    agrupando o schema em uma única passada.
+    """
+    section_names = dict(section_order)
+    by_section: Dict[str, List[FieldInfo]] = {section_id: [] for section_id, _ in section_order}
+    for f in schema.values():
+        if f.section not in by_section:
+            continue
+        by_section[f.section].append(
+            FieldInfo(
+                field_id=f.field_id,
+                label=f.label,
+                type=FieldType(f.type.value),
+                required=f.required,
+                original_text=f'{{{{{f.field_id}}}}}',  # Placeholder formatado
+                context="",  # Não precisa mais de contexto
+                placeholder=f.placeholder if f.placeholder else None,  # Garantir que None seja None, não string vazia
+                section=section_names[f.section],
+                section_id=f.section,
+                options=f.options,
+                mask=f.mask,
+            )
+        )
+    fields = [field for section_id, _ in section_order for field in by_section[section_id]]
+    sections = [SectionInfo(id=section_id, name=section_name) for section_id, section_name in section_order]
+    return fields, sections
+
+
+class SchemaResponseCache:
+    """
+    Cache em memória das respostas de schema (por template e versão) e da
+    lista de templates. Quando o registro recarrega um template, a versão
+    muda e a resposta é recalculada no próximo acesso.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas: Dict[str, Tuple[str, PrecomputedResponse]] = {}
+        self._templates: Optional[Tuple[Dict, PrecomputedResponse]] = None
+
+    def _build_schema(self, template_id: str) -> PrecomputedResponse:
+        # Levanta ValueError se o template não existir
+        entry = TemplateService.get_template(template_id)
+        fields, sections = build_schema_fields(entry.schema, entry.sections)
+        return PrecomputedResponse({
+            "template_id": template_id,
+            "template_name": entry.name,
+            "fields": [f.model_dump(mode="json") for f in fields],
+            "sections": [s.model_dump(mode="json") for s in sections],
+            "total_fields": len(fields),
+        })
+
+    def get_schema(self, template_id: str) -> PrecomputedResponse:
+        version = TemplateService.get_template_version(template_id)
+        cached = self._schemas.get(template_id)
+        if cached is not None and cached[0] == version:
+            CACHE_REQUESTS.inc(cache="schema_response", result="hit")
+            return cached[1]
+        CACHE_REQUESTS.inc(cache="schema_response", result="miss")
+        with self._lock:
+            cached = self._schemas.get(template_id)
+            if cached is None or cached[0] != version:
+                cached = (version, self._build_schema(template_id))
+                self._schemas[template_id] = cached
+            return cached[1]
+
+    def get_templates(self) -> PrecomputedResponse:
+        entries = TemplateService.registry.entries()
+        cached = self._templates
+        if cached is not None and cached[0] is entries:
+            return cached[1]
+        with self._lock:
+            response = PrecomputedResponse({
+                "templates": TemplateService.list_templates(),
+                "default": TemplateService.get_default_template_id(),
+            })
+            self._templates = (entries, response)
+            return response
+
+    def warm(self) -> None:
+        """Pré-computa todas as respostas (chamado no startup da aplicação)"""
+        self.get_templates()
+        for template_id in TemplateService.registry.entries():
+            self.get_schema(template_id)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._schemas.clear()
+            self._templates = None
+
+
+schema_cache = SchemaResponseCache()
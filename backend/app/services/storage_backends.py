@@ -0,0 +1,344 @@
+"""
+Backends de armazenamento para os artefatos gerados (PDF/DOCX e registros).
+
+- LocalStorageBackend: sistema de arquivos local (padrão, STORAGE_ROOT)
+- S3StorageBackend: qualquer serviço compatível com S3 (AWS, MinIO, moto),
+  permitindo vários workers/containers compartilharem os resultados.
+
+Leituras e escritas são feitas em blocos (CHUNK_SIZE) para não carregar
+arquivos inteiros em memória.
+
+Configuração via variáveis de ambiente:
+    STORAGE_BACKEND=local|s3
+    STORAGE_ROOT=.                  (local)
+    S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION  (s3)
+"""
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+CHUNK_SIZE = 256 * 1024
+
+
+class StorageObject(BaseModel):
+    """Metadados de um objeto armazenado"""
+    key: str
+    size: int
+    modified_at: float
+    # Hash do conteúdo (sha256 no backend local, ETag do S3); usado como ETag HTTP
+    etag: Optional[str] = None
+
+
+class StorageBackend:
+    """Interface comum dos backends de armazenamento"""
+
+    # True quando os objetos ficam fora do disco local (precisam de upload)
+    is_remote = False
+
+    def write_stream(self, key: str, chunks: Iterable[bytes]) -> int:
+        """Grava o objeto a partir de blocos de bytes. Retorna o total gravado."""
+        raise NotImplementedError
+
+    def iter_read(self, key: str, start: int = 0, end: Optional[int] = None,
+                  chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Lê o objeto em blocos, do byte start ao byte end (inclusive)"""
+        raise NotImplementedError
+
+    def stat(self, key: str) -> Optional[StorageObject]:
+        """Retorna os metadados do objeto ou None se não existir"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def list(self, prefix: str = "") -> List[StorageObject]:
+        """Lista os objetos cujo key começa com prefix"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def put_file(self, key: str, local_path: str) -> int:
+        """Envia um arquivo local para o backend, em blocos"""
+        with open(local_path, "rb") as f:
+            return self.write_stream(key, iter(lambda: f.read(CHUNK_SIZE), b""))
+
+    def get_file(self, key: str, local_path: str) -> None:
+        """Baixa um objeto para um arquivo local, em blocos"""
+        Path(local_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(local_path, "wb") as f:
+            for chunk in self.iter_read(key):
+                f.write(chunk)
+
+    def write_bytes(self, key: str, data: bytes) -> int:
+        return self.write_stream(key, [data])
+
+    def read_bytes(self, key: str) -> bytes:
+        return b"".join(self.iter_read(key))
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Armazena objetos como arquivos sob um diretório raiz.
+
+    O sha256 de cada arquivo é calculado durante a escrita e guardado ao lado
+    dele (".<nome>.sha256"), para que stat() devolva o hash sem reler o arquivo.
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _hash_path(path: Path) -> Path:
+        return path.with_name(f".{path.name}.sha256")
+
+    def _store_hash(self, path: Path, digest: str) -> None:
+        self._hash_path(path).write_text(digest, encoding="ascii")
+
+    def _read_hash(self, path: Path, st: os.stat_result) -> str:
+        """Hash salvo do arquivo; recalcula se não existir ou estiver desatualizado"""
+        hash_path = self._hash_path(path)
+        try:
+            if hash_path.stat().st_mtime_ns >= st.st_mtime_ns:
+                return hash_path.read_text(encoding="ascii").strip()
+        except FileNotFoundError:
+            pass
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        self._store_hash(path, digest.hexdigest())
+        return digest.hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        """Caminho local de um key (não permite sair do diretório raiz)"""
+        parts = [p for p in key.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+        return self.root.joinpath(*parts)
+
+    def write_stream(self, key: str, chunks: Iterable[bytes]) -> int:
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        digest = hashlib.sha256()
+        total = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    total += len(chunk)
+            # Rename atômico: leitores nunca veem um arquivo parcial
+            os.replace(tmp_path, path)
+            self._store_hash(path, digest.hexdigest())
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        return total
+
+    def put_file(self, key: str, local_path: str) -> int:
+        path = self.path_for(key)
+        if Path(local_path).resolve() == path.resolve():
+            # Arquivo já está no lugar: só registrar o hash do conteúdo
+            st = path.stat()
+            self._read_hash(path, st)
+            return st.st_size
+        return super().put_file(key, local_path)
+
+    def iter_read(self, key: str, start: int = 0, end: Optional[int] = None,
+                  chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self.path_for(key), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def stat(self, key: str) -> Optional[StorageObject]:
+        path = self.path_for(key)
+        try:
+            st = path.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return StorageObject(
+            key=key,
+            size=st.st_size,
+            modified_at=st.st_mtime,
+            etag=self._read_hash(path, st),
+        )
+
+    def delete(self, key: str) -> bool:
+        path = self.path_for(key)
+        self._hash_path(path).unlink(missing_ok=True)
+        try:
+            path.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list(self, prefix: str = "") -> List[StorageObject]:
+        directory, _, name_prefix = prefix.rpartition("/")
+        base = self.path_for(directory) if directory else self.root
+        if not base.is_dir():
+            return []
+        objects = []
+        for p in base.iterdir():
+            if not p.is_file() or p.name.startswith(".") or not p.name.startswith(name_prefix):
+                continue
+            st = p.stat()
+            key = f"{directory}/{p.name}" if directory else p.name
+            objects.append(StorageObject(key=key, size=st.st_size, modified_at=st.st_mtime))
+        return objects
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    Armazena objetos em um bucket compatível com S3.
+    Requer boto3 (pip install boto3). Em desenvolvimento pode apontar para
+    um MinIO local via S3_ENDPOINT_URL.
+    """
+
+    is_remote = True
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError(
+                    "STORAGE_BACKEND=s3 requer o pacote boto3. Instale com: pip install boto3"
+                )
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _strip(self, full_key: str) -> str:
+        return full_key[len(self.prefix) + 1:] if self.prefix else full_key
+
+    def write_stream(self, key: str, chunks: Iterable[bytes]) -> int:
+        # Objetos pequenos (registros, DOCX) vão num único put_object; acima de
+        # 5 MB (tamanho mínimo de parte do S3) usa upload multipart
+        part_size = 5 * 1024 * 1024
+        full_key = self._key(key)
+        upload_id = None
+        parts = []
+        buffer = bytearray()
+        total = 0
+
+        def flush_part():
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=full_key, UploadId=upload_id,
+                PartNumber=len(parts) + 1, Body=bytes(buffer),
+            )
+            parts.append({"ETag": response["ETag"], "PartNumber": len(parts) + 1})
+            buffer.clear()
+
+        try:
+            for chunk in chunks:
+                buffer.extend(chunk)
+                total += len(chunk)
+                if len(buffer) >= part_size:
+                    if upload_id is None:
+                        upload_id = self.client.create_multipart_upload(
+                            Bucket=self.bucket, Key=full_key
+                        )["UploadId"]
+                    flush_part()
+            if upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=full_key, Body=bytes(buffer))
+                return total
+            if buffer:
+                flush_part()
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=full_key, UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            if upload_id is not None:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=full_key, UploadId=upload_id)
+            raise
+        return total
+
+    def iter_read(self, key: str, start: int = 0, end: Optional[int] = None,
+                  chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        kwargs = {"Bucket": self.bucket, "Key": self._key(key)}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+        body = self.client.get_object(**kwargs)["Body"]
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def stat(self, key: str) -> Optional[StorageObject]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            status = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if status in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return StorageObject(
+            key=key,
+            size=head["ContentLength"],
+            modified_at=head["LastModified"].timestamp(),
+            etag=head["ETag"].strip('"'),
+        )
+
+    def delete(self, key: str) -> bool:
+        if not self.exists(key):
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return True
+
+    def list(self, prefix: str = "") -> List[StorageObject]:
+        objects = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get("Contents", []):
+                objects.append(StorageObject(
+                    key=self._strip(item["Key"]),
+                    size=item["Size"],
+                    modified_at=item["LastModified"].timestamp(),
+                ))
+        return objects
+
+
+_backend: Optional[StorageBackend] = None
+
+
+def get_storage_backend() -> StorageBackend:
+    """
+    Retorna o backend configurado via STORAGE_BACKEND (compartilhado pelo processo)
+    """
+    global _backend
+    if _backend is None:
+        kind = os.getenv("STORAGE_BACKEND", "local").lower().strip()
+        if kind == "s3":
+            bucket = os.getenv("S3_BUCKET")
+            if not bucket:
+                raise RuntimeError("STORAGE_BACKEND=s3 requer a variável S3_BUCKET")
+            _backend = S3StorageBackend(
+                bucket=bucket,
+                prefix=os.getenv("S3_PREFIX", ""),
+                endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+                region=os.getenv("S3_REGION") or None,
+            )
+        elif kind == "local":
+            _backend = LocalStorageBackend(os.getenv("STORAGE_ROOT", "."))
+        else:
+            raise RuntimeError(f"STORAGE_BACKEND inválido: '{kind}' (use 'local' ou 's3')")
+    return _backend
@@ -0,0 +1,319 @@
+"""
+Registro de templates descobertos a partir de templates/manifest.json.
+
+Adicionar o contrato de um novo empreendimento passa a ser só colocar os
+DOCX no diretório de templates e declará-los no manifest, sem deploy de
+código nem restart:
+
+- Os placeholders {{CAMPO}} de cada DOCX são extraídos com uma varredura
+  direta do zip/XML (placeholder_scanner, sem python-docx) e conferidos
+  contra o schema.
+- O schema vem de "builtin:<nome>" (schemas em contract_schema.py), de um
+  arquivo JSON ao lado do manifest, ou é derivado dos próprios placeholders.
+  Placeholders sem definição no schema viram campos de texto derivados.
+- Alterações no manifest/DOCX são detectadas (no máximo a cada
+  TEMPLATE_RELOAD_INTERVAL segundos) e o registro é trocado atomicamente:
+  preenchimentos em andamento continuam usando o snapshot que já obtiveram,
+  inclusive os bytes do DOCX, que ficam no próprio snapshot.
+- Os bytes de cada DOCX são lidos uma única vez na carga, e a versão do
+  template é o hash desses mesmos bytes: versão e conteúdo nunca divergem.
+  Placeholders e schema são calculados sob demanda e mantidos em cache até
+  a próxima recarga.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from app.config.parties import STATIC_PARTIES
+from app.services.placeholder_scanner import iter_placeholders
+from app.services.contract_schema import (
+    ROTA_DO_SOL_SCHEMA,
+    SECTION_ORDER,
+    FieldDefinition,
+    FieldType,
+)
+
+# Schemas definidos em código, referenciados no manifest como "builtin:<nome>"
+BUILTIN_SCHEMAS: Dict[str, Tuple[Dict[str, FieldDefinition], List[Tuple[str, str]]]] = {
+    "rota_do_sol": (ROTA_DO_SOL_SCHEMA, SECTION_ORDER),
+}
+
+logger = logging.getLogger(__name__)
+
+# Seção usada para campos derivados de placeholders sem definição no schema
+DERIVED_SECTION = ("OUTROS", "Outros campos")
+
+def scan_docx_placeholder_parts(source) -> Dict[str, FrozenSet[str]]:
+    """
+    Extrai os placeholders {{CAMPO}} de um DOCX com a varredura em streaming
+    do XML (placeholder_scanner), que encontra placeholders quebrados em
+    vários runs. Retorna campo -> partes onde aparece (word/document.xml,
+    word/header1.xml...). source pode ser caminho ou bytes.
+    """
+    parts: Dict[str, set] = {}
+    for location in iter_placeholders(source):
+        parts.setdefault(location.field_id, set()).add(location.part)
+    return {field_id: frozenset(names) for field_id, names in parts.items()}
+
+
+def scan_docx_placeholders(source) -> FrozenSet[str]:
+    """Placeholders {{CAMPO}} de um DOCX (ver scan_docx_placeholder_parts)"""
+    return frozenset(scan_docx_placeholder_parts(source))
+
+
+def _label_from_field_id(field_id: str) -> str:
+    """Label legível para campos derivados: 'UNIDADE_LOTE_NUMERO' -> 'Unidade lote numero'"""
+    return field_id.replace("_", " ").capitalize()
+
+
+class TemplateDocument:
+    """Um documento DOCX de um template (com os bytes lidos na carga do snapshot)"""
+
+    def __init__(self, doc_id: str, name: str, path: Path, order: int, content: bytes):
+        self.id = doc_id
+        self.name = name
+        self.path = path
+        self.order = order
+        self._content = content
+        self._placeholder_parts: Optional[Dict[str, FrozenSet[str]]] = None
+
+    def read_bytes(self) -> bytes:
+        return self._content
+
+    def open(self) -> io.BytesIO:
+        """Stream com o conteúdo do DOCX deste snapshot (para Document(...))"""
+        return io.BytesIO(self.read_bytes())
+
+    def placeholder_parts(self) -> Dict[str, FrozenSet[str]]:
+        """Índice campo -> partes do DOCX, varrido uma vez por snapshot"""
+        if self._placeholder_parts is None:
+            self._placeholder_parts = scan_docx_placeholder_parts(self.read_bytes())
+        return self._placeholder_parts
+
+    @property
+    def placeholders(self) -> FrozenSet[str]:
+        return frozenset(self.placeholder_parts())
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "path": str(self.path),
+            "order": self.order,
+        }
+
+
+class TemplateEntry:
+    """Snapshot imutável de um template do manifest"""
+
+    def __init__(self, template_id: str, info: Dict, documents: List[TemplateDocument],
+                 version: str, schema_source: Optional[str], templates_dir: Path):
+        self.id = template_id
+        self.info = info
+        self.name = info.get("name", template_id)
+        self.description = info.get("description")
+        self.documents = documents
+        self.version = version
+        self._schema_source = schema_source
+        self._templates_dir = templates_dir
+        self._schema: Optional[Dict[str, FieldDefinition]] = None
+        self._sections: Optional[List[Tuple[str, str]]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def placeholders(self) -> FrozenSet[str]:
+        """Placeholders de todos os documentos do template"""
+        found = set()
+        for doc in self.documents:
+            found |= doc.placeholders
+        return frozenset(found)
+
+    def _load_declared_schema(self) -> Tuple[Dict[str, FieldDefinition], List[Tuple[str, str]]]:
+        source = self._schema_source
+        if not source:
+            return {}, []
+        if source.startswith("builtin:"):
+            name = source.split(":", 1)[1]
+            if name not in BUILTIN_SCHEMAS:
+                raise ValueError(f"Schema builtin '{name}' não existe (template '{self.id}')")
+            schema, sections = BUILTIN_SCHEMAS[name]
+            return dict(schema), list(sections)
+        with open(self._templates_dir / source, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        schema = {}
+        for field_data in data.get("fields", []):
+            field = FieldDefinition(**field_data)
+            schema[field.field_id] = field
+        sections = [tuple(s) for s in data.get("sections", [])]
+        return schema, sections
+
+    def _build_schema(self) -> None:
+        schema, sections = self._load_declared_schema()
+        placeholders = self.placeholders
+
+        # Campos presentes nos DOCX mas sem definição: derivar como texto
+        derived = sorted(
+            fid for fid in placeholders
+            if fid not in schema and fid not in STATIC_PARTIES
+        )
+        for fid in derived:
+            schema[fid] = FieldDefinition(
+                field_id=fid,
+                label=_label_from_field_id(fid),
+                type=FieldType.TEXT,
+                section=DERIVED_SECTION[0],
+            )
+        if derived and DERIVED_SECTION not in sections:
+            sections.append(DERIVED_SECTION)
+
+        missing = sorted(fid for fid in schema if fid not in placeholders)
+        if derived:
+            logger.warning("'%s': placeholders sem definição no schema (derivados como texto): %s", self.id, derived)
+        if missing:
+            logger.warning("'%s': campos do schema ausentes nos DOCX: %s", self.id, missing)
+
+        self._sections = sections
+        self._schema = schema
+
+    @property
+    def schema(self) -> Dict[str, FieldDefinition]:
+        if self._schema is None:
+            with self._lock:
+                if self._schema is None:
+                    self._build_schema()
+        return self._schema
+
+    @property
+    def sections(self) -> List[Tuple[str, str]]:
+        self.schema  # garante que o schema foi montado
+        return self._sections
+
+    def cross_check(self) -> Dict[str, List[str]]:
+        """Compara placeholders dos DOCX com o schema declarado"""
+        declared, _ = self._load_declared_schema()
+        placeholders = self.placeholders
+        return {
+            "missing": sorted(fid for fid in declared if fid not in placeholders),
+            "extra": sorted(fid for fid in placeholders if fid not in declared and fid not in STATIC_PARTIES),
+        }
+
+
+class TemplateRegistry:
+    """Carrega o manifest e mantém o snapshot atual dos templates"""
+
+    MANIFEST_NAME = "manifest.json"
+
+    def __init__(self, templates_dir: Path, reload_interval: Optional[float] = None):
+        self.templates_dir = Path(templates_dir)
+        if reload_interval is None:
+            reload_interval = float(os.getenv("TEMPLATE_RELOAD_INTERVAL", "2"))
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._entries: Dict[str, TemplateEntry] = {}
+        self._default_id: Optional[str] = None
+        self._fingerprint = None
+        self._checked_at = 0.0
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.templates_dir / self.MANIFEST_NAME
+
+    def _read_manifest(self) -> Dict:
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _fingerprint_files(self, manifest: Dict) -> Tuple:
+        """(mtime, tamanho) do manifest, dos DOCX e dos schemas JSON referenciados"""
+        paths = [self.manifest_path]
+        for info in manifest.get("templates", {}).values():
+            paths.extend(self.templates_dir / d["filename"] for d in info.get("documents", []))
+            schema = info.get("schema")
+            if schema and not schema.startswith("builtin:"):
+                paths.append(self.templates_dir / schema)
+        fingerprint = []
+        for p in paths:
+            try:
+                st = p.stat()
+                fingerprint.append((str(p), st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                fingerprint.append((str(p), None, None))
+        return tuple(fingerprint)
+
+    def _build_entries(self, manifest: Dict) -> Tuple[Dict[str, TemplateEntry], Optional[str]]:
+        entries: Dict[str, TemplateEntry] = {}
+        default_id = None
+        for template_id, info in manifest.get("templates", {}).items():
+            documents = []
+            version = hashlib.sha256()
+            for doc in sorted(info.get("documents", []), key=lambda x: x.get("order", 0)):
+                path = self.templates_dir / doc["filename"]
+                if not path.exists():
+                    raise FileNotFoundError(f"Arquivo de template não encontrado: {path}")
+                # Ler uma única vez: a versão é o hash dos mesmos bytes usados no fill
+                content = path.read_bytes()
+                documents.append(TemplateDocument(doc["id"], doc["name"], path, doc.get("order", 0), content))
+                version.update(doc["id"].encode("utf-8"))
+                version.update(hashlib.sha256(content).hexdigest().encode("ascii"))
+            previous = self._entries.get(template_id)
+            if previous is not None and previous.version == version.hexdigest()[:16] and previous.info == info:
+                # Template inalterado: reaproveitar o snapshot (e seus caches)
+                entries[template_id] = previous
+            else:
+                entries[template_id] = TemplateEntry(
+                    template_id, info, documents, version.hexdigest()[:16],
+                    info.get("schema"), self.templates_dir,
+                )
+            if info.get("default") and default_id is None:
+                default_id = template_id
+        if default_id is None and entries:
+            default_id = next(iter(entries))
+        return entries, default_id
+
+    def _ensure_loaded(self) -> None:
+        now = time.monotonic()
+        if self._fingerprint is not None and (
+            self.reload_interval <= 0 or now - self._checked_at < self.reload_interval
+        ):
+            return
+        with self._lock:
+            if self._fingerprint is not None and now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            try:
+                manifest = self._read_manifest()
+                fingerprint = self._fingerprint_files(manifest)
+                if fingerprint == self._fingerprint:
+                    return
+                entries, default_id = self._build_entries(manifest)
+            except Exception as e:
+                if self._fingerprint is None:
+                    raise
+                # Manifest/DOCX em edição: manter o snapshot anterior
+                logger.warning("Recarga de templates falhou, mantendo versão anterior: %s", e)
+                return
+            if self._fingerprint is not None:
+                logger.info("Templates recarregados: %s", list(entries))
+            # Troca atômica: leitores veem o dict antigo ou o novo, nunca um misto
+            self._entries, self._default_id = entries, default_id
+            self._fingerprint = fingerprint
+
+    def get(self, template_id: str) -> TemplateEntry:
+        self._ensure_loaded()
+        entry = self._entries.get(template_id)
+        if entry is None:
+            raise ValueError(f"Template '{template_id}' não encontrado")
+        return entry
+
+    def entries(self) -> Dict[str, TemplateEntry]:
+        self._ensure_loaded()
+        return self._entries
+
+    def default_template_id(self) -> Optional[str]:
+        self._ensure_loaded()
+        return self._default_id
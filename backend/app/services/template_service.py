@@ -2,9 +2,14 @@
 Serviço para gerenciar templates de contratos hospedados no backend.
 
 Agora suporta múltiplos documentos por template (ex: Quadro Resumo + Condições Gerais).
+Os templates são declarados em templates/manifest.json e carregados pelo
+TemplateRegistry, que recarrega automaticamente DOCX/manifest alterados.
 """
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, List, Tuple
+
+from app.services.contract_schema import FieldDefinition
+from app.services.template_registry import TemplateEntry, TemplateRegistry
 
 
 class TemplateService:
@@ -12,27 +17,12 @@ class TemplateService:
 
     TEMPLATES_DIR = Path(__file__).parent.parent.parent / "templates"
 
-    # Mapeamento de templates disponíveis e seus documentos
-    AVAILABLE_TEMPLATES: Dict[str, Dict] = {
-        "rota_do_sol": {
-            "name": "Contrato Residencial Rota do Sol",
-            "description": "Contrato de compra e venda do loteamento Residencial Rota do Sol",
-            "documents": [
-                {
-                    "id": "quadro_resumo",
-                    "filename": "CONTRATO_ROTA_DO_SOL_TEMPLATE.docx",
-                    "name": "Quadro Resumo",
-                    "order": 1,
-                },
-                {
-                    "id": "condicoes_gerais",
-                    "filename": "CONDICOES_GERAIS_TEMPLATE.docx",
-                    "name": "Condições Gerais",
-                    "order": 2,
-                },
-            ],
-        }
-    }
+    registry = TemplateRegistry(TEMPLATES_DIR)
+
+    @classmethod
+    def get_template(cls, template_id: str = "rota_do_sol") -> TemplateEntry:
+        """Retorna o snapshot atual do template (levanta ValueError se não existir)"""
+        return cls.registry.get(template_id)
 
     @classmethod
     def get_template_documents(cls, template_id: str = "rota_do_sol") -> List[Dict]:
@@ -44,28 +34,25 @@ class TemplateService:
         - name
         - path (caminho absoluto do arquivo DOCX)
         - order
-        """
-        if template_id not in cls.AVAILABLE_TEMPLATES:
-            raise ValueError(f"Template '{template_id}' não encontrado")
-
-        template = cls.AVAILABLE_TEMPLATES[template_id]
-        documents: List[Dict] = []
 
-        for doc in sorted(template.get("documents", []), key=lambda x: x.get("order", 0)):
-            doc_path = cls.TEMPLATES_DIR / doc["filename"]
-            if not doc_path.exists():
-                raise FileNotFoundError(f"Arquivo de template não encontrado: {doc_path}")
+        Para renderizar, usar os TemplateDocument de get_template(...).documents,
+        que trazem os bytes do snapshot e o índice de placeholders.
+        """
+        return [doc.to_dict() for doc in cls.get_template(template_id).documents]
 
-            documents.append(
-                {
-                    "id": doc["id"],
-                    "name": doc["name"],
-                    "path": str(doc_path),
-                    "order": doc.get("order", 0),
-                }
-            )
+    @classmethod
+    def get_template_version(cls, template_id: str = "rota_do_sol") -> str:
+        """
+        Retorna a versão de um template: hash dos arquivos DOCX de todos os
+        seus documentos. Muda sempre que algum DOCX do template é alterado.
+        """
+        return cls.get_template(template_id).version
 
-        return documents
+    @classmethod
+    def get_template_schema(cls, template_id: str = "rota_do_sol") -> Tuple[Dict[str, FieldDefinition], List[Tuple[str, str]]]:
+        """Retorna (schema, ordem das seções) do template"""
+        entry = cls.get_template(template_id)
+        return entry.schema, entry.sections
 
     @classmethod
     def get_template_path(cls, template_id: str = "rota_do_sol", document_id: str = "quadro_resumo") -> Path:
@@ -87,18 +74,18 @@ class TemplateService:
         """Lista todos os templates disponíveis (sem detalhes de caminho dos arquivos)."""
         return [
             {
-                "id": template_id,
-                "name": template_info.get("name"),
-                "description": template_info.get("description"),
+                "id": entry.id,
+                "name": entry.name,
+                "description": entry.description,
                 "documents": [
-                    {"id": d["id"], "name": d["name"], "order": d.get("order", 0)}
-                    for d in template_info.get("documents", [])
+                    {"id": d.id, "name": d.name, "order": d.order}
+                    for d in entry.documents
                 ],
             }
-            for template_id, template_info in cls.AVAILABLE_TEMPLATES.items()
+            for entry in cls.registry.entries().values()
         ]
 
     @classmethod
     def get_default_template_id(cls) -> str:
         """Retorna o ID do template padrão"""
-        return "rota_do_sol"
+        return cls.registry.default_template_id() or "rota_do_sol"
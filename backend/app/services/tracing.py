@@ -0,0 +1,243 @@
+"""
+Tracing de requisições no estilo OpenTelemetry, sem coletor externo.
+
+Cada operação relevante (fill_template, preenchimento de cada documento,
+convert_to_pdf e o subprocesso do soffice, merge de PDFs, download) abre um
+span com atributos (template_id, document_id, tamanhos em bytes...). Spans
+filhos herdam o trace_id do span corrente, guardado em um contextvar, então
+um contrato lento pode ser explicado passo a passo pelo trace.
+
+Exportação (TRACING_EXPORTER):
+    none     padrão; spans não são criados (custo praticamente zero)
+    console  cada span finalizado vira uma linha de log (logger app.tracing)
+    file     JSON lines em TRACING_FILE (padrão: TEMP_DIR/traces.jsonl)
+
+A escrita do exportador file acontece em uma thread própria, fora do event
+loop. O cabeçalho W3C traceparent de entrada é respeitado e devolvido na
+resposta, permitindo correlacionar com o frontend.
+
+    with start_span("convert_to_pdf", document_id=doc_id) as span:
+        ...
+        span.set_attribute("pdf.bytes", size)
+"""
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.config.logging_config import request_id_var, job_id_var
+
+logger = logging.getLogger("app.tracing")
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    """Um trecho de trabalho cronometrado, com atributos e status"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"[:500]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Span usado com o tracing desligado: aceita as mesmas chamadas e não faz nada"""
+
+    recording = False
+    trace_id = span_id = parent_id = None
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class ConsoleExporter:
+    """Envia cada span ao logging (que já escreve fora do event loop)"""
+
+    def export(self, span: Span) -> None:
+        data = span.to_dict()
+        logger.info(
+            "span %s %.1fms",
+            span.name,
+            span.duration_ms,
+            extra={"span": data},
+        )
+
+    def shutdown(self) -> None:
+        pass
+
+
+class FileExporter:
+    """Grava spans em JSON lines a partir de uma thread de escrita"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="trace-file-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span.to_dict())
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch: List[Dict[str, Any]] = [item]
+            # Agrupar o que já estiver na fila em uma única escrita
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for item in batch:
+                    f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            logger.warning("Não foi possível gravar spans em %s: %s", self.path, e)
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+class Tracer:
+    """Cria spans e os entrega ao exportador configurado"""
+
+    def __init__(self, exporter: Optional[str] = None, path: Optional[str] = None):
+        exporter = (exporter or os.getenv("TRACING_EXPORTER", "none")).lower()
+        if exporter == "console":
+            self.exporter = ConsoleExporter()
+        elif exporter == "file":
+            path = path or os.getenv("TRACING_FILE") or os.path.join(os.getenv("TEMP_DIR", "./temp"), "traces.jsonl")
+            self.exporter = FileExporter(path)
+        else:
+            self.exporter = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def start_span(self, name: str, traceparent: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+        """
+        Abre um span filho do span corrente (ou raiz, continuando o
+        traceparent informado). Exceções marcam o span com erro e seguem.
+        """
+        if self.exporter is None:
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            match = _TRACEPARENT_RE.match(traceparent or "")
+            trace_id, parent_id = (match.group(1), match.group(2)) if match else (secrets.token_hex(16), None)
+            attributes.setdefault("request_id", request_id_var.get())
+            attributes.setdefault("job_id", job_id_var.get())
+
+        span = Span(name, trace_id, parent_id, {k: v for k, v in attributes.items() if v is not None})
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            try:
+                self.exporter.export(span)
+            except Exception as e:
+                logger.debug("Falha ao exportar span %s: %s", span.name, e)
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def current_span():
+    """Span corrente (ou um span inerte, se não houver)"""
+    return _current_span.get() or NOOP_SPAN
+
+
+tracer = Tracer()
+start_span = tracer.start_span
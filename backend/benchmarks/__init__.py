@@ -0,0 +1,2 @@
+# Benchmarks dos caminhos quentes (preenchimento, validação, conversão, merge).
+# Uso: python -m benchmarks.run (ver benchmarks/README.md)
@@ -0,0 +1,72 @@
+"""
+Compara dois resultados de benchmarks/run.py (ex.: commit anterior e atual).
+
+    python -m benchmarks.compare benchmarks/results/antes.json benchmarks/results/depois.json
+
+Mostra as métricas em comum com a variação percentual. Com --threshold,
+termina com código 1 se alguma métrica piorar mais que o limite (útil em CI).
+Durações, bytes e alocações pioram quando sobem; vazões (*_per_second)
+pioram quando descem.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+COMPARED_SUFFIXES = ("median_ms", "p95_ms", "wall_ms", "_bytes", "bytes", "peak_kib", "_per_second")
+
+
+def flatten(data, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        if prefix.endswith(COMPARED_SUFFIXES):
+            yield prefix, float(data)
+
+
+def compare(old: Dict, new: Dict) -> Iterator[Tuple[str, float, float, float, bool]]:
+    """(métrica, antes, depois, variação %, piorou?) para as métricas em comum"""
+    old_values = dict(flatten(old.get("results", {})))
+    for name, value in flatten(new.get("results", {})):
+        if name not in old_values:
+            continue
+        before = old_values[name]
+        change = ((value - before) / before * 100) if before else 0.0
+        higher_is_better = name.endswith("_per_second")
+        worse = change < 0 if higher_is_better else change > 0
+        yield name, before, value, change, worse
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compara resultados de benchmarks")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="piora máxima tolerada em %% (sai com código 1 acima disso)")
+    args = parser.parse_args(argv)
+
+    with open(args.before, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"antes:  {old['meta'].get('commit')} ({old['meta'].get('timestamp')})")
+    print(f"depois: {new['meta'].get('commit')} ({new['meta'].get('timestamp')})\n")
+
+    regressions = 0
+    for name, before, after, change, worse in compare(old, new):
+        flag = ""
+        if args.threshold is not None and worse and abs(change) > args.threshold:
+            flag = "  <-- piorou"
+            regressions += 1
+        print(f"{name:70s} {before:>12.3f} {after:>12.3f} {change:>+8.1f}%{flag}")
+
+    if regressions:
+        print(f"\n{regressions} métrica(s) pioraram mais de {args.threshold}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Substituto do soffice para benchmarks e testes de carga sem LibreOffice.
+
+Aceita a mesma linha de comando usada pelo PDFGenerator
+(--headless --convert-to pdf --outdir DIR arquivo.docx) e grava um PDF
+pequeno e válido em DIR/arquivo.pdf depois de FAKE_SOFFICE_DELAY_MS
+milissegundos (padrão 200), simulando o tempo de conversão.
+FAKE_SOFFICE_FAIL_RATE (0 a 1) faz uma fração das conversões falhar.
+
+    LIBREOFFICE_PATH=benchmarks/fake_soffice.py python -m benchmarks.run
+"""
+import os
+import random
+import sys
+import time
+
+PDF_TEMPLATE = (
+    b"%PDF-1.4\n"
+    b"1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n"
+    b"%%EOF\n"
+)
+
+
+def main(argv) -> int:
+    if "--outdir" not in argv or len(argv) < 2:
+        print("uso: fake_soffice --headless --convert-to pdf --outdir DIR arquivo.docx", file=sys.stderr)
+        return 2
+    outdir = argv[argv.index("--outdir") + 1]
+    source = argv[-1]
+    if not os.path.exists(source):
+        print(f"Error: source file could not be loaded: {source}", file=sys.stderr)
+        return 1
+
+    time.sleep(float(os.getenv("FAKE_SOFFICE_DELAY_MS", "200")) / 1000)
+    if random.random() < float(os.getenv("FAKE_SOFFICE_FAIL_RATE", "0")):
+        print("Error: simulated conversion failure", file=sys.stderr)
+        return 1
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    with open(os.path.join(outdir, stem + ".pdf"), "wb") as f:
+        f.write(PDF_TEMPLATE)
+    print(f"convert {source} -> {os.path.join(outdir, stem + '.pdf')} using filter : writer_pdf_Export")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,257 @@
+"""
+Teste de carga do /api/fill sem LibreOffice.
+
+Gera requisições em malha aberta (chegadas de Poisson a --rate req/s, sem
+esperar as anteriores terminarem), com uma mistura de payloads, e reporta
+vazão, latências p50/p95/p99 e taxas de erro por tipo de payload.
+
+Por padrão a aplicação roda no mesmo processo, via httpx.ASGITransport, com
+TEMP_DIR/STORAGE_ROOT em um diretório temporário e o soffice substituído
+por benchmarks/fake_soffice.py (LIBREOFFICE_PATH), que grava um PDF pequeno
+depois de --soffice-delay-ms. Com --url, a carga vai para um servidor já em
+execução (uvicorn), que deve ter sido iniciado com o LIBREOFFICE_PATH
+desejado.
+
+    cd backend
+    python -m benchmarks.load --rate 5 --duration 30
+    python -m benchmarks.load --rate 20 --requests 200 --mix valid=8,large=1,invalid=1 --json out.json
+    python -m benchmarks.load --url http://127.0.0.1:8000 --rate 2 --duration 60
+
+No modo em processo, gerador e aplicação dividem o event loop: trabalho
+bloqueante no servidor também atrasa o envio das requisições, o que aparece
+como atraso de chegada (arrival_lag) no relatório.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+FAKE_SOFFICE = Path(__file__).resolve().parent / "fake_soffice.py"
+
+
+def payload_builders() -> Dict[str, Callable[[int], Dict[str, Any]]]:
+    from benchmarks.payloads import build_invalid_fields, build_large_fields, build_sample_fields
+
+    return {
+        # Mesmo payload sempre: acerta o cache de campos preparados
+        "repeat": lambda i: build_sample_fields(0),
+        "valid": lambda i: build_sample_fields(i + 1),
+        "large": lambda i: build_large_fields(i + 1),
+        "invalid": lambda i: build_invalid_fields(i + 1),
+    }
+
+
+def parse_mix(value: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return round(ordered[index] * 1000, 1)
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": percentile(ordered, 0.50),
+        "p95_ms": percentile(ordered, 0.95),
+        "p99_ms": percentile(ordered, 0.99),
+        "max_ms": round(ordered[-1] * 1000, 1) if ordered else None,
+    }
+
+
+class LoadRun:
+    """Uma execução de carga: agenda as chegadas e coleta os resultados"""
+
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.builders = payload_builders()
+        self.mix = parse_mix(args.mix)
+        unknown = [name for name, _ in self.mix if name not in self.builders]
+        if unknown:
+            raise SystemExit(f"tipos de payload desconhecidos: {', '.join(unknown)} "
+                             f"(disponíveis: {', '.join(self.builders)})")
+        self.results: List[Dict[str, Any]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _choose(self) -> str:
+        names = [name for name, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        return self.rng.choices(names, weights)[0]
+
+    async def _send(self, index: int, kind: str, scheduled: float) -> None:
+        payload = {"template_id": self.args.template, "fields": self.builders[kind](index)}
+        arrival_lag = time.perf_counter() - scheduled
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        status: Any
+        try:
+            response = await self.client.post("/api/fill", json=payload, timeout=self.args.timeout)
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        finally:
+            self.in_flight -= 1
+        self.results.append({
+            "kind": kind,
+            "status": status,
+            "latency": time.perf_counter() - start,
+            "arrival_lag": arrival_lag,
+        })
+
+    async def run(self) -> float:
+        args = self.args
+        tasks = []
+        start = time.perf_counter()
+        next_arrival = start
+        index = 0
+        while True:
+            if args.requests and index >= args.requests:
+                break
+            if not args.requests and next_arrival - start >= args.duration:
+                break
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self._send(index, self._choose(), next_arrival)))
+            index += 1
+            next_arrival += self.rng.expovariate(args.rate) if args.arrival == "poisson" else 1 / args.rate
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _is_ok(result: Dict[str, Any]) -> bool:
+        # 422 é a resposta esperada para payloads inválidos, não um erro
+        return result["status"] == 200 or (result["kind"] == "invalid" and result["status"] == 422)
+
+    def _summarize(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        errors = sum(1 for r in results if not self._is_ok(r))
+        return {
+            "requests": len(results),
+            "errors": errors,
+            "error_rate": round(errors / len(results), 4) if results else 0.0,
+            "statuses": dict(Counter(str(r["status"]) for r in results)),
+            "latency": latency_summary([r["latency"] for r in results if self._is_ok(r)]),
+        }
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        by_kind: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for result in self.results:
+            by_kind[result["kind"]].append(result)
+        overall = self._summarize(self.results)
+        return {
+            "config": {
+                "rate": self.args.rate,
+                "arrival": self.args.arrival,
+                "mix": self.args.mix,
+                "target": self.args.url or "in-process",
+                "soffice_delay_ms": None if self.args.url else self.args.soffice_delay_ms,
+            },
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(len(self.results) / elapsed, 3) if elapsed else None,
+            "completed_ok_rps": round((len(self.results) - overall["errors"]) / elapsed, 3) if elapsed else None,
+            "max_in_flight": self.max_in_flight,
+            "arrival_lag": latency_summary([r["arrival_lag"] for r in self.results]),
+            "overall": overall,
+            "by_kind": {kind: self._summarize(results) for kind, results in sorted(by_kind.items())},
+        }
+
+
+def configure_in_process(args) -> None:
+    """Ambiente isolado para a aplicação em processo (antes de importá-la)"""
+    work_dir = tempfile.mkdtemp(prefix="lalu-load-")
+    os.environ.setdefault("TEMP_DIR", os.path.join(work_dir, "temp"))
+    os.environ.setdefault("STORAGE_ROOT", work_dir)
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    if not args.real_soffice:
+        os.environ["LIBREOFFICE_PATH"] = str(FAKE_SOFFICE)
+        os.environ["FAKE_SOFFICE_DELAY_MS"] = str(args.soffice_delay_ms)
+        os.environ["FAKE_SOFFICE_FAIL_RATE"] = str(args.soffice_fail_rate)
+    print(f"[load] Aplicação em processo; arquivos em {work_dir}")
+
+
+async def main_async(args) -> Dict[str, Any]:
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url)
+    else:
+        configure_in_process(args)
+        from app.main import app
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load")
+
+    async with client:
+        run = LoadRun(client, args)
+        target = f"{args.requests} requisições" if args.requests else f"{args.duration}s"
+        print(f"[load] {args.rate} req/s ({args.arrival}), {target}, mix {args.mix}")
+        elapsed = await run.run()
+        return run.report(elapsed)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do /api/fill")
+    parser.add_argument("--url", help="servidor em execução (padrão: aplicação em processo)")
+    parser.add_argument("--rate", type=float, default=2.0, help="chegadas por segundo")
+    parser.add_argument("--arrival", choices=("poisson", "constant"), default="poisson")
+    parser.add_argument("--duration", type=float, default=20.0, help="duração da geração de carga (s)")
+    parser.add_argument("--requests", type=int, default=0, help="total de requisições (substitui --duration)")
+    parser.add_argument("--mix", default="valid=8,repeat=1,invalid=1",
+                        help="pesos por tipo de payload (repeat, valid, large, invalid)")
+    parser.add_argument("--template", default="rota_do_sol")
+    parser.add_argument("--timeout", type=float, default=300.0, help="timeout por requisição (s)")
+    parser.add_argument("--soffice-delay-ms", type=int, default=300, help="atraso do soffice falso")
+    parser.add_argument("--soffice-fail-rate", type=float, default=0.0, help="fração de conversões com falha")
+    parser.add_argument("--real-soffice", action="store_true", help="não substituir o soffice (modo em processo)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="grava o relatório em JSON neste arquivo")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.rate <= 0:
+        raise SystemExit("--rate deve ser positivo")
+    report = asyncio.run(main_async(args))
+
+    overall = report["overall"]
+    latency = overall["latency"]
+    print(f"\n[load] {overall['requests']} requisições em {report['elapsed_s']}s "
+          f"({report['throughput_rps']} req/s, {report['completed_ok_rps']} ok/s, "
+          f"máx. {report['max_in_flight']} simultâneas)")
+    print(f"[load] latência p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, p99 {latency['p99_ms']} ms")
+    print(f"[load] erros: {overall['errors']} ({overall['error_rate'] * 100:.1f}%), status {overall['statuses']}")
+    for kind, summary in report["by_kind"].items():
+        kind_latency = summary["latency"]
+        print(f"[load]   {kind:8s} {summary['requests']:5d} req  erros {summary['error_rate'] * 100:5.1f}%  "
+              f"p50 {kind_latency['p50_ms']} p95 {kind_latency['p95_ms']} p99 {kind_latency['p99_ms']} ms")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"[load] Relatório em {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
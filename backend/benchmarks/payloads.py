@@ -0,0 +1,102 @@
+"""
+Payloads sintéticos para benchmarks e testes de carga.
+
+Os valores seguem o schema do template (ROTA_DO_SOL_SCHEMA) e passam na
+validação do FieldValidator. variant > 0 gera payloads diferentes (nomes,
+valores e documentos distintos), úteis para não acertar sempre o cache de
+campos preparados do DocumentFiller.
+"""
+import random
+from typing import Any, Dict, List, Optional
+
+from app.services.contract_schema import ROTA_DO_SOL_SCHEMA, FieldType
+
+NOMES = ["João Carlos Teste Silva", "Maria Aparecida Souza", "Pedro Henrique Lima", "Ana Beatriz Rocha"]
+EXTENSOS = {
+    "PRECO_TOTAL_EXTENSO": "trezentos mil reais",
+    "COMISSAO_TOTAL_EXTENSO": "quinze mil reais",
+    "BEM_VALOR_TOTAL_EXTENSO": "duzentos mil reais",
+    "BEM_ENTRADA_VALOR_TOTAL_EXTENSO": "cinquenta mil reais",
+    "BEM_ENTRADA_PARCELAS_QTD_EXTENSO": "cinco",
+    "BEM_ENTRADA_PARCELA_VALOR_EXTENSO": "dez mil reais",
+    "PARCELAS_VALOR_TOTAL_EXTENSO": "cento e cinquenta mil reais",
+    "PARCELAS_QUANTIDADE_EXTENSO": "sessenta",
+    "PARCELAS_VALOR_UNITARIO_EXTENSO": "dois mil e quinhentos reais",
+}
+
+
+def _cpf_check_digits(base: List[int]) -> List[int]:
+    digits = list(base)
+    for length in (9, 10):
+        total = sum(d * w for d, w in zip(digits, range(length + 1, 1, -1)))
+        remainder = total % 11
+        digits.append(0 if remainder < 2 else 11 - remainder)
+    return digits
+
+
+def random_cpf(rng: random.Random) -> str:
+    """CPF válido (dígitos verificadores corretos), formatado"""
+    while True:
+        base = [rng.randint(0, 9) for _ in range(9)]
+        if len(set(base)) > 1:
+            break
+    d = "".join(map(str, _cpf_check_digits(base)))
+    return f"{d[:3]}.{d[3:6]}.{d[6:9]}-{d[9:]}"
+
+
+def build_sample_fields(variant: int = 0, rng: Optional[random.Random] = None) -> Dict[str, Any]:
+    """Payload completo e válido para o template rota_do_sol"""
+    rng = rng or random.Random(variant)
+    out: Dict[str, Any] = {}
+    for fid, fd in ROTA_DO_SOL_SCHEMA.items():
+        t = fd.type
+        if t == FieldType.CPF:
+            out[fid] = "529.982.247-25" if variant == 0 else random_cpf(rng)
+        elif t == FieldType.CNPJ:
+            out[fid] = "11.222.333/0001-81"
+        elif t == FieldType.CEP:
+            out[fid] = "88000-000"
+        elif t == FieldType.CURRENCY:
+            out[fid] = "123456.78" if variant == 0 else f"{rng.randint(1000, 999999)}.{rng.randint(0, 99):02d}"
+        elif t == FieldType.DATE:
+            out[fid] = "2026-04-15" if variant == 0 else f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        elif t == FieldType.NUMBER:
+            out[fid] = 10 if variant == 0 else rng.randint(1, 28)
+        elif t == FieldType.EMAIL:
+            out[fid] = "comprador.exemplo@email.com"
+        elif t == FieldType.PHONE:
+            out[fid] = "987654321"
+        elif t == FieldType.SELECT:
+            out[fid] = (fd.options or ["ok"])[0 if variant == 0 else rng.randrange(len(fd.options or ["ok"]))]
+        elif t == FieldType.TEXTAREA:
+            out[fid] = "Confrontações de exemplo: norte com Rua A, sul com lote 02."
+        else:
+            out[fid] = f"Texto_{fid[-12:]}"
+    nome = NOMES[variant % len(NOMES)]
+    out["COMPRADOR_PF_NOME"] = nome
+    out["ASSINATURA_COMPRADOR_NOME"] = nome
+    out.update(EXTENSOS)
+    out["ASSINATURA_DATA_MES"] = "abril"
+    out["IMOBILIARIA_NOME"] = "Imobiliária Exemplo Ltda"
+    return out
+
+
+def build_large_fields(variant: int = 0, text_size: int = 4000) -> Dict[str, Any]:
+    """Payload com textos longos (confrontações), para o pior caso de substituição"""
+    out = build_sample_fields(variant)
+    filler = "Confrontações: frente para a Rua A, fundos com o lote 12, lateral com a área verde. "
+    for fid, fd in ROTA_DO_SOL_SCHEMA.items():
+        if fd.type == FieldType.TEXTAREA:
+            out[fid] = (filler * (text_size // len(filler) + 1))[:text_size]
+    return out
+
+
+def build_invalid_fields(variant: int = 0) -> Dict[str, Any]:
+    """Payload rejeitado pela validação (CPF e e-mail inválidos)"""
+    out = build_sample_fields(variant)
+    for fid, fd in ROTA_DO_SOL_SCHEMA.items():
+        if fd.type == FieldType.CPF:
+            out[fid] = "111.111.111-11"
+        elif fd.type == FieldType.EMAIL:
+            out[fid] = "sem-arroba"
+    return out
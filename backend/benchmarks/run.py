@@ -0,0 +1,415 @@
+"""
+Benchmarks dos caminhos quentes do preenchimento de contratos.
+
+Usa os templates reais de templates/ (via TemplateService) e os payloads
+sintéticos de benchmarks/payloads.py. Mede:
+
+    validate  FieldValidator: payload completo e validação em lote (colunas)
+    fill      DocumentFiller por documento do template: preparo dos campos,
+              preenchimento, salvamento, tamanho do DOCX e alocações
+              (tracemalloc)
+    convert   PDFGenerator.convert_to_pdf em vários níveis de concorrência
+              (documentos/s); requer soffice ou LIBREOFFICE_PATH
+              (ex.: benchmarks/fake_soffice.py)
+    merge     PDFMerger.merge_pdfs; requer pdfunite, pdftk ou gs
+    analyze   AIAnalyzer contra o stub local da OpenAI
+              (scripts/openai_stub_server.py, sem rede): análises/s por
+              OPENAI_MAX_CONCURRENCY (e o máximo simultâneo visto pelo
+              stub), backoff com 429/Retry-After e timeouts (fallback)
+
+O resultado vai para um JSON (padrão benchmarks/results/<data>_<commit>.json)
+comparável entre commits com `python -m benchmarks.compare`.
+
+    cd backend
+    python -m benchmarks.run
+    python -m benchmarks.run --only fill,validate --repeat 50
+    LIBREOFFICE_PATH=benchmarks/fake_soffice.py python -m benchmarks.run --only convert
+    python -m benchmarks.run --only analyze --concurrency 1,4,8
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+from app.services.document_filler import DocumentFiller  # noqa: E402
+from app.services.field_validator import FieldValidator  # noqa: E402
+from app.services.pdf_generator import PDFGenerator  # noqa: E402
+from app.services.pdf_merger import PDFMerger  # noqa: E402
+from app.services.template_service import TemplateService  # noqa: E402
+from benchmarks.payloads import build_large_fields, build_sample_fields, random_cpf  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+BENCHMARKS = ("validate", "fill", "convert", "merge", "analyze")
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Estatísticas de uma lista de durações em segundos (resultado em ms)"""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "n": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def timed(fn: Callable[[int], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Executa fn(i) warmup + repeat vezes e resume as durações medidas"""
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def measure_allocations(fn: Callable[[], Any]) -> Dict[str, float]:
+    """Pico de memória e blocos alocados (tracemalloc) em uma execução de fn"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        fn()
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    return {
+        "peak_kib": round(peak / 1024, 1),
+        "retained_kib": round(sum(s.size_diff for s in diff) / 1024, 1),
+        "allocated_blocks": sum(max(s.count_diff, 0) for s in diff),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_ROOT,
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+# --- validate -----------------------------------------------------------------
+
+def bench_validate(args) -> Dict[str, Any]:
+    schema, _ = TemplateService.get_template_schema(args.template)
+    validator = FieldValidator()
+    payloads = [build_sample_fields(i) for i in range(args.repeat + 1)]
+
+    rng = random.Random(0)
+    rows = args.bulk_rows
+    columns = {
+        "COMPRADOR_PF_CPF": [random_cpf(rng) for _ in range(rows)],
+        "COMPRADOR_PF_CEP": ["88000-000"] * rows,
+        "IMOBILIARIA_CNPJ": ["11.222.333/0001-81"] * rows,
+    }
+    columns = {k: v for k, v in columns.items() if k in schema}
+
+    bulk = timed(lambda i: validator.validate_columns(columns, schema), max(3, args.repeat // 5))
+    bulk["rows"] = rows
+    bulk["rows_per_second"] = round(rows / (bulk["median_ms"] / 1000)) if bulk["median_ms"] else None
+    return {
+        "payload": timed(lambda i: validator.validate_fields(payloads[i], schema), args.repeat),
+        "bulk_columns": bulk,
+    }
+
+
+# --- fill -----------------------------------------------------------------------
+
+def bench_fill(args) -> Dict[str, Any]:
+    schema, _ = TemplateService.get_template_schema(args.template)
+    documents = TemplateService.get_template(args.template).documents
+    filler = DocumentFiller()
+    fields = build_sample_fields()
+    large_fields = build_large_fields()
+
+    def prepare_cold(i):
+        filler._prepared_cache.clear()
+        filler.prepare_fields(fields, schema)
+
+    results: Dict[str, Any] = {
+        "prepare_cold": timed(prepare_cold, args.repeat),
+        "prepare_cached": timed(lambda i: filler.prepare_fields(fields, schema), args.repeat),
+        "documents": {},
+    }
+    prepared = filler.prepare_fields(fields, schema)
+    prepared_large = filler.prepare_fields(large_fields, schema)
+
+    for document in documents:
+        def fill(i, prepared=prepared, document=document):
+            return filler.fill_document_from_path(document.open(), prepared.fields, prepared=prepared)
+
+        def fill_and_save(prepared=prepared, document=document):
+            buffer = io.BytesIO()
+            fill(0, prepared, document).save(buffer)
+            return buffer
+
+        filled = fill(0)
+        save = timed(lambda i: filled.save(io.BytesIO()), args.repeat)
+        large_buffer = io.BytesIO()
+        fill(0, prepared_large).save(large_buffer)
+        results["documents"][document.id] = {
+            "fill": timed(fill, args.repeat),
+            "fill_large_payload": timed(lambda i: fill(i, prepared_large), args.repeat),
+            "save": save,
+            "template_bytes": len(document.read_bytes()),
+            "docx_bytes": len(fill_and_save().getvalue()),
+            "docx_bytes_large_payload": len(large_buffer.getvalue()),
+            "allocations": measure_allocations(fill_and_save),
+        }
+    return results
+
+
+# --- convert --------------------------------------------------------------------
+
+def soffice_available(generator: PDFGenerator) -> bool:
+    executable = generator._get_libreoffice_executable()
+    return bool(shutil.which(executable) or os.path.exists(executable))
+
+
+async def _convert_batch(generator: PDFGenerator, docx_paths: List[str], out_dir: str, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def convert(index: int, path: str):
+        async with semaphore:
+            await generator.convert_to_pdf(path, f"bench_{concurrency}_{index}", out_dir)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(convert(i, p) for i, p in enumerate(docx_paths)))
+    return time.perf_counter() - start
+
+
+def bench_convert(args) -> Dict[str, Any]:
+    generator = PDFGenerator()
+    if not soffice_available(generator):
+        return {"skipped": "soffice não encontrado (defina LIBREOFFICE_PATH, ex.: benchmarks/fake_soffice.py)"}
+
+    documents = TemplateService.get_template(args.template).documents
+    filler = DocumentFiller()
+    schema, _ = TemplateService.get_template_schema(args.template)
+    prepared = filler.prepare_fields(build_sample_fields(), schema)
+
+    results: Dict[str, Any] = {"executable": os.path.basename(generator._get_libreoffice_executable()), "levels": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        docx_paths = []
+        for i in range(args.convert_docs):
+            document = documents[i % len(documents)]
+            path = os.path.join(tmp, f"doc_{i}.docx")
+            filler.fill_document_from_path(document.open(), prepared.fields, prepared=prepared).save(path)
+            docx_paths.append(path)
+
+        for level in args.concurrency:
+            out_dir = os.path.join(tmp, f"out_{level}")
+            elapsed = asyncio.run(_convert_batch(generator, docx_paths, out_dir, level))
+            results["levels"][str(level)] = {
+                "documents": len(docx_paths),
+                "wall_ms": round(elapsed * 1000, 1),
+                "documents_per_second": round(len(docx_paths) / elapsed, 3),
+            }
+    return results
+
+
+# --- merge ----------------------------------------------------------------------
+
+def _write_blank_pdf(path: str, pages: int) -> None:
+    from PyPDF2 import PdfWriter
+
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=595, height=842)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def bench_merge(args) -> Dict[str, Any]:
+    if not PDFMerger.is_merge_available():
+        return {"skipped": "nenhuma ferramenta de merge disponível (pdfunite, pdftk ou gs)"}
+
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in (2, 5, 10):
+            inputs = []
+            for i in range(count):
+                path = os.path.join(tmp, f"in_{count}_{i}.pdf")
+                _write_blank_pdf(path, args.merge_pages)
+                inputs.append(path)
+            output = os.path.join(tmp, f"merged_{count}.pdf")
+            stats = timed(lambda i: PDFMerger.merge_pdfs(inputs, output), max(3, args.repeat // 5))
+            stats["output_bytes"] = os.path.getsize(output)
+            results[f"{count}_files"] = stats
+    return results
+
+
+# --- analyze --------------------------------------------------------------------
+
+@contextlib.contextmanager
+def _analyzer_env(**overrides: str):
+    """Variáveis OPENAI_* do AIAnalyzer durante um cenário (restauradas na saída)"""
+    previous = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _analysis_input(placeholders: int):
+    text = " ".join(f"Cláusula {i}: o valor de {{{{CAMPO_{i}}}}} fica acordado." for i in range(placeholders))
+    return text, [{"text": f"{{{{CAMPO_{i}}}}}", "context": f"Cláusula {i}"} for i in range(placeholders)]
+
+
+def _run_analyses(base_url: str, analyses: int, **env: str) -> Dict[str, Any]:
+    """analyses chamadas simultâneas de analyze_fields; os logs do AIAnalyzer são descartados"""
+    from app.services.ai_analyzer import AIAnalyzer
+
+    text, placeholders = _analysis_input(5)
+
+    async def run():
+        analyzer = AIAnalyzer()
+        return await asyncio.gather(*(analyzer.analyze_fields(text, placeholders) for _ in range(analyses)))
+
+    analyzer_logger = logging.getLogger("app.services.ai_analyzer")
+    previous_level = analyzer_logger.level
+    analyzer_logger.setLevel(logging.CRITICAL)  # timeouts e fallbacks são esperados aqui
+    try:
+        with _analyzer_env(OPENAI_BASE_URL=base_url, **env):
+            start = time.perf_counter()
+            results = asyncio.run(run())
+            elapsed = time.perf_counter() - start
+    finally:
+        analyzer_logger.setLevel(previous_level)
+    return {
+        "analyses": analyses,
+        "wall_ms": round(elapsed * 1000, 1),
+        "analyses_per_second": round(analyses / elapsed, 2),
+        "fallbacks": sum(1 for fields in results if AIAnalyzer.is_fallback(fields)),
+    }
+
+
+def bench_analyze(args) -> Dict[str, Any]:
+    from scripts.openai_stub_server import serve_in_thread
+
+    analyses = args.analyze_requests
+    results: Dict[str, Any] = {"latency_ms": args.analyze_latency_ms, "concurrency": {}}
+
+    # Vazão por limite de concorrência; o stub confere que o limite é respeitado
+    for level in args.concurrency:
+        with serve_in_thread(latency_ms=args.analyze_latency_ms) as (base_url, stub):
+            stats = _run_analyses(base_url, analyses, OPENAI_MAX_CONCURRENCY=str(level))
+        stats["max_in_flight"] = stub["max_in_flight"]
+        stats["within_limit"] = stub["max_in_flight"] <= level
+        results["concurrency"][str(level)] = stats
+
+    # 429 a cada 3 requisições (Retry-After 0.1s): todas as análises devem
+    # terminar com a resposta da IA, não com o fallback
+    with serve_in_thread(latency_ms=args.analyze_latency_ms, rate_limit_every=3) as (base_url, stub):
+        stats = _run_analyses(base_url, analyses, OPENAI_MAX_CONCURRENCY="4", OPENAI_MAX_RETRIES="6")
+    stats.update(requests=stub["requests"], rate_limited=stub["rate_limited"])
+    results["rate_limited"] = stats
+
+    # Resposta mais lenta que OPENAI_TIMEOUT: cada análise tenta 1 + retries
+    # vezes e termina no fallback, sem passar muito de (1 + retries) timeouts
+    timeout, retries = 0.2, 1
+    with serve_in_thread(latency_ms=timeout * 1000 * 5) as (base_url, stub):
+        stats = _run_analyses(
+            base_url, 2,
+            OPENAI_MAX_CONCURRENCY="4", OPENAI_TIMEOUT=str(timeout),
+            OPENAI_MAX_RETRIES=str(retries), OPENAI_BACKOFF_BASE="0.05",
+        )
+    stats.update(requests=stub["requests"], timeout_ms=timeout * 1000, retries=retries)
+    results["timeout"] = stats
+    return results
+
+
+RUNNERS = {
+    "validate": bench_validate,
+    "fill": bench_fill,
+    "convert": bench_convert,
+    "merge": bench_merge,
+    "analyze": bench_analyze,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do preenchimento de contratos")
+    parser.add_argument("--only", default=",".join(BENCHMARKS),
+                        help=f"benchmarks separados por vírgula ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--template", default="rota_do_sol")
+    parser.add_argument("--repeat", type=int, default=20, help="repetições por medição")
+    parser.add_argument("--bulk-rows", type=int, default=20000, help="linhas da validação em lote")
+    parser.add_argument("--convert-docs", type=int, default=8, help="documentos por nível de concorrência")
+    parser.add_argument("--concurrency", default="1,2,4",
+                        help="níveis de concorrência da conversão e de OPENAI_MAX_CONCURRENCY")
+    parser.add_argument("--merge-pages", type=int, default=5, help="páginas por PDF de entrada no merge")
+    parser.add_argument("--analyze-requests", type=int, default=16, help="análises simultâneas por cenário")
+    parser.add_argument("--analyze-latency-ms", type=float, default=100, help="latência do stub da OpenAI")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: benchmarks/results/)")
+    args = parser.parse_args(argv)
+    args.only = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = set(args.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"benchmarks desconhecidos: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    commit = git_commit()
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "template": args.template,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    for name in args.only:
+        print(f"[bench] {name}...", flush=True)
+        start = time.perf_counter()
+        report["results"][name] = RUNNERS[name](args)
+        print(f"[bench] {name} concluído em {time.perf_counter() - start:.1f}s", flush=True)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}_{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"[bench] Resultados em {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
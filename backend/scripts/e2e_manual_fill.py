@@ -1,133 +1,332 @@
 """
-Teste manual E2E: monta payload de exemplo, choca POST /api/fill e valida .docx.
-Executar com o backend já em execução (uvicorn) ou com TestClient.
+Teste E2E do preenchimento: regressão de conteúdo e orçamento de latência.
+
+Roda a aplicação no mesmo processo (FastAPI TestClient), sem servidor em
+execução, e falha (código de saída 1) se qualquer verificação falhar:
+
+    - POST /api/fill com um payload completo (benchmarks/payloads.py) gera
+      todos os documentos do template, em DOCX e PDF;
+    - nenhum {{CAMPO}} sobra nos XML de word/ (placeholder_scanner, que
+      também encontra placeholders quebrados entre runs);
+    - os valores de STATIC_PARTIES aparecem no Quadro Resumo;
+    - placeholders em tabelas aninhadas e dentro de hyperlinks (quebrados
+      em runs) são preenchidos, e unresolved_fields confere com o que sobra
+      no DOCX gerado;
+    - o texto de cada documento confere com o arquivo golden em
+      scripts/golden/<template>/<documento>.txt (diff unificado na falha);
+    - um payload inválido é rejeitado com 422;
+    - validate_columns (lote) e validate_fields (por valor) dão o mesmo
+      resultado, inclusive para valores com caracteres não ASCII;
+    - a duração média de cada estágio (contract_fill_stage_seconds, medida
+      em --repeat preenchimentos após o aquecimento) fica dentro do orçamento.
+
+Sem LIBREOFFICE_PATH, a conversão usa benchmarks/fake_soffice.py (sem
+atraso); com --real-soffice, usa o soffice do PATH.
+
+    cd backend
+    python scripts/e2e_manual_fill.py
+    python scripts/e2e_manual_fill.py --repeat 5 --budget soffice=20000
+    python scripts/e2e_manual_fill.py --update-golden   # após mudança intencional no template
 """
-import json
-import re
+import argparse
+import difflib
+import io
+import os
 import sys
+import tempfile
 import zipfile
 from pathlib import Path
+from typing import Dict, List
 
-# Garantir import do app
+from lxml import etree
+
+# Garantir import do app e dos benchmarks
 BACKEND_ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(BACKEND_ROOT))
 
-from app.services.contract_schema import ROTA_DO_SOL_SCHEMA, FieldType  # noqa: E402
-from app.config.parties import STATIC_PARTIES  # noqa: E402
-
-
-def build_sample_fields() -> dict:
-    out = {}
-    for fid, fd in ROTA_DO_SOL_SCHEMA.items():
-        t = fd.type
-        # field_validator infere "número" pelo campo_id (ex.: *NUMERO*), não só pelo tipo do schema
-        if "numero" in fid.lower() and fid not in ("COMPRADOR_PF_TELEFONE_NUMERO",):
-            out[fid] = "42"
-        elif t == FieldType.CPF:
-            out[fid] = "529.982.247-25"
-        elif t == FieldType.CNPJ:
-            out[fid] = "12.345.678/0001-90"
-        elif t == FieldType.CURRENCY:
-            out[fid] = "123456.78"
-        elif t == FieldType.DATE:
-            out[fid] = "2026-04-15"
-        elif t == FieldType.NUMBER:
-            out[fid] = 10
-        elif t == FieldType.EMAIL:
-            out[fid] = "comprador.exemplo@email.com"
-        elif t == FieldType.PHONE:
-            out[fid] = "987654321"
-        elif t == FieldType.SELECT:
-            out[fid] = (fd.options or ["ok"])[0]
-        elif t == FieldType.TEXTAREA:
-            out[fid] = "Confrontações de exemplo: norte com Rua A, sul com lote 02."
-        else:
-            out[fid] = f"Texto_{fid[-12:]}"
-    # Ajustes legíveis
-    out["COMPRADOR_PF_NOME"] = "João Carlos Teste Silva"
-    out["ASSINATURA_COMPRADOR_NOME"] = "João Carlos Teste Silva"
-    out["PRECO_TOTAL_EXTENSO"] = "trezentos mil reais"
-    out["COMISSAO_TOTAL_EXTENSO"] = "quinze mil reais"
-    out["BEM_VALOR_TOTAL_EXTENSO"] = "duzentos mil reais"
-    out["BEM_ENTRADA_VALOR_TOTAL_EXTENSO"] = "cinquenta mil reais"
-    out["BEM_ENTRADA_PARCELAS_QTD_EXTENSO"] = "cinco"
-    out["BEM_ENTRADA_PARCELA_VALOR_EXTENSO"] = "dez mil reais"
-    out["PARCELAS_VALOR_TOTAL_EXTENSO"] = "cento e cinquenta mil reais"
-    out["PARCELAS_QUANTIDADE_EXTENSO"] = "sessenta"
-    out["PARCELAS_VALOR_UNITARIO_EXTENSO"] = "dois mil e quinhentos reais"
-    out["ASSINATURA_DATA_MES"] = "abril"
-    out["IMOBILIARIA_NOME"] = "Imobiliária Exemplo Ltda"
-    return out
-
-
-def placeholders_left(docx_path: Path) -> set[str]:
-    z = zipfile.ZipFile(docx_path)
-    found = set()
-    for n in z.namelist():
-        if not n.startswith("word/") or not n.endswith(".xml"):
-            continue
-        data = z.read(n).decode("utf-8", errors="ignore")
-        for m in re.findall(r"\{\{([A-Z0-9_]+)\}\}", data):
-            found.add(m)
-    return found
-
-
-def main():
-    import urllib.request
-
-    base = "http://127.0.0.1:8000"
-    payload = {
-        "template_id": "rota_do_sol",
-        "fields": build_sample_fields(),
-        "buyer_type": "PF",
-    }
-    body = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        f"{base}/api/fill",
-        data=body,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    print("POST /api/fill ...")
-    try:
-        with urllib.request.urlopen(req, timeout=300) as resp:
-            data = json.loads(resp.read().decode())
-    except Exception as e:
-        print("ERRO na requisição:", e)
-        sys.exit(1)
-
-    print(json.dumps(data, indent=2, ensure_ascii=False))
-    docs = data.get("documents") or []
-    out_dir = BACKEND_ROOT / "output"
-    print("\n--- Validação dos .docx em", out_dir.resolve())
-
-    for doc in docs:
-        did = doc["download_id"]
-        p = out_dir / f"{did}.docx"
-        print(f"\n>> {doc['name']} ({doc['id']})")
-        print(f"   Arquivo: {p.resolve()}")
-        print(f"   Existe: {p.exists()}")
-        if not p.exists():
-            continue
-        left = placeholders_left(p)
-        print(f"   Placeholders {{...}} restantes: {len(left)}")
-        if left:
-            print("   ", sorted(left))
-        # VENDEDOR só no quadro resumo
-        if doc["id"] == "quadro_resumo":
-            xml = zipfile.ZipFile(p).read("word/document.xml").decode("utf-8", errors="ignore")
-            for k, v in STATIC_PARTIES.items():
-                ok = v in xml or v.replace(".", "") in xml
-                print(f"   STATIC {k} presente no XML: {ok} ({v[:20]}...)")
-
-    print("\n--- Condições gerais (só ASSINATURA_COMPRADOR_NOME)")
-    cg = next((d for d in docs if d["id"] == "condicoes_gerais"), None)
-    if cg:
-        p = out_dir / f"{cg['download_id']}.docx"
-        if p.exists():
-            left = placeholders_left(p)
-            print(f"   Placeholders restantes: {left}")
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+FAKE_SOFFICE = BACKEND_ROOT / "benchmarks" / "fake_soffice.py"
+TEMPLATE_ID = "rota_do_sol"
+
+# Orçamento (ms) da duração média por estágio, com folga para máquinas de CI.
+# soffice/total incluem a conversão: com o soffice real, ajustar com --budget.
+STAGE_BUDGETS_MS: Dict[str, float] = {
+    "prepare": 50,
+    "verify": 10,
+    "validate": 30,
+    "format": 30,
+    "template_load": 300,
+    "buyer_section": 100,
+    "substitution": 300,
+    "layout_fixes": 100,
+    "docx_save": 300,
+    "docx_copy": 100,
+    "soffice": 5000,
+    "pdf_rename": 20,  # só localizar/renomear o PDF: nada de esperas fixas
+    "publish": 200,
+    "render_document": 6000,
+    "total": 12000,
+}
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_W_P = f"{{{W_NS}}}p"
+_W_T = f"{{{W_NS}}}t"
+
+
+def configure_environment(args) -> str:
+    """Diretórios isolados e soffice falso, antes de importar a aplicação"""
+    work_dir = tempfile.mkdtemp(prefix="lalu-e2e-")
+    os.environ["TEMP_DIR"] = os.path.join(work_dir, "temp")
+    os.environ["STORAGE_ROOT"] = work_dir
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    if not args.real_soffice and not os.getenv("LIBREOFFICE_PATH"):
+        os.environ["LIBREOFFICE_PATH"] = str(FAKE_SOFFICE)
+        os.environ.setdefault("FAKE_SOFFICE_DELAY_MS", "0")
+    return work_dir
+
+
+def docx_text(docx_bytes: bytes) -> str:
+    """Texto do word/document.xml, um parágrafo (não vazio) por linha"""
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as z:
+        root = etree.fromstring(z.read("word/document.xml"))
+    lines = []
+    for paragraph in root.iter(_W_P):
+        text = "".join(t.text or "" for t in paragraph.iter(_W_T)).strip()
+        if text:
+            lines.append(text)
+    return "\n".join(lines) + "\n"
+
+
+def placeholders_left(docx_bytes: bytes) -> List[str]:
+    from app.services.placeholder_scanner import scan_placeholders
+
+    return sorted({p.field_id for p in scan_placeholders(docx_bytes)})
+
+
+def build_container_docx() -> bytes:
+    """
+    DOCX com placeholders fora dos parágrafos/células de nível superior:
+    numa tabela aninhada (com um campo sem valor) e num hyperlink, quebrado
+    em dois runs
+    """
+    from docx import Document
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    document = Document()
+    inner = document.add_table(rows=1, cols=1).cell(0, 0).add_table(rows=2, cols=1)
+    inner.cell(0, 0).paragraphs[0].add_run("Nome: {{COMPRADOR_PF_NOME}}")
+    inner.cell(1, 0).paragraphs[0].add_run("Sem valor: {{CAMPO_SEM_VALOR}}")
+
+    paragraph = document.add_paragraph("CPF: ")
+    hyperlink = OxmlElement("w:hyperlink")
+    hyperlink.set(qn("w:anchor"), "cpf")
+    for text in ("{{COMPRADOR_PF_", "CPF}} (ver anexo)"):
+        run = OxmlElement("w:r")
+        t = OxmlElement("w:t")
+        t.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+        t.text = text
+        run.append(t)
+        hyperlink.append(run)
+    paragraph._p.append(hyperlink)
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+class E2ERun:
+    """Executa as verificações e acumula as falhas"""
+
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.failures: List[str] = []
+
+    def check(self, ok: bool, message: str) -> bool:
+        print(f"   {'OK  ' if ok else 'FALHA'} {message}")
+        if not ok:
+            self.failures.append(message)
+        return ok
+
+    def fill(self, fields: Dict):
+        return self.client.post("/api/fill", json={"template_id": TEMPLATE_ID, "fields": fields})
+
+    def download(self, download_id: str, fmt: str):
+        return self.client.get(f"/api/download/{download_id}", params={"format": fmt})
+
+    def check_documents(self, documents: List[Dict]) -> None:
+        from app.config.parties import STATIC_PARTIES
+        from app.services.template_service import TemplateService
+
+        expected = [d["id"] for d in TemplateService.get_template_documents(TEMPLATE_ID)]
+        self.check([d["id"] for d in documents] == expected, f"documentos gerados: {expected}")
+
+        for doc in documents:
+            print(f"\n>> {doc['name']} ({doc['id']})")
+            unresolved = doc.get("unresolved_fields")
+            self.check(not unresolved, f"nenhum campo sem valor reportado{f' ({unresolved})' if unresolved else ''}")
+            pdf = self.download(doc["download_id"], "pdf")
+            self.check(pdf.status_code == 200 and pdf.content.startswith(b"%PDF"), "PDF disponível para download")
+            response = self.download(doc["download_id"], "docx")
+            if not self.check(response.status_code == 200, "DOCX disponível para download"):
+                continue
+
+            left = placeholders_left(response.content)
+            self.check(not left, f"nenhum placeholder restante{f' (restam: {left})' if left else ''}")
+
+            text = docx_text(response.content)
+            if doc["id"] == "quadro_resumo":
+                for key, value in STATIC_PARTIES.items():
+                    self.check(value in text, f"STATIC_PARTIES {key} presente ({value})")
+            self.check_golden(doc["id"], text)
+
+    def check_containers(self) -> None:
+        """unresolved_placeholders e o preenchimento enxergam os mesmos contêineres"""
+        from app.services.contract_renderer import build_fields_to_fill
+        from app.services.document_filler import DocumentFiller
+        from app.services.template_registry import scan_docx_placeholder_parts
+        from app.services.template_service import TemplateService
+        from benchmarks.payloads import build_sample_fields
+
+        template = build_container_docx()
+        filler = DocumentFiller()
+        schema, _ = TemplateService.get_template_schema(TEMPLATE_ID)
+        prepared = filler.prepare_fields(build_fields_to_fill(build_sample_fields(0)), schema)
+        unresolved = filler.unresolved_placeholders(scan_docx_placeholder_parts(template), prepared)
+
+        buffer = io.BytesIO()
+        filler.fill_document_from_path(io.BytesIO(template), prepared.fields, prepared=prepared).save(buffer)
+        filled = buffer.getvalue()
+        left = placeholders_left(filled)
+        self.check(left == ["CAMPO_SEM_VALOR"], f"tabela aninhada e hyperlink preenchidos (restam: {left})")
+        self.check(unresolved == left, f"unresolved_fields confere com o DOCX gerado ({unresolved})")
+
+        with zipfile.ZipFile(io.BytesIO(filled)) as z:
+            root = etree.fromstring(z.read("word/document.xml"))
+        link_text = "".join(t.text or "" for link in root.iter(f"{{{W_NS}}}hyperlink") for t in link.iter(_W_T))
+        cpf = prepared.formatted.get("COMPRADOR_PF_CPF", "")
+        self.check(link_text == f"{cpf} (ver anexo)", f"valor continua dentro do hyperlink ({link_text!r})")
+
+    def check_bulk_validation(self) -> None:
+        """A validação por coluna concorda com a validação por valor"""
+        from app.services.field_validator import FieldValidationError, FieldValidator
+
+        columns = {
+            "COMPRADOR_PF_CPF": ["529.982.247-25", "529.982.247-24", "ççç", "—", "   ", "٥٢٩٩٨٢٢٤٧٢٥"],
+            "COMPRADOR_PF_CEP": ["01310-100", "—", "ç0131010", "ç01310100"],
+        }
+        validator = FieldValidator()
+        results = validator.validate_columns(columns)
+        for field_id, values in columns.items():
+            for index, value in enumerate(values):
+                try:
+                    validator.validate_fields({field_id: value})
+                    expected = None
+                except FieldValidationError as e:
+                    expected = e.errors.get(field_id)
+                got = results[field_id].errors.get(index)
+                self.check(got == expected, f"{field_id}={value!r}: lote {got!r}, por valor {expected!r}")
+
+    def check_golden(self, doc_id: str, text: str) -> None:
+        golden = GOLDEN_DIR / TEMPLATE_ID / f"{doc_id}.txt"
+        if self.args.update_golden:
+            golden.parent.mkdir(parents=True, exist_ok=True)
+            golden.write_text(text, encoding="utf-8")
+            print(f"   golden atualizado: {golden.relative_to(BACKEND_ROOT)}")
+            return
+        if not golden.exists():
+            self.check(False, f"golden ausente: {golden.relative_to(BACKEND_ROOT)} (gerar com --update-golden)")
+            return
+        expected = golden.read_text(encoding="utf-8")
+        if self.check(text == expected, f"texto igual ao golden {golden.name}"):
+            return
+        diff = difflib.unified_diff(
+            expected.splitlines(), text.splitlines(), "golden", "gerado", lineterm="", n=1,
+        )
+        for line in list(diff)[:40]:
+            print(f"      {line}")
+
+    def check_budgets(self, budgets: Dict[str, float]) -> None:
+        from app.services.metrics import FILL_STAGE_SECONDS
+        from benchmarks.payloads import build_sample_fields
+
+        # O aquecimento (template frio, imports) já aconteceu no primeiro fill
+        before = {stage: (FILL_STAGE_SECONDS.count(stage=stage), FILL_STAGE_SECONDS.sum(stage=stage))
+                  for stage in budgets}
+        for i in range(self.args.repeat):
+            response = self.fill(build_sample_fields(i + 1))
+            if not self.check(response.status_code == 200, f"preenchimento {i + 1}/{self.args.repeat}"):
+                return
+
+        print(f"\n   {'estágio':16s} {'média':>10s} {'orçamento':>10s}")
+        for stage, budget in budgets.items():
+            count_before, sum_before = before[stage]
+            count = FILL_STAGE_SECONDS.count(stage=stage) - count_before
+            if count == 0:
+                print(f"   {stage:16s} {'-':>10s} {budget:>8.0f}ms  (sem observações)")
+                continue
+            mean_ms = (FILL_STAGE_SECONDS.sum(stage=stage) - sum_before) / count * 1000
+            self.check(mean_ms <= budget, f"{stage:16s} {mean_ms:8.1f}ms {budget:>8.0f}ms")
+
+    def run(self) -> int:
+        from benchmarks.payloads import build_invalid_fields, build_sample_fields
+
+        print(f"POST /api/fill ({TEMPLATE_ID}) ...")
+        response = self.fill(build_sample_fields(0))
+        if not self.check(response.status_code == 200, f"status 200 (recebido {response.status_code})"):
+            print(response.text[:2000])
+            return 1
+        self.check_documents(response.json().get("documents") or [])
+
+        print("\n>> Placeholders em tabela aninhada e hyperlink")
+        self.check_containers()
+
+        print("\n>> Validação em lote x por valor")
+        self.check_bulk_validation()
+
+        print("\n>> Payload inválido")
+        response = self.fill(build_invalid_fields(0))
+        self.check(response.status_code == 422, f"rejeitado com 422 (recebido {response.status_code})")
+
+        if self.args.repeat > 0:
+            print(f"\n>> Orçamento de latência ({self.args.repeat} preenchimentos)")
+            budgets = dict(STAGE_BUDGETS_MS)
+            for item in self.args.budget:
+                stage, _, value = item.partition("=")
+                budgets[stage] = float(value)
+            self.check_budgets(budgets)
+
+        if self.failures:
+            print(f"\n{len(self.failures)} verificação(ões) falharam:")
+            for failure in self.failures:
+                print(f" - {failure}")
+            return 1
+        print("\nTodas as verificações passaram")
+        return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Teste E2E do /api/fill (conteúdo e latência)")
+    parser.add_argument("--repeat", type=int, default=3, help="preenchimentos medidos no orçamento (0 desliga)")
+    parser.add_argument("--budget", action="append", default=[], metavar="ESTÁGIO=MS",
+                        help="sobrescreve o orçamento de um estágio (pode repetir)")
+    parser.add_argument("--update-golden", action="store_true", help="regrava os arquivos golden")
+    parser.add_argument("--real-soffice", action="store_true", help="usar o soffice real em vez do falso")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    work_dir = configure_environment(args)
+    print(f"Arquivos em {work_dir}; soffice: {os.getenv('LIBREOFFICE_PATH') or 'PATH'}")
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        return E2ERun(client, args).run()
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+Servidor local compatível com a API de chat completions da OpenAI
+
+Usado em testes e benchmarks da análise com IA, sem rede e sem custo:
+
+    python scripts/openai_stub_server.py --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 uvicorn app.main:app
+
+Responde de forma determinística: para cada placeholder listado em
+"CAMPOS IDENTIFICADOS" do prompt do AIAnalyzer, devolve um campo de texto
+com field_id/label derivados do nome do placeholder.
+
+Opções (linha de comando ou variáveis de ambiente):
+- --latency-ms / STUB_LATENCY_MS: atraso simulado de cada resposta
+- --rate-limit-every / STUB_RATE_LIMIT_EVERY: responde 429 (com Retry-After)
+  a cada N requisições, para exercitar o backoff do cliente
+
+GET /v1/stats devolve as requisições recebidas e o máximo simultâneo (usado
+pelo benchmark "analyze" em benchmarks/run.py, que sobe o stub com
+serve_in_thread).
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+_FIELDS_BLOCK_RE = re.compile(r"CAMPOS IDENTIFICADOS:\s*(\[.*?\])\s*\n\s*\n", re.DOTALL)
+_PLACEHOLDER_NAME_RE = re.compile(r"\{\{([A-Z0-9_]+)\}\}")
+
+
+def _stub_fields(prompt: str) -> list:
+    """Campos determinísticos a partir dos placeholders listados no prompt"""
+    match = _FIELDS_BLOCK_RE.search(prompt)
+    if not match:
+        return []
+    fields = []
+    for item in json.loads(match.group(1)):
+        text = item.get("text") or ""
+        name = _PLACEHOLDER_NAME_RE.search(text)
+        field_id = name.group(1) if name else f"field_{item.get('index', len(fields)) + 1}"
+        fields.append({
+            "field_id": field_id,
+            "label": field_id.replace("_", " ").capitalize(),
+            "type": "text",
+            "required": True,
+            "original_text": text,
+            "context": item.get("context", ""),
+            "section": field_id.split("_", 1)[0],
+        })
+    return fields
+
+
+def create_app(latency_ms: float = 0.0, rate_limit_every: int = 0) -> FastAPI:
+    app = FastAPI(title="OpenAI stub")
+    state = {"requests": 0, "rate_limited": 0, "in_flight": 0, "max_in_flight": 0}
+    app.state.stub = state
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        state["requests"] += 1
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        try:
+            return await _complete(request)
+        finally:
+            state["in_flight"] -= 1
+
+    async def _complete(request: Request):
+        if rate_limit_every and state["requests"] % rate_limit_every == 0:
+            state["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": "0.1"},
+                content={"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error",
+                                   "code": "rate_limit_exceeded"}},
+            )
+        body = await request.json()
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        prompt = "\n".join(m.get("content") or "" for m in body.get("messages", []) if m.get("role") == "user")
+        content = json.dumps({"fields": _stub_fields(prompt)}, ensure_ascii=False)
+        return {
+            "id": f"chatcmpl-stub-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        }
+
+    @app.get("/v1/stats")
+    async def stats():
+        return state
+
+    return app
+
+
+@contextmanager
+def serve_in_thread(latency_ms: float = 0.0, rate_limit_every: int = 0, host: str = "127.0.0.1"):
+    """
+    Sobe o stub em uma thread, numa porta livre, e devolve (base_url, state);
+    o servidor é encerrado na saída do bloco
+    """
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        port = sock.getsockname()[1]
+    app = create_app(latency_ms, rate_limit_every)
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="openai-stub", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError("OpenAI stub não iniciou")
+        time.sleep(0.01)
+    try:
+        yield f"http://{host}:{port}/v1", app.state.stub
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub local da API da OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=float(os.getenv("STUB_LATENCY_MS", "0")))
+    parser.add_argument("--rate-limit-every", type=int, default=int(os.getenv("STUB_RATE_LIMIT_EVERY", "0")))
+    args = parser.parse_args()
+
+    import uvicorn
+    print(f"OpenAI stub em http://{args.host}:{args.port}/v1 "
+          f"(latência {args.latency_ms:.0f} ms, 429 a cada {args.rate_limit_every or '-'} requisições)")
+    uvicorn.run(create_app(args.latency_ms, args.rate_limit_every), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,9 @@ from docx import Document
 from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
+from app.services.contract_schema import ROTA_DO_SOL_SCHEMA
+from app.services.placeholder_scanner import scan_placeholders
+
 def verify_and_fix_template():
     """Verifica e corrige o template DOCX"""
     template_path = Path(__file__).parent.parent / "templates" / "CONTRATO_ROTA_DO_SOL_TEMPLATE.docx"
@@ -19,6 +22,20 @@ def verify_and_fix_template():
         print(f"ERRO: Template não encontrado em {template_path}")
         return False
     
+    # Placeholders (varredura em streaming do XML, antes de carregar com python-docx)
+    placeholders = scan_placeholders(template_path)
+    field_ids = {p.field_id for p in placeholders}
+    print(f"Placeholders encontrados: {len(placeholders)} ocorrências, {len(field_ids)} campos")
+    for location in placeholders:
+        if location.split_across_runs:
+            print(f"AVISO: {location.original_text} quebrado nos runs {location.run_start}-{location.run_end} "
+                  f"({location.part}, parágrafo {location.paragraph})")
+    missing = sorted(set(ROTA_DO_SOL_SCHEMA) - field_ids)
+    if missing:
+        print(f"AVISO: Campos do schema ausentes no template: {missing}")
+    else:
+        print("OK: Todos os campos do schema estao no template")
+    
     print(f"Carregando template: {template_path}")
     doc = Document(str(template_path))
     